@@ -0,0 +1,349 @@
+# loadtest/run_load.py
+#
+# Drive /login, /signup, /dashboard (gmsso v1.2) and /instances,
+# /create_instance (ui-demo 06) at increasing concurrency and report
+# throughput and p50/p95/p99 latency for each step.
+#
+#   python loadtest/run_load.py                                  # everything, 1/4/16/64 clients
+#   python loadtest/run_load.py --scenarios login,dashboard --concurrency 8,32 --duration 20
+#   python loadtest/run_load.py --openstack-latency-ms 50        # slower cloud
+#   python loadtest/run_load.py --fleet 100000 --scenarios instances
+#   python loadtest/run_load.py --json results.json              # save for later comparison
+#   python loadtest/run_load.py --baseline results.json          # exit 1 on a regression
+#
+# The mock OpenStack API and both apps each run in their own process so the
+# apps' GIL is not shared with the load generator; the SMTP sink runs here.
+import argparse
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import smtp_sink  # noqa: E402
+from serve import USER_EMAIL, USER_PASSWORD  # noqa: E402
+
+DEFAULT_SCENARIOS = "login,signup,dashboard,instances,create_instance"
+
+
+# === Processes ===
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, proc, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"{' '.join(proc.args)} exited with {proc.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+
+class Stack:
+    """Mock OpenStack + SMTP sink + the two apps, torn down on exit."""
+
+    def __init__(self, args):
+        self.args = args
+        self.procs = []
+
+    def __enter__(self):
+        args = self.args
+        self.smtp = smtp_sink.serve()
+        os_port = free_port()
+        self.openstack = f"http://127.0.0.1:{os_port}"
+        sim_args = ["--port", str(os_port), "--latency-ms", str(args.openstack_latency_ms),
+                    "--servers", str(args.fleet), "--build-seconds", str(args.build_seconds)]
+        for rule in args.openstack_fail or []:
+            sim_args += ["--fail", rule]
+        mock = self.spawn("mock_openstack.py", *sim_args)
+        wait_until_up(f"{self.openstack}/identity", mock)
+
+        self.urls = {}
+        for app in ("gmsso", "ui-demo"):
+            port = free_port()
+            proc = self.spawn(
+                "serve.py", app, "--port", str(port), "--openstack", self.openstack,
+                "--smtp-port", str(self.smtp.server_address[1]), "--redis", args.redis, "--users", str(args.users),
+            )
+            self.urls[app] = f"http://127.0.0.1:{port}"
+            wait_until_up(self.urls[app] + "/", proc)
+        return self
+
+    def spawn(self, script, *argv):
+        out = None if self.args.verbose else subprocess.DEVNULL
+        proc = subprocess.Popen([sys.executable, os.path.join(HERE, script), *argv], stdout=out, stderr=out)
+        self.procs.append(proc)
+        return proc
+
+    def __exit__(self, *exc):
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self.smtp.shutdown()
+
+
+# === Scenarios ===
+# Each scenario has an optional per-client setup and a step that returns True
+# when the response is the one a successful request produces.
+class Scenario:
+    app = None
+
+    def __init__(self, stack):
+        self.base = stack.urls[self.app]
+        self.stack = stack
+
+    def setup(self, session, client_id):
+        pass
+
+    def step(self, session, client_id):
+        raise NotImplementedError
+
+
+def redirects_to(response, path):
+    return response.status_code == 302 and response.headers.get("Location", "").endswith(path)
+
+
+class Login(Scenario):
+    app = "gmsso"
+
+    def step(self, session, client_id):
+        session.cookies.clear()  # a fresh visitor each time: password check + new session
+        email = USER_EMAIL.format(client_id % self.stack.args.users)
+        r = session.post(f"{self.base}/login", data={"email": email, "password": USER_PASSWORD},
+                         allow_redirects=False)
+        return redirects_to(r, "/dashboard")
+
+
+class Signup(Scenario):
+    """Password hash, Keystone/Neutron provisioning and a queued confirmation email."""
+    app = "gmsso"
+
+    def step(self, session, client_id):
+        session.cookies.clear()
+        name = uuid.uuid4().hex[:12]
+        r = session.post(f"{self.base}/signup", data={
+            "username": name, "email": f"{name}@example.com",
+            "password": USER_PASSWORD, "confirm_password": USER_PASSWORD,
+        }, allow_redirects=False)
+        return redirects_to(r, "/login")
+
+
+class Dashboard(Scenario):
+    app = "gmsso"
+
+    def setup(self, session, client_id):
+        email = USER_EMAIL.format(client_id % self.stack.args.users)
+        session.post(f"{self.base}/login", data={"email": email, "password": USER_PASSWORD})
+
+    def step(self, session, client_id):
+        r = session.get(f"{self.base}/dashboard", allow_redirects=False)
+        return r.status_code == 200
+
+
+class Instances(Scenario):
+    app = "ui-demo"
+
+    def step(self, session, client_id):
+        r = session.get(f"{self.base}/instances", allow_redirects=False)
+        return r.status_code == 200
+
+
+class CreateInstance(Scenario):
+    """create_server + wait_for_server against the mock, then the redirect to /instances."""
+    app = "ui-demo"
+
+    def __init__(self, stack):
+        super().__init__(stack)
+        compute = f"{stack.openstack}/compute/v2.1"
+        self.image = requests.get(f"{compute}/images/detail").json()["images"][0]["id"]
+        self.flavor = requests.get(f"{compute}/flavors/detail").json()["flavors"][0]["id"]
+        self.network = requests.get(f"{stack.openstack}/network/v2.0/networks?name=private").json()["networks"][0]["id"]
+
+    def step(self, session, client_id):
+        r = session.post(f"{self.base}/create_instance", data={
+            "name": f"load-{uuid.uuid4().hex[:8]}", "image": self.image, "flavor": self.flavor,
+            "network": self.network, "keypair_name": "",
+        }, allow_redirects=False)
+        return redirects_to(r, "/instances")
+
+
+SCENARIOS = {
+    "login": Login,
+    "signup": Signup,
+    "dashboard": Dashboard,
+    "instances": Instances,
+    "create_instance": CreateInstance,
+}
+
+
+# === Measurement ===
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank: the smallest sample with at least pct% of samples at or below it
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def run_level(scenario, concurrency, duration, warmup):
+    """Run ``concurrency`` clients for ``duration`` seconds; latencies in ms."""
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    window = {}
+
+    def open_window():
+        # Runs once every client has finished setup, before any is released
+        now = time.perf_counter()
+        window["from"], window["until"] = now + warmup, now + warmup + duration
+
+    start_gate = threading.Barrier(concurrency, action=open_window)
+
+    def client(client_id):
+        session = requests.Session()
+        scenario.setup(session, client_id)
+        start_gate.wait()
+        measure_from, deadline = window["from"], window["until"]
+        while True:
+            started = time.perf_counter()
+            if started >= deadline:
+                break
+            try:
+                ok = scenario.step(session, client_id)
+            except requests.RequestException:
+                ok = False
+            if started < measure_from:
+                continue  # warm-up: connections, caches, first Keystone token
+            latencies[client_id].append((time.perf_counter() - started) * 1000)
+            if not ok:
+                errors[client_id] += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(client, i) for i in range(concurrency)]
+        for future in futures:
+            future.result()
+
+    samples = sorted(v for per_client in latencies for v in per_client)
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": sum(errors),
+        "rps": round(len(samples) / duration, 1),
+        "p50_ms": round(percentile(samples, 50), 1),
+        "p95_ms": round(percentile(samples, 95), 1),
+        "p99_ms": round(percentile(samples, 99), 1),
+    }
+
+
+def print_table(results):
+    print(f"{'scenario':<16}{'clients':>8}{'requests':>10}{'errors':>8}{'req/s':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, levels in results.items():
+        for row in levels:
+            print(f"{name:<16}{row['concurrency']:>8}{row['requests']:>10}{row['errors']:>8}{row['rps']:>9}"
+                  f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}")
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a previous ``--json`` file: p95 up or req/s down by more than ``tolerance``."""
+    regressions = []
+    for name, levels in results.items():
+        previous = {row["concurrency"]: row for row in baseline.get("results", {}).get(name, [])}
+        for row in levels:
+            before = previous.get(row["concurrency"])
+            if not before:
+                continue
+            if before["p95_ms"] and row["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{name} x{row['concurrency']}: p95 {before['p95_ms']} -> {row['p95_ms']} ms")
+            if before["rps"] and row["rps"] < before["rps"] * (1 - tolerance):
+                regressions.append(f"{name} x{row['concurrency']}: req/s {before['rps']} -> {row['rps']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Flask apps against local stand-ins")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS, help=f"comma separated ({DEFAULT_SCENARIOS})")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="client counts to step through")
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each level")
+    parser.add_argument("--openstack-latency-ms", type=float, default=20, help="delay the mock adds to every call")
+    parser.add_argument("--fleet", type=int, default=0, help="servers the simulated cloud starts with")
+    parser.add_argument("--build-seconds", type=float, default=0, help="time a new server spends in BUILD")
+    parser.add_argument("--openstack-fail", action="append", metavar="KEY=RATE[:STATUS]",
+                        help="inject OpenStack errors, e.g. compute.POST=0.05 (see mock_openstack.py --fail)")
+    parser.add_argument("--redis", default="fake", help="'fake' for fakeredis, else a Redis host")
+    parser.add_argument("--users", type=int, default=200, help="seeded accounts for login/dashboard")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed regression (0.10 = 10%%)")
+    parser.add_argument("--verbose", action="store_true", help="show the servers' output")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    results = {}
+    with Stack(args) as stack:
+        for name in names:
+            scenario = SCENARIOS[name](stack)
+            results[name] = []
+            for concurrency in levels:
+                row = run_level(scenario, concurrency, args.duration, args.warmup)
+                results[name].append(row)
+                print(f"{name} x{concurrency}: {row['rps']} req/s, p95 {row['p95_ms']} ms, {row['errors']} errors",
+                      flush=True)
+        mails = stack.smtp.received
+
+    print()
+    print_table(results)
+    print(f"\nConfirmation emails delivered to the SMTP sink: {mails}")
+
+    report = {
+        "config": {
+            "duration": args.duration, "warmup": args.warmup, "redis": args.redis,
+            "openstack_latency_ms": args.openstack_latency_ms, "fleet": args.fleet,
+            "build_seconds": args.build_seconds, "openstack_fail": args.openstack_fail,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n❌ Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\n✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
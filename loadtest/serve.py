@@ -0,0 +1,120 @@
+# loadtest/serve.py
+#
+# Run one of the Flask apps against the load-test stand-ins: fakeredis (or a
+# real Redis), in-memory SQLite, the mock OpenStack API and the SMTP sink.
+#
+#   python loadtest/serve.py gmsso   --port 5001 --openstack http://127.0.0.1:8774 --smtp-port 2525
+#   python loadtest/serve.py ui-demo --port 5002 --openstack http://127.0.0.1:8774
+#
+# The app is served by werkzeug's threaded server, like `app.run()`, without
+# the debugger or reloader.
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = {
+    "gmsso": os.path.join(ROOT, "openstack-flask-gmsso-redis-v1.2"),
+    "ui-demo": os.path.join(ROOT, "openstack-flask-ui-demo", "openstack-flask-06-upui-key-stop-ok"),
+}
+
+# Seeded, confirmed accounts for the /login and /dashboard scenarios
+USER_EMAIL = "load{}@example.com"
+USER_PASSWORD = "Load@12345"
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_openstack import clouds_yaml  # noqa: E402
+
+
+def use_fakeredis():
+    """Point every ``redis.Redis``/``StrictRedis`` the app creates at one in-process fakeredis server."""
+    import fakeredis
+    import redis
+
+    server = fakeredis.FakeServer()
+
+    class _FakeRedis(fakeredis.FakeStrictRedis):
+        def __init__(self, *args, **kwargs):
+            kwargs.pop("host", None)
+            kwargs.pop("port", None)
+            kwargs["server"] = server
+            super().__init__(*args, **kwargs)
+
+    redis.Redis = redis.StrictRedis = _FakeRedis
+
+
+def configure_env(args, workdir):
+    clouds = os.path.join(workdir, "clouds.yaml")
+    with open(clouds, "w") as f:
+        f.write(clouds_yaml(args.openstack))
+    os.environ["OS_CLIENT_CONFIG_FILE"] = clouds
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    os.environ.setdefault("MAIL_SERVER", "127.0.0.1")
+    os.environ.setdefault("MAIL_PORT", str(args.smtp_port))
+    os.environ.setdefault("MAIL_USE_TLS", "False")
+    os.environ.setdefault("MAIL_USERNAME", "loadtest@example.com")  # the sender address; no password, no AUTH
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "False")  # every request comes from 127.0.0.1
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("LOG_LEVELS", "werkzeug=WARNING")  # no access log line per request
+    if args.redis != "fake":
+        os.environ.setdefault("REDIS_HOST", args.redis)
+
+
+def seed_users(app, count):
+    from extensions import db, hasher
+    from models import User
+
+    with app.app_context():
+        db.create_all()
+        password_hash = hasher.hash(USER_PASSWORD)  # one hash, shared by every account
+        for i in range(count):
+            db.session.add(User(
+                username=f"load{i}", email=USER_EMAIL.format(i), password=password_hash, confirmed=True,
+            ))
+        db.session.commit()
+
+
+def load_app(name, users):
+    app_dir = APPS[name]
+    sys.path.insert(0, app_dir)
+    if name == "gmsso":
+        from main import create_app
+        from extensions import mail_queue
+        app = create_app()
+        seed_users(app, users)
+        mail_queue.start()
+        return app
+    import app as ui_demo
+    ui_demo.reaper_lease.start()
+    return ui_demo.app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve an app against the load-test stand-ins")
+    parser.add_argument("app", choices=sorted(APPS))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--openstack", default="http://127.0.0.1:8774", help="mock OpenStack base URL")
+    parser.add_argument("--smtp-port", type=int, default=2525)
+    parser.add_argument("--redis", default="fake", help="'fake' for fakeredis, else a Redis host")
+    parser.add_argument("--users", type=int, default=200, help="confirmed accounts to create (gmsso)")
+    args = parser.parse_args()
+
+    # Keypair .pem files and the SQLite/asset caches land here, not in the app directory
+    workdir = tempfile.mkdtemp(prefix=f"loadtest-{args.app}-")
+    configure_env(args, workdir)
+    if args.redis == "fake":
+        use_fakeredis()
+    os.chdir(workdir)
+    app = load_app(args.app, args.users)
+
+    from werkzeug.serving import make_server
+    server = make_server(args.host, args.port, app, threaded=True)
+    print(f"{args.app} ready on http://{args.host}:{server.server_port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# loadtest/smtp_sink.py
+#
+# SMTP server that accepts every message and throws it away, so the mail
+# queue can send confirmation/reset emails during a load test.
+#
+#   python loadtest/smtp_sink.py --port 2525
+import argparse
+import socketserver
+import threading
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 smtp-sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.wfile.write(b"250-smtp-sink\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif command.startswith("AUTH"):
+                self.reply("235 authenticated")
+            elif command == "DATA":
+                self.reply("354 end with <CRLF>.<CRLF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                self.server.received += 1
+                self.reply("250 queued")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")  # MAIL, RCPT, RSET, NOOP
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, SMTPSinkHandler)
+        self.received = 0
+
+
+def serve(host="127.0.0.1", port=0):
+    """Start the sink in a background thread; ``server.received`` counts messages."""
+    server = SMTPSink((host, port))
+    threading.Thread(target=server.serve_forever, name="smtp-sink", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SMTP sink for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    args = parser.parse_args()
+    server = SMTPSink((args.host, args.port))
+    print(f"SMTP sink listening on {args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -18,7 +18,6 @@ from itsdangerous import URLSafeTimedSerializer, SignatureExpired
 from flask_mail import Mail, Message
 from flask_session import Session
 import redis
-import openstack
 
 # Load environment variables
 load_dotenv()
@@ -106,6 +105,9 @@ def create_openstack_resources(user):
         return  # Already created
 
     try:
+        # Imported here: openstacksdk adds ~0.3 s and ~30 MB to startup, and only signups need it
+        import openstack
+
         # Connect as admin using clouds.yaml
         conn = openstack.connect(cloud='openstack')
 
@@ -1,6 +1,10 @@
 import sys
-from main import app, db, server_session
-import dashboard # Import dashboard here to register its routes
+import time
+from main import create_app
+from extensions import db, mail_queue, oauth_tokens
+
+app = create_app()
+background = app.extensions["background"]
 
 if __name__ == "__main__":
     if "--setup" in sys.argv:
@@ -8,5 +12,14 @@ if __name__ == "__main__":
             db.create_all()
             db.session.commit()
             print("Database tables created")
+    elif "--mail-worker" in sys.argv:
+        # Run only the background workers (no web server). They take the
+        # leader lease, so any number of these and gunicorn workers coexist.
+        background.start()
+        print("Waiting for the leader lease to start the mail sender and OAuth token refresher")
+        while True:
+            time.sleep(3600)
     else:
-        app.run(host='0.0.0.0', debug=True)
\ No newline at end of file
+        mail_queue.start()
+        oauth_tokens.start()
+        app.run(host='0.0.0.0', debug=True)
@@ -0,0 +1,74 @@
+# assets.py
+import json
+import mimetypes
+import os
+
+from flask import request, send_from_directory
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class AssetManifest:
+    """Serve the output of build_assets.py.
+
+    Once ``static/dist/manifest.json`` exists, ``url_for('static', filename=...)``
+    in every template resolves to the fingerprinted file, which is sent with a
+    one-year immutable Cache-Control. Pre-compressed ``.br``/``.gz`` and ``.webp``
+    siblings are picked by the request's Accept-Encoding and Accept headers.
+    Without a manifest the app keeps using Flask's default static handler.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.hashed = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        path = os.path.join(app.static_folder, "dist", "manifest.json")
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            self.manifest = json.load(f)
+        self.hashed = set(self.manifest.values())
+        self.static_folder = app.static_folder
+
+        app.url_defaults(self._rewrite_static_url)
+        app.view_functions["static"] = self.serve
+        app.extensions["assets"] = self
+
+    def _rewrite_static_url(self, endpoint, values):
+        if endpoint == "static" and "filename" in values:
+            values["filename"] = self.manifest.get(values["filename"], values["filename"])
+
+    def serve(self, filename):
+        if filename not in self.hashed:
+            return send_from_directory(self.static_folder, filename)
+
+        served = filename
+        encoding = None
+        accept = request.headers.get("Accept", "")
+        accept_encoding = request.headers.get("Accept-Encoding", "")
+
+        if "image/webp" in accept and self._exists(filename + ".webp"):
+            served = filename + ".webp"
+        else:
+            for name, suffix in ENCODINGS:
+                if name in accept_encoding and self._exists(filename + suffix):
+                    served, encoding = filename + suffix, name
+                    break
+
+        response = send_from_directory(self.static_folder, served, max_age=31536000)
+        if served.endswith(".webp"):
+            response.mimetype = "image/webp"
+        elif encoding:
+            # Keep the original type; the body is just compressed
+            response.headers["Content-Encoding"] = encoding
+            response.mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        response.headers["Cache-Control"] = IMMUTABLE
+        response.headers["Vary"] = "Accept, Accept-Encoding"
+        return response
+
+    def _exists(self, filename):
+        return os.path.isfile(os.path.join(self.static_folder, filename))
@@ -0,0 +1,345 @@
+# auth.py
+#
+# Sign-up, email confirmation, password login/reset and Google login.
+import os
+import re
+
+from flask import Blueprint, current_app, flash, redirect, render_template, request, session, url_for
+from flask_dance.consumer import oauth_authorized, oauth_error
+from flask_dance.contrib.google import make_google_blueprint
+from flask_login import current_user, login_required, login_user, logout_user
+from itsdangerous import SignatureExpired, URLSafeTimedSerializer
+from sqlalchemy.orm.exc import NoResultFound
+
+import tracing
+from extensions import db, hasher, introspector, limiter, mail_queue, oauth_tokens
+from models import OAuth, User
+from passwords import PasswordHasherBusy
+from provisioning import provision
+
+auth_bp = Blueprint("auth", __name__)
+
+
+# Password strength checker
+def is_password_strong(password):
+    if len(password) < 8:
+        return False
+    if not re.search(r"[a-z]", password):
+        return False
+    if not re.search(r"[A-Z]", password):
+        return False
+    if not re.search(r"\d", password):
+        return False
+    if not re.search(r"[@$!%*?&]", password):
+        return False
+    return True
+
+
+def send_email(to, subject, template):
+    with tracing.span("send_email", {"mail.subject": subject}):
+        mail_queue.enqueue(to, subject, template)
+
+
+def generate_confirmation_token(email):
+    serializer = URLSafeTimedSerializer(current_app.secret_key)
+    return serializer.dumps(email, salt=current_app.secret_key)
+
+
+def confirm_token(token, expiration=3600):
+    serializer = URLSafeTimedSerializer(current_app.secret_key)
+    try:
+        email = serializer.loads(token, salt=current_app.secret_key, max_age=expiration)
+        return email
+    except SignatureExpired:
+        return False
+
+
+# === Google OAuth ===
+def register_google(app):
+    """Google login at /login/google, with tokens kept in the OAuth token store."""
+    google_bp = make_google_blueprint(
+        client_id=os.getenv("GOOGLE_CLIENT_ID"),
+        client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+        scope=["openid", "https://www.googleapis.com/auth/userinfo.email", "https://www.googleapis.com/auth/userinfo.profile"],
+        redirect_url="/google-login",
+        offline=True,  # issue a refresh token so the background refresher can renew access
+    )
+    google_bp.storage = oauth_tokens.storage(user=lambda: current_user)
+    oauth_tokens.register_provider(
+        "google", "https://oauth2.googleapis.com/token",
+        os.getenv("GOOGLE_CLIENT_ID"), os.getenv("GOOGLE_CLIENT_SECRET"),
+    )
+    oauth_authorized.connect(google_logged_in, sender=google_bp)
+    oauth_error.connect(google_error, sender=google_bp)
+    app.register_blueprint(google_bp, url_prefix="/login")
+    limiter.limit_endpoint(app, "google.authorized", "oauth_callback_ip")
+
+
+# Google Login Handler
+def google_logged_in(blueprint, token):
+    if not token:
+        flash("Failed to log in with Google.", "danger")
+        return False
+
+    resp = blueprint.session.get("/oauth2/v2/userinfo")
+    if not resp.ok:
+        flash("Failed to fetch user info from Google.", "danger")
+        return False
+
+    google_info = resp.json()
+    email = google_info["email"]
+    google_id = google_info["id"]
+
+    query = OAuth.query.filter_by(provider=blueprint.name, provider_user_id=google_id)
+    try:
+        oauth = query.one()
+    except NoResultFound:
+        oauth = None
+
+    if oauth and oauth.user:
+        oauth_tokens.save(oauth, token)
+        db.session.commit()
+        login_user(oauth.user)
+        flash("Successfully signed in with Google.", "success")
+        return redirect(url_for("dashboard.dashboard"))
+
+    user = User.query.filter_by(email=email).first()
+
+    if not user:
+        user = User(
+            email=email,
+            name=google_info.get("name"),
+            profile_pic=google_info.get("picture"),
+            username=email.split("@")[0],
+            confirmed=True
+        )
+        db.session.add(user)
+        db.session.flush()
+
+        # Create OpenStack resources
+        try:
+            provision(user)
+        except Exception as e:
+            db.session.rollback()
+            flash(f"Cloud setup failed: {str(e)}", "danger")
+            return redirect(url_for("auth.login"))
+
+    if not oauth:
+        oauth = OAuth(provider=blueprint.name, provider_user_id=google_id, user=user)
+        db.session.add(oauth)
+    else:
+        oauth.user = user
+    oauth_tokens.save(oauth, token)
+
+    db.session.commit()
+    login_user(user)
+    flash("Welcome! Your cloud environment is ready.", "success")
+    return redirect(url_for("dashboard.dashboard"))
+
+
+# OAuth Error Handler
+def google_error(blueprint, error, error_description=None, error_uri=None):
+    flash(f"OAuth error: {error} - {error_description}", "danger")
+
+
+# === Routes ===
+@auth_bp.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    session.clear()
+    flash("You have logged out.", "info")
+    return redirect(url_for('auth.login'))
+
+
+@auth_bp.route("/signup", methods=["GET", "POST"])
+@limiter.limit("signup_ip")
+def signup():
+    if current_user.is_authenticated:
+        return redirect(url_for("dashboard.dashboard"))
+
+    if request.method == "POST":
+        username = request.form.get("username")
+        email = request.form.get("email")
+        password = request.form.get("password")
+        confirm_password = request.form.get("confirm_password")
+
+        if password != confirm_password:
+            flash("Passwords do not match!", "danger")
+            return redirect(url_for("auth.signup"))
+
+        if not is_password_strong(password.strip()):
+            flash("Password must meet the required criteria.", "danger")
+            return redirect(url_for("auth.signup"))
+
+        if User.query.filter_by(email=email).first():
+            flash("Email already registered.", "warning")
+            return redirect(url_for("auth.login"))
+
+        try:
+            password_hash = hasher.hash(password)
+        except PasswordHasherBusy:
+            flash("The server is busy, please try again in a moment.", "warning")
+            return redirect(url_for("auth.signup"))
+
+        user = User(
+            username=username,
+            email=email,
+            password=password_hash,
+            confirmed=False
+        )
+        db.session.add(user)
+        db.session.flush()
+
+        try:
+            provision(user)
+        except Exception as e:
+            # provision() has already removed the user
+            db.session.rollback()
+            flash(f"Cloud setup failed: {str(e)}", "danger")
+            return redirect(url_for("auth.signup"))
+
+        db.session.commit()
+
+        token = generate_confirmation_token(user.email)
+        confirm_url = url_for('auth.confirm_email', token=token, _external=True)
+        html = render_template('activate.html', confirm_url=confirm_url)
+        send_email(user.email, 'Confirm Your Account', html)
+        flash("A confirmation email has been sent.", "info")
+        return redirect(url_for("auth.login"))
+
+    return render_template("signup.html")
+
+
+@auth_bp.route('/confirm/<token>')
+def confirm_email(token):
+    email = confirm_token(token)
+    if not email:
+        flash('The confirmation link has expired.', 'danger')
+        return redirect(url_for('auth.signup'))
+
+    user = User.query.filter_by(email=email).first()
+    if not user:
+        flash('User not found.', 'danger')
+        return redirect(url_for('auth.signup'))
+
+    if user.confirmed:
+        flash('Account already confirmed.', 'success')
+    else:
+        user.confirmed = True
+        db.session.commit()
+        login_user(user)
+        flash('Your account has been confirmed!', 'success')
+    return redirect(url_for('dashboard.dashboard'))
+
+
+@auth_bp.route("/login", methods=["GET", "POST"])
+@limiter.limit("login_ip", "login_account", failures_only=True)
+def login():
+    if current_user.is_authenticated:
+        return redirect(url_for("dashboard.dashboard"))
+
+    if request.method == "POST":
+        email = request.form.get("email")
+        password = request.form.get("password")
+        user = User.query.filter_by(email=email).first()
+
+        try:
+            valid = user is not None and hasher.verify(user.password, password)
+        except PasswordHasherBusy:
+            flash("The server is busy, please try again in a moment.", "warning")
+            return redirect(url_for("auth.login"))
+
+        if valid:
+            if not user.confirmed:
+                flash('Please confirm your account first.', 'warning')
+                return redirect(url_for('auth.login'))
+            # Upgrade hashes made with an older algorithm or cost
+            if hasher.needs_rehash(user.password):
+                try:
+                    user.password = hasher.hash(password)
+                    db.session.commit()
+                except PasswordHasherBusy:
+                    pass  # Try again on the next login
+            login_user(user)
+            flash("Logged in successfully!", "success")
+            return redirect(url_for("dashboard.dashboard"))
+        else:
+            limiter.failed("login_account", email)
+            flash("Invalid email or password.", "danger")
+
+    return render_template("login.html")
+
+
+@auth_bp.route("/reset_password", methods=["GET", "POST"])
+@limiter.limit("reset_ip", "reset_account")
+def reset_password():
+    if current_user.is_authenticated:
+        return redirect(url_for("dashboard.dashboard"))
+
+    if request.method == "POST":
+        email = request.form.get("email")
+        user = User.query.filter_by(email=email).first()
+        if not user:
+            flash("No account found with that email.", "danger")
+            return redirect(url_for("auth.reset_password"))
+
+        token = generate_confirmation_token(user.email)
+        user.reset_token = token
+        db.session.commit()
+
+        reset_url = url_for('auth.reset_password_token', token=token, _external=True)
+        html = render_template('reset_password_email.html', reset_url=reset_url)
+        try:
+            send_email(user.email, 'Password Reset Request', html)
+            flash("Password reset link sent to your email.", "info")
+        except Exception as e:
+            flash(f"Failed to send email: {e}", "danger")
+        return redirect(url_for("auth.login"))
+
+    return render_template("reset_password.html")
+
+
+@auth_bp.route("/reset_password/<token>", methods=["GET", "POST"])
+def reset_password_token(token):
+    email = confirm_token(token)
+    if not email:
+        flash("The reset link has expired.", "danger")
+        return redirect(url_for("auth.reset_password"))
+
+    user = User.query.filter_by(email=email).first()
+    if not user:
+        flash("User not found.", "danger")
+        return redirect(url_for("auth.reset_password"))
+
+    if request.method == "POST":
+        password = request.form.get("password")
+        confirm_password = request.form.get("confirm_password")
+        if password != confirm_password:
+            flash("Passwords do not match!", "danger")
+            return redirect(url_for("auth.reset_password_token", token=token))
+
+        if not is_password_strong(password.strip()):
+            flash("Password must meet the required criteria.", "danger")
+            return redirect(url_for("auth.reset_password_token", token=token))
+
+        try:
+            user.password = hasher.hash(password)
+        except PasswordHasherBusy:
+            flash("The server is busy, please try again in a moment.", "warning")
+            return redirect(url_for("auth.reset_password_token", token=token))
+        user.reset_token = None
+        db.session.commit()
+        # Sign out every existing session and token of this user
+        introspector.revoke_user(user.id)
+        flash("Your password has been updated!", "success")
+        return redirect(url_for("auth.login"))
+
+    return render_template("reset_password_token.html", token=token)
+
+
+@auth_bp.route("/")
+def index():
+    if current_user.is_authenticated:
+        return redirect(url_for("dashboard.dashboard"))
+    return render_template("home.html")
@@ -0,0 +1,102 @@
+# benchmarks/bench_introspection.py
+#
+# Measure introspection checks/second in one worker process:
+# LRU hits, Redis lookups, and full POST /introspect requests.
+#
+#   python benchmarks/bench_introspection.py                 # Redis at REDIS_URL
+#   python benchmarks/bench_introspection.py --fake          # in-process fakeredis
+#   python benchmarks/bench_introspection.py --sessions 5000 --seconds 3
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis  # noqa: E402
+from flask import Flask  # noqa: E402
+
+from introspection import Introspector, session_record_key  # noqa: E402
+from revocation import RevocationBus  # noqa: E402
+from sso_tokens import TokenIssuer  # noqa: E402
+
+
+class _User:
+    def __init__(self, i):
+        self.id = i
+        self.email = f"user{i}@example.com"
+        self.name = f"User {i}"
+
+
+def make_app(redis_client, local_ttl):
+    os.environ["INTROSPECT_LOCAL_TTL"] = str(local_ttl)
+    os.environ.setdefault("INTROSPECT_API_KEY", "bench")
+    os.environ["SESSION_MODE"] = "jwt"  # tokens are only signed in JWT mode
+    os.environ.setdefault("SSO_SIGNING_KEY_FILE", os.path.join(tempfile.mkdtemp(), "key.pem"))
+    app = Flask(__name__)
+    app.secret_key = "bench"
+    revocations = RevocationBus(app, redis_client)
+    issuer = TokenIssuer(app, redis_client, revocations)
+    introspector = Introspector(app, redis_client, issuer, revocations)
+    return app, issuer, introspector
+
+
+def rate(fn, items, seconds):
+    done = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for item in items:
+            fn(item)
+        done += len(items)
+    return done / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Introspection throughput")
+    parser.add_argument("--fake", action="store_true", help="use fakeredis instead of a real server")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    if args.fake:
+        import fakeredis
+        client = fakeredis.FakeStrictRedis()
+    else:
+        client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+    sids = [f"bench-{i}" for i in range(args.sessions)]
+    pipe = client.pipeline()
+    for i, sid in enumerate(sids):
+        record = {"active": True, "sub": str(i), "email": f"user{i}@example.com", "sid": sid}
+        pipe.set(session_record_key(sid), json.dumps(record), ex=600)
+    pipe.execute()
+
+    print(f"{'path':<36} {'checks/s':>12}")
+
+    app, issuer, introspector = make_app(client, local_ttl=60)
+    for sid in sids:
+        introspector.introspect_session(sid)
+    print(f"{'session, LRU hit':<36} {rate(introspector.introspect_session, sids, args.seconds):>12,.0f}")
+
+    tokens = [issuer.sign(issuer.claims_for(_User(i), f"tok-{i}")) for i in range(min(200, args.sessions))]
+    for token in tokens:
+        introspector.introspect_token(token)
+    print(f"{'token, LRU hit':<36} {rate(introspector.introspect_token, tokens, args.seconds):>12,.0f}")
+
+    http = app.test_client()
+    headers = {"X-Introspect-Key": os.environ["INTROSPECT_API_KEY"]}
+    post = lambda sid: http.post("/introspect", data={"session": sid}, headers=headers)  # noqa: E731
+    print(f"{'POST /introspect, LRU hit':<36} {rate(post, sids, args.seconds):>12,.0f}")
+
+    app, issuer, introspector = make_app(client, local_ttl=0)
+    print(f"{'session, Redis lookup (no LRU)':<36} {rate(introspector.introspect_session, sids, args.seconds):>12,.0f}")
+    print(f"{'token, verify + revocation check':<36} {rate(introspector.introspect_token, tokens, args.seconds):>12,.0f}")
+
+    client.delete(*[session_record_key(sid) for sid in sids])
+
+
+if __name__ == "__main__":
+    main()
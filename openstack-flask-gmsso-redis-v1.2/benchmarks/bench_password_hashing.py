@@ -0,0 +1,71 @@
+# benchmarks/bench_password_hashing.py
+#
+# Report password hashes/second for each hashing configuration, both inline
+# (one thread) and through the PasswordHasher process pool.
+#
+#   python benchmarks/bench_password_hashing.py
+#   python benchmarks/bench_password_hashing.py --count 64 --workers 4
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher, Argon2Hasher, _hash  # noqa: E402
+
+CONFIGS = [
+    "pbkdf2:sha256:260000",
+    "pbkdf2:sha256:600000",
+    "scrypt:16384:8:1",
+    "scrypt:32768:8:1",
+    "argon2",
+]
+
+
+class _App:
+    extensions = {}
+
+
+def bench_inline(method, count, argon2_params):
+    start = time.perf_counter()
+    for _ in range(count):
+        _hash("Benchmark#123", method, argon2_params)
+    return count / (time.perf_counter() - start)
+
+
+def bench_pool(method, count, workers):
+    os.environ["PASSWORD_HASH_METHOD"] = method
+    os.environ["PASSWORD_HASH_WORKERS"] = str(workers)
+    hasher = PasswordHasher(_App())
+    hasher.hash("warm-up")  # start the worker processes outside the timing
+    try:
+        start = time.perf_counter()
+        # Simulate concurrent request threads submitting hashes
+        with ThreadPoolExecutor(max_workers=workers * 2) as threads:
+            list(threads.map(lambda _: hasher.hash("Benchmark#123"), range(count)))
+        return count / (time.perf_counter() - start)
+    finally:
+        hasher.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Password hashing throughput")
+    parser.add_argument("--count", type=int, default=32, help="hashes per configuration")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    argon2_params = {"time_cost": 3, "memory_cost": 65536, "parallelism": 1}
+    print(f"{'method':<24} {'inline h/s':>12} {'pool h/s':>12}  (workers={args.workers})")
+    for method in CONFIGS:
+        if method == "argon2" and Argon2Hasher is None:
+            print(f"{method:<24} {'skipped (argon2-cffi not installed)':>26}")
+            continue
+        inline = bench_inline(method, args.count, argon2_params)
+        pooled = bench_pool(method, args.count, args.workers)
+        print(f"{method:<24} {inline:>12.1f} {pooled:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
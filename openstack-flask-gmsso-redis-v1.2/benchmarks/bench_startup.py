@@ -0,0 +1,85 @@
+# benchmarks/bench_startup.py
+#
+# Cold start of the app: time to import it, time to serve the first request,
+# and the resident memory of the process afterwards. Every run is a fresh
+# interpreter. "eager" also imports openstacksdk and Flask-Mail up front, as
+# main.py used to; "lazy" is the app as it is now.
+#
+#   python benchmarks/bench_startup.py                 # Redis at REDIS_HOST
+#   python benchmarks/bench_startup.py --fake          # in-process fakeredis
+#   python benchmarks/bench_startup.py --runs 10
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules main.py imported at load time before they were made lazy
+EAGER_MODULES = ["openstack", "flask_mail"]
+
+CHILD = """
+import json, os, resource, sys, time
+start = time.perf_counter()
+if os.environ["BENCH_FAKE_REDIS"] == "1":
+    import fakeredis, redis
+    redis.Redis = redis.StrictRedis = fakeredis.FakeStrictRedis
+for name in json.loads(os.environ["BENCH_PRELOAD"]):
+    __import__(name)
+sys.path.insert(0, os.environ["BENCH_APP_DIR"])
+import app
+imported = time.perf_counter()
+status = app.app.test_client().get("/login").status_code
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_request_ms": (served - start) * 1000,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+    "openstack_loaded": "openstack" in sys.modules,
+    "status": status,
+}))
+"""
+
+
+def run_once(preload, fake, workdir):
+    env = dict(os.environ)
+    env.update({
+        "BENCH_PRELOAD": json.dumps(preload),
+        "BENCH_FAKE_REDIS": "1" if fake else "0",
+        "BENCH_APP_DIR": APP_DIR,
+        "DATABASE_URL": "sqlite://",
+        "LOG_LEVEL": "WARNING",
+        "SSO_SIGNING_KEY_FILE": os.path.join(workdir, "key.pem"),
+    })
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD], env=env, cwd=APP_DIR, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="App cold start: import time, first request, RSS")
+    parser.add_argument("--fake", action="store_true", help="use fakeredis instead of a real server")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per mode")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    print(f"{'mode':6} {'import ms':>10} {'first req ms':>13} {'RSS MB':>8} {'modules':>8}  openstack loaded")
+    for mode, preload in (("eager", EAGER_MODULES), ("lazy", [])):
+        # One warm-up run so both modes read the .pyc files from the page cache
+        run_once(preload, args.fake, workdir)
+        runs = [run_once(preload, args.fake, workdir) for _ in range(args.runs)]
+        print(
+            f"{mode:6} {statistics.median(r['import_ms'] for r in runs):10.0f}"
+            f" {statistics.median(r['first_request_ms'] for r in runs):13.0f}"
+            f" {statistics.median(r['rss_mb'] for r in runs):8.1f}"
+            f" {runs[0]['modules']:8d}  {runs[0]['openstack_loaded']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# build_assets.py
+#
+# Build fingerprinted, pre-compressed static assets for production.
+#
+#   python build_assets.py            # writes static/dist/ and static/dist/manifest.json
+#   python build_assets.py --clean    # remove static/dist/ first
+#
+# css/js  -> name.<hash>.ext plus .gz and .br siblings
+# images  -> resized to at most MAX_IMAGE_WIDTH px, name.<hash>.ext plus a .webp sibling
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+from io import BytesIO
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+DIST_NAME = "dist"
+DIST_DIR = os.path.join(STATIC_DIR, DIST_NAME)
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+
+TEXT_TYPES = (".css", ".js", ".svg")
+IMAGE_TYPES = (".png", ".jpg", ".jpeg")
+MAX_IMAGE_WIDTH = int(os.getenv("MAX_IMAGE_WIDTH", 512))
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", 85))
+
+
+def fingerprint(rel_path, data):
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    root, ext = os.path.splitext(rel_path)
+    return f"{root}.{digest}{ext}"
+
+
+def write(rel_path, data):
+    path = os.path.join(DIST_DIR, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def resize_image(src_path):
+    """Return image bytes scaled down to MAX_IMAGE_WIDTH, or the original bytes."""
+    with open(src_path, "rb") as f:
+        original = f.read()
+    if Image is None:
+        return original, None
+
+    with Image.open(src_path) as img:
+        if img.width > MAX_IMAGE_WIDTH:
+            height = round(img.height * MAX_IMAGE_WIDTH / img.width)
+            img = img.resize((MAX_IMAGE_WIDTH, height), Image.LANCZOS)
+            out = _encode(img, img.format or os.path.splitext(src_path)[1][1:].upper())
+            # Keep whichever is smaller
+            if len(out) < len(original):
+                original = out
+        webp = _encode(img, "WEBP", quality=WEBP_QUALITY, method=6)
+    return original, webp
+
+
+def _encode(img, fmt, **options):
+    buf = BytesIO()
+    if fmt == "JPG":
+        fmt = "JPEG"
+    img.save(buf, format=fmt, optimize=True, **options)
+    return buf.getvalue()
+
+
+def build():
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(STATIC_DIR):
+        # Never descend into our own output
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != DIST_DIR]
+        for name in sorted(filenames):
+            src = os.path.join(dirpath, name)
+            rel = os.path.relpath(src, STATIC_DIR).replace(os.sep, "/")
+            ext = os.path.splitext(name)[1].lower()
+
+            if ext in IMAGE_TYPES:
+                data, webp = resize_image(src)
+                hashed = fingerprint(rel, data)
+                write(hashed, data)
+                if webp is not None and len(webp) < len(data):
+                    write(hashed + ".webp", webp)
+            else:
+                with open(src, "rb") as f:
+                    data = f.read()
+                hashed = fingerprint(rel, data)
+                write(hashed, data)
+                if ext in TEXT_TYPES:
+                    write(hashed + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+                    if brotli is not None:
+                        write(hashed + ".br", brotli.compress(data, quality=11))
+
+            manifest[rel] = f"{DIST_NAME}/{hashed}"
+            print(f"✅ {rel} -> {manifest[rel]}")
+
+    os.makedirs(DIST_DIR, exist_ok=True)
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    print(f"✅ Manifest written: {MANIFEST_PATH} ({len(manifest)} assets)")
+    if brotli is None:
+        print("⚠️ brotli not installed, skipped .br files")
+    if Image is None:
+        print("⚠️ Pillow not installed, images copied without resizing or WebP")
+
+
+if __name__ == "__main__":
+    if "--clean" in sys.argv and os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    build()
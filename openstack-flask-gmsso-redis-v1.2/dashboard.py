@@ -1,29 +1,41 @@
 # dashboard.py
-from flask import render_template
+from flask import Blueprint, current_app, render_template, jsonify
 from flask_login import login_required
-from main import app
+from extensions import limiter
 
-@app.route('/dashboard')
+dashboard_bp = Blueprint("dashboard", __name__)
+
+@dashboard_bp.route('/dashboard')
 @login_required
 def dashboard():
     return render_template('sidebar3.html')
 
-@app.route('/profile')
+@dashboard_bp.route('/profile')
 @login_required
 def profile():
     return render_template('profile.html')
 
-@app.route('/task')
+@dashboard_bp.route('/task')
 @login_required
 def task():
     return render_template('task.html')
 
-@app.route('/notification')
+@dashboard_bp.route('/notification')
 @login_required
 def notification():
     return render_template('notification.html')
 
-@app.route('/settings')
+@dashboard_bp.route('/settings')
 @login_required
 def settings():
-    return render_template('settings.html')
\ No newline at end of file
+    return render_template('settings.html')
+
+@dashboard_bp.route('/internal/render-stats')
+@login_required
+def render_stats_view():
+    return jsonify(current_app.extensions["render_stats"].snapshot())
+
+@dashboard_bp.route('/internal/rate-limit-stats')
+@login_required
+def rate_limit_stats_view():
+    return jsonify(limiter.stats())
\ No newline at end of file
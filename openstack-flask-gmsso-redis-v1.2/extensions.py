@@ -0,0 +1,46 @@
+# extensions.py
+#
+# Extension instances shared by the blueprints. They are bound to an app by
+# create_app() in main.py, so importing a blueprint never builds an app,
+# opens a connection or reads configuration.
+from flask_login import LoginManager
+from flask_session import Session
+from flask_sqlalchemy import SQLAlchemy
+
+from assets import AssetManifest
+from introspection import Introspector
+from mail_queue import MailQueue
+from oauth_tokens import OAuthTokenStore
+from passwords import PasswordHasher
+from rate_limit import RateLimiter
+from revocation import RevocationBus
+from sso_tokens import TokenIssuer
+
+db = SQLAlchemy()
+login_manager = LoginManager()
+server_session = Session()
+
+# Brute-force protection for auth endpoints (Redis sliding window)
+limiter = RateLimiter()
+
+# Logout/password-reset revocations fanned out to every worker (Redis pub/sub)
+revocation_bus = RevocationBus()
+
+# SSO: signed access/refresh tokens and JWKS endpoint (SESSION_MODE=jwt)
+sso_tokens = TokenIssuer()
+
+# Session/token introspection for other services (LRU + Redis, no DB)
+introspector = Introspector()
+
+# Password hashing runs in a process pool, off the request thread
+hasher = PasswordHasher()
+
+# OAuth tokens: encrypted at rest, cached in Redis, refreshed in the background
+oauth_tokens = OAuthTokenStore()
+
+# Outbound mail is queued in Redis and sent by a background thread
+# (Flask-Mail is only loaded there, when the first message goes out)
+mail_queue = MailQueue()
+
+# Fingerprinted static assets (run build_assets.py to enable)
+assets = AssetManifest()
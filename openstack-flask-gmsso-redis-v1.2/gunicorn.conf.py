@@ -0,0 +1,79 @@
+# gunicorn.conf.py
+#
+# Production server for the gmsso app (gunicorn reads this file from the
+# working directory):
+#
+#   gunicorn app:app
+#
+# - WEB_CONCURRENCY: worker processes (default 2 x cores + 1)
+# - GUNICORN_THREADS: threads per worker (default 4)
+# - BACKGROUND_JOBS: False to keep the mail sender and OAuth refresher out of
+#   the web tier (run `python app.py --mail-worker` instead)
+#
+# kill -HUP <master> restarts the workers gracefully. The app is preloaded,
+# so new code needs kill -USR2 <master> (a new master) and then
+# kill -QUIT <old master>.
+import os
+
+# Aggregate every worker's samples at /metrics (see metrics.init_app). Must be
+# set before prometheus_client is imported by the preloaded app.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/gmsso-metrics")
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def _cores():
+    try:
+        return len(os.sched_getaffinity(0))  # the CPUs this container may use
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', 5000)}")
+# Threaded workers: the mail sender, the OAuth refresher and the revocation
+# listener run on threads of their own
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", 2 * _cores() + 1))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+
+# Import the app (SQLAlchemy, Flask-Dance, Authlib...) once in the master;
+# workers share those pages copy-on-write instead of importing them again.
+# openstacksdk is not among them: provisioning.py imports it on the first
+# signup, in the worker that serves it
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+# Recycle workers now and then so slow leaks never accumulate, staggered
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")  # off unless set; requests are already timed in metrics
+errorlog = "-"
+
+
+def on_starting(server):
+    # Samples left by a previous run would be added to this one's
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    for name in os.listdir(path):
+        os.remove(os.path.join(path, name))
+
+
+def post_fork(server, worker):
+    from extensions import db
+
+    app = server.app.wsgi()  # the preloaded app
+    # Connections opened by the master must not be shared with the workers
+    with app.app_context():
+        db.engine.dispose(close=False)
+    if os.getenv("BACKGROUND_JOBS", "True").lower() in ["true", "1", "t"]:
+        app.extensions["background"].start()
+
+
+def worker_exit(server, worker):
+    # Hand the lease to another worker now instead of after it expires
+    server.app.wsgi().extensions["background"].stop()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,94 @@
+# leader.py
+import logging
+import os
+import threading
+import uuid
+
+log = logging.getLogger("leader")
+
+# Extend the lease only if we still hold it; release likewise
+_RENEW = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLease:
+    """Run background jobs in exactly one process of the whole deployment.
+
+    Every web worker (and every replica) calls ``start()``. Each tries to take
+    a Redis lease (``SET NX PX``); the holder starts the jobs and renews the
+    lease every ``ttl / 3`` seconds, the others retry at the same pace. When
+    the holder exits, ``stop()`` hands the lease over at once; if it dies,
+    another process takes over within ``ttl`` seconds.
+
+    ``jobs`` are objects with ``start()`` and ``stop()``, such as the mail
+    queue sender or ``OAuthTokenStore``.
+    """
+
+    def __init__(self, redis_client, name, jobs, ttl=None):
+        self.redis = redis_client
+        self.key = f"leader:{name}"
+        self.jobs = list(jobs)
+        self.ttl = float(ttl or os.getenv("LEADER_TTL", 30))
+        self.token = None
+        self.leading = False
+        self._thread = None
+        self._stop = threading.Event()
+        self._renew = redis_client.register_script(_RENEW)
+        self._release = redis_client.register_script(_RELEASE)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        # A fresh token per process: a forked worker must not inherit its parent's lease
+        self.token = f"{os.getpid()}:{uuid.uuid4().hex}"
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name=f"leader-{self.key}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self.leading:
+            self._demote()
+            try:
+                self._release(keys=[self.key], args=[self.token])
+            except Exception as e:
+                log.warning("Leader lease not released: %s", e, extra={"lease": self.key})
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                # Redis unreachable: we cannot prove we still hold the lease
+                log.warning("Leader lease check failed: %s", e, extra={"lease": self.key})
+                if self.leading:
+                    self._demote()
+            self._stop.wait(self.ttl / 3)
+
+    def tick(self):
+        ttl_ms = int(self.ttl * 1000)
+        if self.leading:
+            if not self._renew(keys=[self.key], args=[self.token, ttl_ms]):
+                log.warning("Leader lease lost; stopping background jobs", extra={"lease": self.key})
+                self._demote()
+        elif self.redis.set(self.key, self.token, nx=True, px=ttl_ms):
+            self.leading = True
+            for job in self.jobs:
+                job.start()
+
+    def _demote(self):
+        self.leading = False
+        for job in self.jobs:
+            job.stop()
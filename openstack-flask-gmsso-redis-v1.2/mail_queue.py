@@ -0,0 +1,293 @@
+# mail_queue.py
+import json
+import logging
+import os
+import smtplib
+import socket
+import threading
+import time
+import uuid
+
+import tracing
+
+log = logging.getLogger("mail_queue")
+
+# Redis keys
+QUEUE_KEY = "mail:outbound"
+RETRY_KEY = "mail:retry"
+DEAD_KEY = "mail:dead"
+SENDERS_KEY = "mail:senders"  # set of sender ids that may hold messages
+
+
+def processing_key(sender_id):
+    """Messages a sender has taken off the queue and not yet settled."""
+    return f"mail:processing:{sender_id}"
+
+
+def heartbeat_key(sender_id):
+    return f"mail:sender:{sender_id}"
+
+# Errors that will never succeed on retry (bad recipient, rejected sender)
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)
+# What enqueue() writes and the sender reads
+RECORD_FIELDS = ("to", "subject", "html", "sender", "attempts")
+
+
+class MailQueue:
+    """Outbound mail queue stored in Redis and drained by a background sender.
+
+    Requests only push a small JSON record onto a Redis list, so signup and
+    password reset never wait on the SMTP server. The sender thread keeps one
+    SMTP connection open between batches and retries failed messages with
+    exponential backoff.
+
+    A message is moved, not popped, off the queue: it sits on the sender's
+    own processing list until it is delivered, dead-lettered or scheduled for
+    a retry. A sender that dies mid-batch (crash, or a reload that outlives
+    the 5 s join in ``stop()``) stops renewing its heartbeat, and whichever
+    sender runs next puts its processing list back on the queue. Delivery is
+    therefore at least once: a message sent just before a crash may go out
+    twice.
+    """
+
+    def __init__(self, app=None, mail=None, redis_client=None):
+        self.app = None
+        self.mail = mail
+        self.redis = redis_client
+        self._thread = None
+        self._stop = threading.Event()
+        self._connection = None
+        self._last_used = 0.0
+        self._recovered_at = 0.0
+        self.sender_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.processing_key = processing_key(self.sender_id)
+        if app is not None:
+            self.init_app(app, mail, redis_client)
+
+    def init_app(self, app, mail=None, redis_client=None):
+        self.app = app
+        self.mail = mail or self.mail
+        self.redis = redis_client or self.redis
+        app.config.setdefault("MAIL_QUEUE_BATCH_SIZE", int(os.getenv("MAIL_QUEUE_BATCH_SIZE", 20)))
+        app.config.setdefault("MAIL_QUEUE_MAX_ATTEMPTS", int(os.getenv("MAIL_QUEUE_MAX_ATTEMPTS", 5)))
+        app.config.setdefault("MAIL_QUEUE_BACKOFF", float(os.getenv("MAIL_QUEUE_BACKOFF", 5)))
+        app.config.setdefault("MAIL_QUEUE_MAX_BACKOFF", float(os.getenv("MAIL_QUEUE_MAX_BACKOFF", 600)))
+        app.config.setdefault("MAIL_QUEUE_IDLE_TIMEOUT", float(os.getenv("MAIL_QUEUE_IDLE_TIMEOUT", 60)))
+        app.config.setdefault("MAIL_QUEUE_SENDER_TTL", int(os.getenv("MAIL_QUEUE_SENDER_TTL", 30)))
+        app.extensions["mail_queue"] = self
+
+    # === Producer side (request thread) ===
+    def enqueue(self, to, subject, html, sender=None):
+        record = {
+            "to": to,
+            "subject": subject,
+            "html": html,
+            "sender": sender or self.app.config["MAIL_USERNAME"],
+            "attempts": 0,
+            "trace": tracing.inject(),  # the SMTP span joins the request's trace
+        }
+        self.redis.lpush(QUEUE_KEY, json.dumps(record))
+
+    def pending(self):
+        return {
+            "queued": self.redis.llen(QUEUE_KEY),
+            "sending": sum(self.redis.llen(processing_key(sender_id)) for sender_id in self._senders()),
+            "retrying": self.redis.zcard(RETRY_KEY),
+            "dead": self.redis.llen(DEAD_KEY),
+        }
+
+    def _senders(self):
+        return [s.decode() if isinstance(s, bytes) else s for s in self.redis.smembers(SENDERS_KEY)]
+
+    # === Consumer side (sender thread) ===
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="mail-sender", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def run(self):
+        with self.app.app_context():
+            while not self._stop.is_set():
+                try:
+                    self._heartbeat()
+                    self._recover_orphans()
+                    self._promote_due_retries()
+                    batch = self._next_batch()
+                    if batch:
+                        self._send_batch(batch)
+                    else:
+                        self._close_if_idle()
+                except Exception:
+                    log.exception("Mail sender error")
+                    self._disconnect()
+                    time.sleep(1)
+            self._disconnect()
+            try:
+                self._requeue(self.sender_id)
+            except Exception:
+                log.exception("Mail sender could not hand back its messages")
+
+    def _heartbeat(self):
+        pipe = self.redis.pipeline()
+        pipe.sadd(SENDERS_KEY, self.sender_id)
+        pipe.set(heartbeat_key(self.sender_id), 1, ex=self.app.config["MAIL_QUEUE_SENDER_TTL"])
+        pipe.execute()
+
+    def _recover_orphans(self):
+        # Checked on start, then once per heartbeat lifetime
+        ttl = self.app.config["MAIL_QUEUE_SENDER_TTL"]
+        if self._recovered_at and time.monotonic() - self._recovered_at < ttl:
+            return
+        self._recovered_at = time.monotonic()
+        for sender_id in self._senders():
+            if sender_id != self.sender_id and not self.redis.exists(heartbeat_key(sender_id)):
+                self._requeue(sender_id)
+
+    def _requeue(self, sender_id):
+        """Put a sender's unsettled messages back on the queue, oldest nearest the consumer end."""
+        key = processing_key(sender_id)
+        moved = 0
+        while self.redis.lmove(key, QUEUE_KEY, "LEFT", "RIGHT") is not None:
+            moved += 1
+        pipe = self.redis.pipeline()
+        pipe.srem(SENDERS_KEY, sender_id)
+        pipe.delete(heartbeat_key(sender_id))
+        pipe.execute()
+        if moved:
+            log.warning("Requeued unsent mail", extra={"sender": sender_id, "messages": moved})
+
+    def _next_batch(self):
+        """Move up to MAIL_QUEUE_BATCH_SIZE messages onto our processing list; returns (raw, record) pairs."""
+        first = self.redis.blmove(QUEUE_KEY, self.processing_key, 1, "RIGHT", "LEFT")
+        if first is None:
+            return []
+        batch = [first]
+        extra = self.app.config["MAIL_QUEUE_BATCH_SIZE"] - 1
+        if extra > 0:
+            pipe = self.redis.pipeline(transaction=False)
+            for _ in range(extra):
+                pipe.lmove(QUEUE_KEY, self.processing_key, "RIGHT", "LEFT")
+            batch.extend(raw for raw in pipe.execute() if raw is not None)
+        records = []
+        for raw in batch:
+            record = _decode(raw)
+            if record is None:
+                # It would fail the same way every time it came back
+                self._dead_letter_raw(raw)
+            else:
+                records.append((raw, record))
+        return records
+
+    def _promote_due_retries(self):
+        due = self.redis.zrangebyscore(RETRY_KEY, 0, time.time(), start=0, num=100)
+        for raw in due:
+            # ZREM returning 1 means this worker owns the message
+            if self.redis.zrem(RETRY_KEY, raw):
+                self.redis.rpush(QUEUE_KEY, raw)
+
+    def _send_batch(self, batch):
+        for raw, record in batch:
+            try:
+                self._deliver(record)
+            except PERMANENT_ERRORS as e:
+                self._dead_letter(raw, record, e)
+            except Exception as e:
+                self._disconnect()
+                self._schedule_retry(raw, record, e)
+            else:
+                self.redis.lrem(self.processing_key, 1, raw)
+
+    def _deliver(self, record):
+        from flask_mail import Message
+
+        msg = Message(
+            record["subject"],
+            recipients=[record["to"]],
+            html=record["html"],
+            sender=record["sender"],
+        )
+        attributes = {"mail.attempt": record["attempts"] + 1}
+        with tracing.span("smtp.send", attributes, parent=record.get("trace")):
+            try:
+                self._connect().send(msg)
+            except smtplib.SMTPServerDisconnected:
+                # The server dropped our idle connection; reconnect once and resend
+                self._disconnect()
+                self._connect().send(msg)
+        self._last_used = time.monotonic()
+
+    def _schedule_retry(self, raw, record, error):
+        record["attempts"] += 1
+        if record["attempts"] >= self.app.config["MAIL_QUEUE_MAX_ATTEMPTS"]:
+            self._dead_letter(raw, record, error)
+            return
+        delay = min(
+            self.app.config["MAIL_QUEUE_BACKOFF"] * 2 ** (record["attempts"] - 1),
+            self.app.config["MAIL_QUEUE_MAX_BACKOFF"],
+        )
+        record["last_error"] = str(error)
+        # Scheduled and taken off the processing list together
+        pipe = self.redis.pipeline()
+        pipe.zadd(RETRY_KEY, {json.dumps(record): time.time() + delay})
+        pipe.lrem(self.processing_key, 1, raw)
+        pipe.execute()
+        log.warning("Mail failed, will retry: %s", error, extra={"to": record["to"], "retry_in": round(delay)})
+
+    def _dead_letter(self, raw, record, error):
+        record["last_error"] = str(error)
+        pipe = self.redis.pipeline()
+        pipe.lpush(DEAD_KEY, json.dumps(record))
+        pipe.lrem(self.processing_key, 1, raw)
+        pipe.execute()
+        log.error("Mail dropped: %s", error, extra={"to": record["to"], "attempts": record["attempts"]})
+
+    def _dead_letter_raw(self, raw):
+        pipe = self.redis.pipeline()
+        pipe.lpush(DEAD_KEY, raw)
+        pipe.lrem(self.processing_key, 1, raw)
+        pipe.execute()
+        log.error("Mail dropped: not a mail record", extra={"record": raw[:200]})
+
+    # === Persistent SMTP connection ===
+    def _connect(self):
+        if self._connection is None:
+            if self.mail is None:
+                from flask_mail import Mail
+                self.mail = Mail(self.app)
+            # Entered by hand so the connection outlives a single batch
+            self._connection = self.mail.connect().__enter__()
+        return self._connection
+
+    def _disconnect(self):
+        if self._connection is None:
+            return
+        try:
+            self._connection.__exit__(None, None, None)
+        except Exception:
+            pass
+        self._connection = None
+
+    def _close_if_idle(self):
+        idle = time.monotonic() - self._last_used
+        if self._connection is not None and idle > self.app.config["MAIL_QUEUE_IDLE_TIMEOUT"]:
+            self._disconnect()
+
+
+def _decode(raw):
+    """The record in ``raw``, or None if it is not one enqueue() could have written."""
+    try:
+        record = json.loads(raw)
+    except ValueError:  # includes UnicodeDecodeError
+        return None
+    if not isinstance(record, dict) or any(field not in record for field in RECORD_FIELDS):
+        return None
+    if not isinstance(record["attempts"], int):
+        return None
+    return record
@@ -0,0 +1,224 @@
+# metrics.py
+import hmac
+import inspect
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+# Finer buckets at the low end: Redis/DB calls are sub-millisecond to a few ms
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+# OpenStack calls and provisioning steps take from tens of ms to minutes
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Flask request latency",
+    ["method", "route", "status"],
+)
+OPENSTACK_LATENCY = Histogram(
+    "openstack_call_duration_seconds", "OpenStack SDK call latency",
+    ["service", "operation"], buckets=SLOW_BUCKETS,
+)
+OPENSTACK_ERRORS = Counter(
+    "openstack_call_errors_total", "OpenStack SDK calls that raised",
+    ["service", "operation", "error"],
+)
+REDIS_LATENCY = Histogram(
+    "redis_command_duration_seconds", "Redis command latency",
+    ["command"], buckets=FAST_BUCKETS,
+)
+DB_LATENCY = Histogram(
+    "db_query_duration_seconds", "SQL statement latency",
+    ["statement"], buckets=FAST_BUCKETS,
+)
+PROVISION_STEP = Histogram(
+    "provision_step_duration_seconds", "Duration of each cloud provisioning step",
+    ["step"], buckets=SLOW_BUCKETS,
+)
+PROVISION_FAILURES = Counter(
+    "provision_step_failures_total", "Cloud provisioning steps that failed",
+    ["step"],
+)
+REAPER_TICK = Histogram(
+    "reaper_tick_duration_seconds", "Duration of one pass of the instance reaper",
+    buckets=SLOW_BUCKETS,
+)
+REAPER_STOPPED = Counter("reaper_instances_stopped_total", "Instances stopped by the reaper")
+REAPER_ERRORS = Counter("reaper_errors_total", "Reaper passes or stops that failed")
+
+
+def init_app(app):
+    """Time every request and serve the registry at ``/metrics``.
+
+    Set ``METRICS_TOKEN`` to require ``Authorization: Bearer <token>`` from
+    the scraper. Under a pre-forking server set ``PROMETHEUS_MULTIPROC_DIR``
+    so every worker's samples are aggregated.
+    """
+    token = os.getenv("METRICS_TOKEN")
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_latency(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            # The route template ("/instances/<instance_id>") keeps label cardinality bounded
+            route = request.url_rule.rule if request.url_rule else "<unmatched>"
+            REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(
+                time.perf_counter() - start
+            )
+        return response
+
+    def metrics_view():
+        if token:
+            supplied = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(supplied, f"Bearer {token}"):
+                return Response("unauthorized\n", status=401)
+        registry = REGISTRY
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+
+
+# === OpenStack ===
+SERVICES = ("identity", "compute", "network", "image", "block_storage", "object_store", "load_balancer")
+
+
+class InstrumentedConnection:
+    """Wrap an ``openstack.connection.Connection`` so service proxy calls are timed.
+
+    ``conn.network.create_network(...)`` is recorded as service ``network``,
+    operation ``create_network``. Listing calls return generators; those are
+    timed until the caller finishes iterating, which is when the API pages
+    are actually fetched.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._proxies = {}
+
+    def __getattr__(self, name):
+        if name in SERVICES:
+            proxy = self._proxies.get(name)
+            if proxy is None:
+                proxy = self._proxies[name] = _TimedProxy(name, getattr(self._conn, name))
+            return proxy
+        return getattr(self._conn, name)
+
+
+class _TimedProxy:
+    def __init__(self, service, proxy):
+        self._service = service
+        self._proxy = proxy
+
+    def __getattr__(self, name):
+        attr = getattr(self._proxy, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        return _timed_call(self._service, name, attr)
+
+
+def _timed_call(service, operation, fn):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            OPENSTACK_ERRORS.labels(service, operation, type(e).__name__).inc()
+            OPENSTACK_LATENCY.labels(service, operation).observe(time.perf_counter() - start)
+            raise
+        if inspect.isgenerator(result):
+            return _timed_iter(service, operation, result, start)
+        OPENSTACK_LATENCY.labels(service, operation).observe(time.perf_counter() - start)
+        return result
+    return wrapper
+
+
+def _timed_iter(service, operation, iterator, start):
+    try:
+        yield from iterator
+    except Exception as e:
+        OPENSTACK_ERRORS.labels(service, operation, type(e).__name__).inc()
+        raise
+    finally:
+        OPENSTACK_LATENCY.labels(service, operation).observe(time.perf_counter() - start)
+
+
+def instrument_connection(conn):
+    if isinstance(conn, InstrumentedConnection):
+        return conn
+    return InstrumentedConnection(conn)
+
+
+# === Redis and SQL ===
+def instrument_redis(client):
+    """Time commands and pipelines issued through ``client`` (and Flask-Session, which shares it)."""
+    execute_command = client.execute_command
+    make_pipeline = client.pipeline
+
+    def timed_execute_command(*args, **options):
+        start = time.perf_counter()
+        try:
+            return execute_command(*args, **options)
+        finally:
+            REDIS_LATENCY.labels(str(args[0]).upper()).observe(time.perf_counter() - start)
+
+    def timed_pipeline(*args, **kwargs):
+        pipe = make_pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def timed_execute(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return execute(*a, **kw)
+            finally:
+                REDIS_LATENCY.labels("PIPELINE").observe(time.perf_counter() - start)
+
+        pipe.execute = timed_execute
+        return pipe
+
+    client.execute_command = timed_execute_command
+    client.pipeline = timed_pipeline
+    return client
+
+
+def instrument_engine(engine):
+    """Time every SQL statement run on a SQLAlchemy engine, labelled by its verb."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["metrics_start"].pop()
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_LATENCY.labels(verb).observe(time.perf_counter() - start)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        if context.connection is not None and context.connection.info.get("metrics_start"):
+            context.connection.info["metrics_start"].pop()
+
+
+# === Provisioning and reaper ===
+@contextmanager
+def provision_step(step):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        PROVISION_FAILURES.labels(step).inc()
+        raise
+    finally:
+        PROVISION_STEP.labels(step).observe(time.perf_counter() - start)
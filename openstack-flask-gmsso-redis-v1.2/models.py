@@ -0,0 +1,29 @@
+# models.py
+from flask_dance.consumer.storage.sqla import OAuthConsumerMixin
+from flask_login import UserMixin
+
+from extensions import db
+
+
+class User(db.Model, UserMixin):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(256), unique=True, nullable=True)
+    email = db.Column(db.String(256), unique=True, nullable=False)
+    name = db.Column(db.String(256), nullable=True)
+    profile_pic = db.Column(db.String(256), nullable=True)
+    password = db.Column(db.String(256), nullable=True)
+    confirmed = db.Column(db.Boolean, default=False)
+    reset_token = db.Column(db.String(256), nullable=True)
+
+    # OpenStack Integration
+    openstack_user_id = db.Column(db.String(128), nullable=True)
+    openstack_project_id = db.Column(db.String(128), nullable=True)
+    openstack_network_id = db.Column(db.String(128), nullable=True)
+    openstack_subnet_id = db.Column(db.String(128), nullable=True)
+    openstack_router_id = db.Column(db.String(128), nullable=True)
+
+
+class OAuth(OAuthConsumerMixin, db.Model):
+    provider_user_id = db.Column(db.String(256), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey(User.id), nullable=False)
+    user = db.relationship(User, backref=db.backref("oauth", cascade="all, delete-orphan"))
@@ -0,0 +1,314 @@
+# oauth_tokens.py
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from flask_dance.consumer.storage import BaseStorage
+
+from cache import TTLCache
+
+log = logging.getLogger("oauth_tokens")
+
+# Redis keys
+SCHEDULE_KEY = "oauth:refresh"  # zset member "provider:user_id", score = when to refresh
+
+
+class RefreshRejected(Exception):
+    """The provider refused the refresh token (revoked, expired or reused)."""
+
+
+class OAuthTokenStore:
+    """Google/Keycloak OAuth tokens: encrypted at rest, cached, refreshed ahead of expiry.
+
+    The ``OAuth.token`` column only holds ``{"ciphertext": ..., "expires_at": ...}``.
+    Reads go through an in-process LRU, then Redis (which also only holds
+    ciphertext), then the database. A background thread renews access tokens
+    ``OAUTH_REFRESH_MARGIN`` seconds before they expire, so code that calls a
+    provider API on a user's request always finds a valid token and never
+    waits on a refresh. A worker's LRU may hand out the previous token for up
+    to ``OAUTH_TOKEN_LOCAL_TTL`` seconds after a refresh; it is still valid.
+    """
+
+    def __init__(self, app=None, db=None, model=None, redis_client=None):
+        self.app = None
+        self.db = db
+        self.model = model
+        self.redis = redis_client
+        self.providers = {}
+        self.cache = TTLCache()
+        self._thread = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app, db, model, redis_client)
+
+    def init_app(self, app, db=None, model=None, redis_client=None):
+        self.app = app
+        self.db = db or self.db
+        self.model = model or self.model
+        self.redis = redis_client or self.redis
+        self.fernet = load_fernet(app.secret_key)
+        self.local_ttl = float(os.getenv("OAUTH_TOKEN_LOCAL_TTL", 30))
+        self.cache_ttl = int(os.getenv("OAUTH_TOKEN_CACHE_TTL", 3600))
+        self.margin = int(os.getenv("OAUTH_REFRESH_MARGIN", 300))
+        self.interval = float(os.getenv("OAUTH_REFRESH_INTERVAL", 30))
+        self.retry_delay = int(os.getenv("OAUTH_REFRESH_RETRY", 60))
+        self.cache = TTLCache(int(os.getenv("OAUTH_TOKEN_CACHE_SIZE", 10000)))
+        app.extensions["oauth_tokens"] = self
+
+    def register_provider(self, name, token_url, client_id, client_secret):
+        """``token_url`` may be a callable, e.g. to read it from discovery metadata."""
+        self.providers[name] = {
+            "token_url": token_url,
+            "client_id": client_id,
+            "client_secret": client_secret,
+        }
+
+    def storage(self, user):
+        """Flask-Dance storage backed by this store (replaces ``SQLAlchemyStorage``)."""
+        return CachedTokenStorage(self, user)
+
+    # === Encryption ===
+    def seal(self, token):
+        ciphertext = self.fernet.encrypt(json.dumps(token).encode()).decode()
+        return {"ciphertext": ciphertext, "expires_at": expires_at(token)}
+
+    def unseal(self, stored):
+        if not stored:
+            return None
+        if "ciphertext" not in stored:
+            return dict(stored)  # written before encryption; sealed on next save
+        try:
+            return json.loads(self.fernet.decrypt(stored["ciphertext"].encode()))
+        except InvalidToken:
+            log.warning("OAuth token could not be decrypted (OAUTH_TOKEN_KEYS changed?)")
+            return None
+
+    # === Reads and writes ===
+    def get(self, provider, user_id):
+        key = (provider, str(user_id))
+        token = self.cache.get(key)
+        if token is not None:
+            return token
+        stored = self._from_redis(provider, user_id)
+        if stored is None:
+            row = self._row(provider, user_id)
+            stored = row.token if row else None
+            if stored:
+                self._to_redis(provider, user_id, stored)
+        token = self.unseal(stored)
+        if token is not None:
+            self.cache.set(key, token, self.local_ttl)
+        return token
+
+    def save(self, oauth, token):
+        """Encrypt ``token`` into the ``OAuth`` row and schedule its refresh; the caller commits."""
+        user_id = oauth.user_id or oauth.user.id
+        stored = self.seal(token)
+        oauth.token = stored
+        self.cache.set((oauth.provider, str(user_id)), token, self.local_ttl)
+        self._to_redis(oauth.provider, user_id, stored)
+        self._schedule(oauth.provider, user_id, token)
+
+    def forget(self, provider, user_id):
+        self.cache.pop((provider, str(user_id)))
+        try:
+            pipe = self.redis.pipeline()
+            pipe.delete(cache_key(provider, user_id))
+            pipe.zrem(SCHEDULE_KEY, schedule_member(provider, user_id))
+            pipe.execute()
+        except Exception as e:
+            log.warning("OAuth token cache: Redis unavailable: %s", e)
+
+    def _row(self, provider, user_id):
+        return self.model.query.filter_by(provider=provider, user_id=int(user_id)).first()
+
+    def _from_redis(self, provider, user_id):
+        try:
+            raw = self.redis.get(cache_key(provider, user_id))
+        except Exception as e:
+            log.warning("OAuth token cache: Redis unavailable: %s", e)
+            return None
+        return json.loads(raw) if raw else None
+
+    def _to_redis(self, provider, user_id, stored):
+        ttl = self.cache_ttl
+        if stored.get("expires_at"):
+            ttl = max(1, min(ttl, int(stored["expires_at"] - time.time())))
+        try:
+            self.redis.set(cache_key(provider, user_id), json.dumps(stored), ex=ttl)
+        except Exception as e:
+            log.warning("OAuth token cache: could not store token: %s", e)
+
+    def _schedule(self, provider, user_id, token, when=None):
+        if provider not in self.providers or not token.get("refresh_token"):
+            return
+        if when is None:
+            expiry = expires_at(token)
+            if expiry is None:
+                return
+            when = expiry - self.margin
+        try:
+            self.redis.zadd(SCHEDULE_KEY, {schedule_member(provider, user_id): when})
+        except Exception as e:
+            log.warning("OAuth refresh not scheduled: %s", e)
+
+    # === Background refresher ===
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="oauth-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def run(self):
+        with self.app.app_context():
+            scheduled = False
+            while not self._stop.is_set():
+                try:
+                    if not scheduled:
+                        self.schedule_existing()
+                        scheduled = True
+                    self.refresh_due()
+                except Exception as e:
+                    log.exception("OAuth refresher error")
+                finally:
+                    self.db.session.remove()
+                self._stop.wait(self.interval)
+
+    def schedule_existing(self):
+        """Encrypt rows saved before this store existed and schedule any unscheduled refreshes."""
+        for row in self.model.query.filter(self.model.token.isnot(None)):
+            token = self.unseal(row.token)
+            if not token:
+                continue
+            if "ciphertext" not in row.token:
+                self.save(row, token)
+            elif not self.redis.zscore(SCHEDULE_KEY, schedule_member(row.provider, row.user_id)):
+                self._schedule(row.provider, row.user_id, token)
+        self.db.session.commit()
+
+    def refresh_due(self):
+        due = self.redis.zrangebyscore(SCHEDULE_KEY, "-inf", time.time(), start=0, num=50)
+        for member in due:
+            member = member.decode() if isinstance(member, bytes) else member
+            # One worker per token: the lock outlives a slow provider round-trip
+            if not self.redis.set(f"oauth:refresh-lock:{member}", "1", nx=True, ex=60):
+                continue
+            provider, user_id = member.split(":", 1)
+            try:
+                self.refresh(provider, user_id)
+            except RefreshRejected as e:
+                log.warning("OAuth refresh rejected, user must sign in again: %s", e,
+                            extra={"provider": provider, "user_id": user_id})
+                self.redis.zrem(SCHEDULE_KEY, member)
+            except Exception as e:
+                log.warning("OAuth refresh failed, retrying: %s", e, extra={"provider": provider, "user_id": user_id})
+                self.db.session.rollback()
+                self.redis.zadd(SCHEDULE_KEY, {member: time.time() + self.retry_delay})
+
+    def refresh(self, provider, user_id):
+        row = self._row(provider, user_id)
+        token = self.unseal(row.token) if row else None
+        if not token or not token.get("refresh_token"):
+            self.redis.zrem(SCHEDULE_KEY, schedule_member(provider, user_id))
+            return None
+        config = self.providers[provider]
+        token_url = config["token_url"]() if callable(config["token_url"]) else config["token_url"]
+        resp = requests.post(
+            token_url,
+            data={
+                "grant_type": "refresh_token",
+                "refresh_token": token["refresh_token"],
+                "client_id": config["client_id"],
+                "client_secret": config["client_secret"],
+            },
+            timeout=10,
+        )
+        if resp.status_code in (400, 401):
+            raise RefreshRejected(resp.text[:200])
+        resp.raise_for_status()
+        fresh = resp.json()
+        fresh.setdefault("expires_at", int(time.time()) + int(fresh.get("expires_in", 3600)))
+        # Google only sends a refresh token once; keep the one we have
+        token = {**token, **fresh}
+        self.save(row, token)
+        self.db.session.commit()
+        return token
+
+
+class CachedTokenStorage(BaseStorage):
+    """Flask-Dance token storage that reads through ``OAuthTokenStore``."""
+
+    def __init__(self, store, user):
+        self.store = store
+        self.user = user
+
+    def _user_id(self):
+        user = self.user() if callable(self.user) else self.user
+        if user is None or not getattr(user, "is_authenticated", False):
+            return None
+        return user.id
+
+    def get(self, blueprint):
+        user_id = self._user_id()
+        if user_id is None:
+            return None
+        return self.store.get(blueprint.name, user_id)
+
+    def set(self, blueprint, token):
+        user_id = self._user_id()
+        row = self.store._row(blueprint.name, user_id) if user_id is not None else None
+        if row is None:
+            return  # rows are created by the oauth_authorized handler
+        self.store.save(row, token)
+        self.store.db.session.commit()
+
+    def delete(self, blueprint):
+        user_id = self._user_id()
+        if user_id is None:
+            return
+        row = self.store._row(blueprint.name, user_id)
+        if row is not None:
+            row.token = None
+            self.store.db.session.commit()
+        self.store.forget(blueprint.name, user_id)
+
+
+def load_fernet(secret_key):
+    """Keys from ``OAUTH_TOKEN_KEYS`` (comma separated, newest first), else derived from SECRET_KEY.
+
+    Listing the old key after a new one lets existing tokens decrypt while
+    every save re-encrypts with the new key.
+    """
+    keys = [k.strip() for k in os.getenv("OAUTH_TOKEN_KEYS", "").split(",") if k.strip()]
+    if not keys:
+        digest = hashlib.sha256(b"oauth-tokens:" + str(secret_key).encode()).digest()
+        keys = [base64.urlsafe_b64encode(digest).decode()]
+    return MultiFernet([Fernet(k) for k in keys])
+
+
+def expires_at(token):
+    if token.get("expires_at"):
+        return int(token["expires_at"])
+    if token.get("expires_in"):
+        return int(time.time()) + int(token["expires_in"])
+    return None
+
+
+def cache_key(provider, user_id):
+    return f"oauth:token:{provider}:{user_id}"
+
+
+def schedule_member(provider, user_id):
+    return f"{provider}:{user_id}"
@@ -0,0 +1,155 @@
+# passwords.py
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+)
+
+try:
+    from argon2 import PasswordHasher as Argon2Hasher
+    from argon2.exceptions import VerifyMismatchError, InvalidHash
+except ImportError:
+    Argon2Hasher = None
+
+log = logging.getLogger("passwords")
+
+DEFAULT_METHOD = "pbkdf2:sha256:600000"
+
+class PasswordHasherBusy(Exception):
+    """All hashing workers are busy and the wait queue is full."""
+
+
+# === Worker-side functions (run inside the process pool) ===
+def _argon2(params):
+    if Argon2Hasher is None:
+        raise RuntimeError("argon2-cffi is not installed")
+    return Argon2Hasher(**params)
+
+
+def _hash(password, method, argon2_params):
+    if method == "argon2":
+        return _argon2(argon2_params).hash(password)
+    return generate_password_hash(password, method=method)
+
+
+def _verify(stored, password, argon2_params):
+    if stored.startswith("$argon2"):
+        try:
+            return _argon2(argon2_params).verify(stored, password)
+        except (VerifyMismatchError, InvalidHash):
+            return False
+    return check_password_hash(stored, password)
+
+
+def normalize_method(method):
+    """Expand a Werkzeug method the way it is written into the stored hash."""
+    parts = method.split(":")
+    if parts[0] == "pbkdf2":
+        hash_name = parts[1] if len(parts) > 1 else "sha256"
+        iterations = parts[2] if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    if parts[0] == "scrypt":
+        n, r, p = (parts[1:] + ["32768", "8", "1"][len(parts) - 1:])[:3]
+        return f"scrypt:{n}:{r}:{p}"
+    return method
+
+
+class PasswordHasher:
+    """Run password hashing in a dedicated process pool.
+
+    PBKDF2/scrypt/argon2 hold the GIL for tens of milliseconds, so doing them
+    on the request thread stalls every other request in the worker. Hashes
+    are sent to a small process pool instead. At most ``max_pending`` hashes
+    are queued; beyond that callers wait up to ``queue_timeout`` seconds and
+    then get ``PasswordHasherBusy``.
+
+    ``PASSWORD_HASH_METHOD`` is any Werkzeug method (``pbkdf2:sha256:600000``,
+    ``scrypt:32768:8:1``) or ``argon2``. Hashes made with an older method are
+    upgraded on the next successful login (see ``needs_rehash``). If
+    ``argon2`` is configured but argon2-cffi is not installed, the default
+    method is used instead and a warning is logged at startup.
+    """
+
+    def __init__(self, app=None):
+        self.method = DEFAULT_METHOD
+        self.argon2_params = {}
+        self.workers = 2
+        self.queue_timeout = 5.0
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._prefix = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = os.getenv("PASSWORD_HASH_METHOD", self.method)
+        if self.method == "argon2" and Argon2Hasher is None:
+            log.warning(
+                "PASSWORD_HASH_METHOD=argon2 but argon2-cffi is not installed; using the default",
+                extra={"method": DEFAULT_METHOD},
+            )
+            self.method = DEFAULT_METHOD
+        self.argon2_params = {
+            "time_cost": int(os.getenv("PASSWORD_ARGON2_TIME_COST", 3)),
+            "memory_cost": int(os.getenv("PASSWORD_ARGON2_MEMORY_COST", 65536)),
+            "parallelism": int(os.getenv("PASSWORD_ARGON2_PARALLELISM", 1)),
+        }
+        self.workers = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+        max_pending = int(os.getenv("PASSWORD_HASH_MAX_PENDING", self.workers * 8))
+        self.queue_timeout = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", 5))
+        self._slots = threading.BoundedSemaphore(max_pending)
+        if self.method != "argon2":
+            self._prefix = normalize_method(self.method)
+        app.extensions["password_hasher"] = self
+
+    # === Pool management ===
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # forkserver/spawn: never fork a process that already runs threads
+                    methods = multiprocessing.get_all_start_methods()
+                    context = multiprocessing.get_context(
+                        "forkserver" if "forkserver" in methods else "spawn"
+                    )
+                    self._executor = ProcessPoolExecutor(self.workers, mp_context=context)
+        return self._executor
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise PasswordHasherBusy("Password hashing queue is full")
+        try:
+            future = self._pool().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # === Public API ===
+    def hash(self, password):
+        return self._run(_hash, password, self.method, self.argon2_params)
+
+    def verify(self, stored, password):
+        if not stored:
+            return False
+        return self._run(_verify, stored, password, self.argon2_params)
+
+    def needs_rehash(self, stored):
+        if self.method == "argon2":
+            if not stored.startswith("$argon2"):
+                return True
+            return _argon2(self.argon2_params).check_needs_rehash(stored)
+        return stored.split("$", 1)[0] != self._prefix
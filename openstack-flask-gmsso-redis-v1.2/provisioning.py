@@ -0,0 +1,192 @@
+# provisioning.py
+#
+# Cloud provisioning for new accounts: a Keystone project and user, and a
+# private network, subnet and router in Neutron. It runs in the web process,
+# or in a separate provisioning tier (create_app(["provisioning"])) that the
+# web tier calls when PROVISIONING_URL is set.
+import hmac
+import logging
+import os
+
+import requests
+from flask import Blueprint, current_app, jsonify, request
+
+import metrics
+import tracing
+from extensions import db
+from models import User
+
+log = logging.getLogger("provisioning")
+
+provisioning_bp = Blueprint("provisioning", __name__)
+
+
+class ProvisioningError(Exception):
+    pass
+
+
+def provision(user):
+    """Create ``user``'s cloud resources, in this process or in the provisioning tier.
+
+    On failure nothing of ``user`` is left in the database and the error is raised.
+    """
+    url = current_app.config["PROVISIONING_URL"]
+    if not url:
+        create_openstack_resources(user)
+        return
+
+    # The provisioning tier reads the user from the database
+    db.session.commit()
+    headers = tracing.inject()
+    if current_app.config["PROVISIONING_API_KEY"]:
+        headers["X-Provisioning-Key"] = current_app.config["PROVISIONING_API_KEY"]
+    try:
+        response = requests.post(
+            f"{url.rstrip('/')}/internal/provision/{user.id}",
+            headers=headers, timeout=current_app.config["PROVISIONING_TIMEOUT"],
+        )
+        if response.status_code != 200:
+            error = response.json().get("error") if response.content else None
+            raise ProvisioningError(error or f"provisioning service returned {response.status_code}")
+    except Exception:
+        db.session.delete(user)
+        db.session.commit()
+        raise
+    db.session.refresh(user)
+
+
+# Create OpenStack User, Project, Network, Subnet, Router
+def create_openstack_resources(user):
+    if user.openstack_project_id and user.openstack_user_id:
+        return  # Already created
+
+    try:
+        # Imported here: openstacksdk adds ~0.3 s and ~30 MB to startup, and only signups need it
+        import openstack
+
+        # Connect as admin using clouds.yaml
+        conn = tracing.trace_connection(metrics.instrument_connection(openstack.connect(cloud='openstack')))
+
+        # === 1. Create Project ===
+        project_name = f"project_{user.id}"
+        with metrics.provision_step("project"):
+            project = conn.identity.create_project(
+                name=project_name,
+                description=f"Project for {user.email}",
+                domain="default"
+            )
+
+        # === 2. Create User ===
+        with metrics.provision_step("user"):
+            os_user = conn.identity.create_user(
+                name=user.email,
+                email=user.email,
+                password=os.urandom(12).hex(),
+                domain="default"
+            )
+
+            # Set as default project
+            conn.identity.update_user(os_user.id, default_project_id=project.id)
+
+        # === 3. Assign Roles ===
+        with metrics.provision_step("roles"):
+            member_role = conn.identity.find_role("member")
+            if not member_role:
+                member_role = conn.identity.create_role(name="member")
+
+            admin_role = conn.identity.find_role("admin")
+
+            conn.identity.assign_project_role_to_user(project.id, os_user.id, member_role.id)
+
+            # Add default admin as admin of this project
+            admin_user = conn.identity.find_user("admin", domain_id="default")
+            if admin_user and admin_role:
+                conn.identity.assign_project_role_to_user(project.id, admin_user.id, admin_role.id)
+
+        # === 4. Create Network ===
+        network_name = f"{project_name}-private"
+        with metrics.provision_step("network"):
+            network = conn.network.create_network(
+                name=network_name,
+                project_id=project.id
+            )
+        log.info("Network created", extra={"project_id": project.id, "network_id": network.id, "network": network_name})
+
+        # === 5. Create Subnet ===
+        subnet_name = f"{project_name}-subnet"
+        with metrics.provision_step("subnet"):
+            subnet = conn.network.create_subnet(
+                name=subnet_name,
+                network_id=network.id,
+                ip_version=4,
+                cidr="10.0.0.0/24",
+                gateway_ip="10.0.0.1",
+                project_id=project.id
+            )
+        log.info("Subnet created", extra={"project_id": project.id, "subnet_id": subnet.id, "subnet": subnet_name})
+
+        # === 6. Create Router & Attach External Gateway ===
+        router_name = f"{project_name}-router"
+
+        with metrics.provision_step("router"):
+            # 🔍 Find 'public' network by name
+            public_network = conn.network.find_network("public")
+            if not public_network:
+                raise Exception("External network 'public' not found in OpenStack")
+
+            router = conn.network.create_router(
+                name=router_name,
+                external_gateway_info={"network_id": public_network.id},  # ✅ Use ID
+                project_id=project.id
+            )
+        log.info("Router created", extra={"project_id": project.id, "router_id": router.id, "router": router_name})
+
+        # === 7. Add Router Interface ===
+        with metrics.provision_step("router_interface"):
+            conn.network.add_interface_to_router(
+                router, subnet_id=subnet.id
+            )
+        log.info("Interface added to router", extra={"router_id": router.id, "subnet_id": subnet.id})
+
+        # === 8. Save IDs in database ===
+        with metrics.provision_step("save"):
+            user.openstack_user_id = os_user.id
+            user.openstack_project_id = project.id
+            user.openstack_network_id = network.id
+            user.openstack_subnet_id = subnet.id
+            user.openstack_router_id = router.id
+            db.session.commit()
+
+        log.info("OpenStack setup complete", extra={
+            "user_id": user.id, "project_id": project.id, "openstack_user_id": os_user.id,
+        })
+
+    except Exception as e:
+        log.exception("OpenStack setup failed", extra={"user_id": user.id})
+        db.session.rollback()
+        raise e
+
+
+# === Endpoint (provisioning tier) ===
+@provisioning_bp.route("/internal/provision/<int:user_id>", methods=["POST"])
+def provision_user(user_id):
+    api_key = current_app.config["PROVISIONING_API_KEY"]
+    if api_key:
+        supplied = request.headers.get("X-Provisioning-Key", "")
+        if not hmac.compare_digest(supplied, api_key):
+            return jsonify({"error": "unauthorized"}), 401
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        return jsonify({"error": "user not found"}), 404
+    try:
+        create_openstack_resources(user)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 502
+    return jsonify({
+        "openstack_user_id": user.openstack_user_id,
+        "openstack_project_id": user.openstack_project_id,
+        "openstack_network_id": user.openstack_network_id,
+        "openstack_subnet_id": user.openstack_subnet_id,
+        "openstack_router_id": user.openstack_router_id,
+    })
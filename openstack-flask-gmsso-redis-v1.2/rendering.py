@@ -0,0 +1,129 @@
+# rendering.py
+import logging
+import os
+import threading
+import time
+
+from flask import before_render_template, template_rendered
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+log = logging.getLogger("rendering")
+
+
+class FragmentCacheExtension(Extension):
+    """Cache the output of a template block in process memory.
+
+    Usage::
+
+        {% cache "sidebar3-aside" %} ... {% endcache %}
+        {% cache "footer", 300 %} ... {% endcache %}   {# expire after 300s #}
+
+    Only wrap markup that is the same for every user; anything that reads
+    ``current_user`` or request data must stay outside the block.
+    """
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache={}, fragment_cache_lock=threading.Lock())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(["name:endcache"], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_cache_support", args), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache_support(self, key, timeout, caller):
+        cache = self.environment.fragment_cache
+        entry = cache.get(key)
+        now = time.monotonic()
+        if entry is not None and (entry[1] is None or entry[1] > now):
+            return entry[0]
+        rv = caller()
+        expires = now + timeout if timeout else None
+        with self.environment.fragment_cache_lock:
+            cache[key] = (rv, expires)
+        return rv
+
+
+class RenderStats:
+    """Per-template render-time instrumentation.
+
+    Hooks Flask's ``before_render_template`` / ``template_rendered`` signals
+    and keeps count, total and max render time for every template name.
+    Renders slower than ``TEMPLATE_SLOW_RENDER_MS`` are logged.
+    """
+
+    def __init__(self, slow_ms):
+        self.slow_ms = slow_ms
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _started(self, app, template, context, **extra):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(time.perf_counter())
+
+    def _finished(self, app, template, context, **extra):
+        stack = getattr(self._local, "stack", None)
+        if not stack:
+            return
+        elapsed_ms = (time.perf_counter() - stack.pop()) * 1000
+        name = template.name or "<string>"
+        with self._lock:
+            count, total, worst = self._stats.get(name, (0, 0.0, 0.0))
+            self._stats[name] = (count + 1, total + elapsed_ms, max(worst, elapsed_ms))
+        if elapsed_ms > self.slow_ms:
+            log.warning("Slow render", extra={"template": name, "ms": round(elapsed_ms, 1)})
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {
+                    "count": count,
+                    "total_ms": round(total, 3),
+                    "avg_ms": round(total / count, 3),
+                    "max_ms": round(worst, 3),
+                }
+                for name, (count, total, worst) in self._stats.items()
+            }
+
+
+def init_app(app):
+    """Attach bytecode caching, fragment caching and render timing to ``app``."""
+    cache_dir = os.getenv(
+        "JINJA_BYTECODE_CACHE_DIR", os.path.join(app.instance_path, "jinja_cache")
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+
+    env = app.jinja_env
+    env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    env.add_extension(FragmentCacheExtension)
+    # Templates only change on deploy; skip the mtime check on every render
+    env.auto_reload = app.debug or os.getenv("TEMPLATES_AUTO_RELOAD", "False").lower() in ["true", "1", "t"]
+
+    stats = RenderStats(float(os.getenv("TEMPLATE_SLOW_RENDER_MS", 50)))
+    before_render_template.connect(stats._started, app, weak=False)
+    template_rendered.connect(stats._finished, app, weak=False)
+    app.extensions["render_stats"] = stats
+    return stats
+
+
+def warm_templates(app, names):
+    """Compile the hottest templates at startup instead of on first request."""
+    for name in names:
+        app.jinja_env.get_template(name)
+
+
+def clear_fragment_cache(app):
+    app.jinja_env.fragment_cache.clear()
@@ -0,0 +1,158 @@
+# revocation.py
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import session
+
+log = logging.getLogger("revocation")
+
+CHANNEL = "revocations"
+LOG_KEY = "revocations:log"
+
+
+class RevocationBus:
+    """Fan out logout/password-reset revocations to every worker via Redis pub/sub.
+
+    Each worker keeps two small dicts in memory:
+
+    - revoked login ids (``session['auth_sid']`` / the token ``sid`` claim)
+    - per-user "revoked at" timestamps: anything issued before is invalid
+
+    ``is_revoked()`` only reads those dicts, so checking costs no network
+    call. Events are also kept in the ``revocations:log`` sorted set until
+    they expire, so a worker that starts (or reconnects) late replays what
+    it missed.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.redis = redis_client
+        self._sids = {}
+        self._users = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client=None):
+        self.redis = redis_client or self.redis
+        self.default_ttl = int(os.getenv(
+            "REVOCATION_TTL", max(int(app.permanent_session_lifetime.total_seconds()), 14 * 24 * 3600)
+        ))
+        app.before_request(self._check_session)
+        app.extensions["revocation_bus"] = self
+
+    # === Publishing ===
+    def publish(self, sid=None, session_id=None, user=None, ttl=None):
+        now = time.time()
+        event = {"sid": sid, "session": session_id, "user": str(user) if user else None, "at": now}
+        event["exp"] = now + (ttl or self.default_ttl)
+        self._apply(event)
+        payload = json.dumps(event)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.zadd(LOG_KEY, {payload: event["exp"]})
+            pipe.zremrangebyscore(LOG_KEY, "-inf", now)
+            pipe.publish(CHANNEL, payload)
+            pipe.execute()
+        except Exception as e:
+            log.warning("Revocation not broadcast, applied locally only: %s", e)
+
+    def revoke_login(self, sid, session_id=None, ttl=None):
+        self.publish(sid=sid, session_id=session_id, ttl=ttl)
+
+    def revoke_user(self, user_id, ttl=None):
+        self.publish(user=user_id, ttl=ttl)
+
+    def on_revoke(self, callback):
+        self._listeners.append(callback)
+        return callback
+
+    # === Checking (memory only) ===
+    def is_revoked(self, sid=None, user=None, issued_at=None):
+        self.ensure_listening()
+        now = time.time()
+        if sid:
+            exp = self._sids.get(sid)
+            if exp is not None and exp > now:
+                return True
+        if user is not None:
+            entry = self._users.get(str(user))
+            if entry is not None and entry[1] > now:
+                # Sessions/tokens without an issue time predate the revocation
+                return issued_at is None or issued_at < int(entry[0])
+        return False
+
+    def _check_session(self):
+        sid = session.get("auth_sid")
+        user = session.get("_user_id")
+        if (sid or user) and self.is_revoked(sid, user, session.get("auth_iat")):
+            session.clear()
+
+    # === Listening ===
+    def ensure_listening(self):
+        # One listener per process; also restarts after a fork (pre-forking servers)
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._listen, name="revocation-bus", daemon=True)
+            self._thread.start()
+
+    def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                # Subscribe before replaying so nothing falls in between
+                pubsub.subscribe(CHANNEL)
+                self._replay()
+                last_sweep = time.monotonic()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        self._apply(json.loads(message["data"]))
+                    if time.monotonic() - last_sweep > 60:
+                        self._sweep()
+                        last_sweep = time.monotonic()
+            except Exception as e:
+                log.warning("Revocation bus disconnected, retrying: %s", e)
+                time.sleep(2)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def _replay(self):
+        for payload in self.redis.zrangebyscore(LOG_KEY, time.time(), "+inf"):
+            self._apply(json.loads(payload))
+
+    def _apply(self, event):
+        if event.get("sid"):
+            self._sids[event["sid"]] = event["exp"]
+        if event.get("user"):
+            current = self._users.get(event["user"])
+            if current is None or current[0] < event["at"]:
+                self._users[event["user"]] = (event["at"], event["exp"])
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception:
+                log.exception("Revocation listener failed")
+
+    def _sweep(self):
+        now = time.time()
+        for sid, exp in list(self._sids.items()):
+            if exp <= now:
+                self._sids.pop(sid, None)
+        for user, (_, exp) in list(self._users.items()):
+            if exp <= now:
+                self._users.pop(user, None)
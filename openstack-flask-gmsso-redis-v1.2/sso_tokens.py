@@ -0,0 +1,297 @@
+# sso_tokens.py
+import hashlib
+import json
+import os
+import secrets
+import time
+import uuid
+
+import requests
+from authlib.jose import JsonWebKey, jwt
+from authlib.jose.errors import JoseError
+from flask import Blueprint, current_app, g, jsonify, request, session
+from flask_login import user_logged_in, user_logged_out
+
+ACCESS_COOKIE = "sso_access"
+REFRESH_COOKIE = "sso_refresh"
+
+sso_bp = Blueprint("sso", __name__)
+
+
+class InvalidToken(Exception):
+    """The token is malformed, has a bad signature, or is expired or revoked."""
+
+
+class TokenIssuer:
+    """Stateless JWT session mode for SSO with other services.
+
+    With ``SESSION_MODE=jwt`` every login (local, Google or Keycloak) also
+    issues a short-lived RS256 access token and an opaque refresh token.
+    Both are set as HttpOnly cookies. Downstream services fetch
+    ``/.well-known/jwks.json`` once and verify access tokens locally (see
+    ``TokenVerifier``), so they never call this service or Redis per request.
+
+    Refresh tokens are stored hashed in Redis and rotated on every use;
+    ``/logout`` revokes all refresh tokens of that login session. With a
+    ``RevocationBus`` attached, access tokens of a logged-out login (or of a
+    user whose password was reset) are rejected here before they expire.
+    """
+
+    def __init__(self, app=None, redis_client=None, revocations=None):
+        self.redis = redis_client
+        self.revocations = revocations
+        self.key = None
+        self._key_set = None
+        self.enabled = False
+        if app is not None:
+            self.init_app(app, redis_client, revocations)
+
+    def init_app(self, app, redis_client=None, revocations=None):
+        self.redis = redis_client or self.redis
+        self.revocations = revocations or self.revocations
+        self.enabled = os.getenv("SESSION_MODE", "redis").lower() == "jwt"
+        self.issuer = os.getenv("SSO_ISSUER", "paulco-auth")
+        self.audience = os.getenv("SSO_AUDIENCE", "paulco-services")
+        self.access_ttl = int(os.getenv("SSO_ACCESS_TTL", 300))
+        self.refresh_ttl = int(os.getenv("SSO_REFRESH_TTL", 14 * 24 * 3600))
+        self.cookie_secure = os.getenv("SSO_COOKIE_SECURE", "False").lower() in ["true", "1", "t"]
+        app.extensions["sso_tokens"] = self
+        if self.enabled:
+            # Other session modes load no signing key and serve no /token or JWKS routes
+            self.key = load_signing_key(
+                os.getenv("SSO_SIGNING_KEY_FILE", os.path.join(app.instance_path, "sso_signing_key.pem"))
+            )
+            app.register_blueprint(sso_bp)
+            user_logged_in.connect(self._on_login, app, weak=False)
+            user_logged_out.connect(self._on_logout, app, weak=False)
+            app.after_request(self._set_cookies)
+
+    # === Claims and signing ===
+    def jwks(self):
+        public = self.key.as_dict(is_private=False)
+        public.update(kid=self.key.thumbprint(), use="sig", alg="RS256")
+        return {"keys": [public]}
+
+    def claims_for(self, user, sid):
+        now = int(time.time())
+        return {
+            "iss": self.issuer,
+            "aud": self.audience,
+            "sub": str(user.id),
+            "email": user.email,
+            "name": getattr(user, "name", None) or getattr(user, "username", None),
+            "sid": sid,
+            "jti": uuid.uuid4().hex,
+            "iat": now,
+            "exp": now + self.access_ttl,
+        }
+
+    def sign(self, claims):
+        header = {"alg": "RS256", "kid": self.key.thumbprint(), "typ": "JWT"}
+        return jwt.encode(header, claims, self.key).decode()
+
+    # === Token pairs ===
+    def issue(self, user, sid=None):
+        sid = sid or uuid.uuid4().hex
+        claims = self.claims_for(user, sid)
+        refresh_token = secrets.token_urlsafe(32)
+        record = {k: claims[k] for k in ("sub", "email", "name", "sid", "iat")}
+        pipe = self.redis.pipeline()
+        pipe.set(refresh_key(refresh_token), json.dumps(record), ex=self.refresh_ttl)
+        pipe.sadd(session_key(sid), token_hash(refresh_token))
+        pipe.expire(session_key(sid), self.refresh_ttl)
+        pipe.execute()
+        return {
+            "access_token": self.sign(claims),
+            "refresh_token": refresh_token,
+            "token_type": "Bearer",
+            "expires_in": self.access_ttl,
+        }
+
+    def refresh(self, refresh_token):
+        # GETDEL makes rotation atomic: a refresh token works exactly once
+        raw = self.redis.getdel(refresh_key(refresh_token))
+        if not raw:
+            raise InvalidToken("Unknown or expired refresh token")
+        record = json.loads(raw)
+        self.redis.srem(session_key(record["sid"]), token_hash(refresh_token))
+        if self.revocations and self.revocations.is_revoked(record["sid"], record["sub"], record.get("iat")):
+            raise InvalidToken("Login was revoked")
+        return self.issue(_TokenUser(record), sid=record["sid"])
+
+    def revoke_session(self, sid):
+        hashes = self.redis.smembers(session_key(sid))
+        pipe = self.redis.pipeline()
+        for h in hashes:
+            pipe.delete(f"sso:refresh:{h.decode() if isinstance(h, bytes) else h}")
+        pipe.delete(session_key(sid))
+        pipe.execute()
+
+    # === Flask-Login hooks (all login paths call login_user) ===
+    def _on_login(self, app, user, **extra):
+        g.sso_tokens = self.issue(user, sid=login_session_id())
+
+    def _on_logout(self, app, user, **extra):
+        sid = session.get("auth_sid")
+        if sid:
+            self.revoke_session(sid)
+        g.sso_tokens = None
+
+    def _set_cookies(self, response):
+        if "sso_tokens" not in g:
+            return response
+        tokens = g.sso_tokens
+        if tokens is None:
+            response.delete_cookie(ACCESS_COOKIE)
+            response.delete_cookie(REFRESH_COOKIE, path="/token")
+            return response
+        response.set_cookie(
+            ACCESS_COOKIE, tokens["access_token"], max_age=self.access_ttl,
+            httponly=True, secure=self.cookie_secure, samesite="Lax",
+        )
+        response.set_cookie(
+            REFRESH_COOKIE, tokens["refresh_token"], max_age=self.refresh_ttl,
+            httponly=True, secure=self.cookie_secure, samesite="Strict", path="/token",
+        )
+        return response
+
+    def verify(self, token):
+        if self.key is None:
+            raise InvalidToken("SSO tokens are not enabled (SESSION_MODE is not jwt)")
+        if self._key_set is None:
+            self._key_set = JsonWebKey.import_key_set(self.jwks())
+        claims = verify_jwt(token, self._key_set, self.issuer, self.audience)
+        if self.revocations and self.revocations.is_revoked(claims.get("sid"), claims["sub"], claims.get("iat")):
+            raise InvalidToken("Login was revoked")
+        return claims
+
+
+class _TokenUser:
+    def __init__(self, record):
+        self.id = record["sub"]
+        self.email = record["email"]
+        self.name = record["name"]
+
+
+class TokenVerifier:
+    """Verify access tokens in a downstream service.
+
+    The JWKS is fetched once from the auth service and cached; an unknown
+    ``kid`` (key rotation) triggers one re-fetch.
+    """
+
+    def __init__(self, jwks_url, issuer="paulco-auth", audience="paulco-services", ttl=3600):
+        self.jwks_url = jwks_url
+        self.issuer = issuer
+        self.audience = audience
+        self.ttl = ttl
+        self._jwks = None
+        self._fetched_at = 0
+
+    def _keys(self, force=False):
+        if force or self._jwks is None or time.time() - self._fetched_at > self.ttl:
+            resp = requests.get(self.jwks_url, timeout=5)
+            resp.raise_for_status()
+            self._jwks = JsonWebKey.import_key_set(resp.json())
+            self._fetched_at = time.time()
+        return self._jwks
+
+    def verify(self, token):
+        try:
+            return verify_jwt(token, self._keys(), self.issuer, self.audience)
+        except InvalidToken as e:
+            if "kid" not in str(e):
+                raise
+            return verify_jwt(token, self._keys(force=True), self.issuer, self.audience)
+
+
+def verify_jwt(token, key_set, issuer, audience):
+    """Verify signature and standard claims; ``key_set`` is a JWKS dict or KeySet."""
+    if isinstance(key_set, dict):
+        key_set = JsonWebKey.import_key_set(key_set)
+    try:
+        claims = jwt.decode(
+            token,
+            key_set,
+            claims_options={
+                "iss": {"essential": True, "value": issuer},
+                "aud": {"essential": True, "value": audience},
+            },
+        )
+        claims.validate(leeway=30)
+    except ValueError as e:
+        raise InvalidToken(f"Unknown signing key (kid): {e}")
+    except JoseError as e:
+        raise InvalidToken(str(e))
+    return dict(claims)
+
+
+def load_signing_key(path):
+    """Load the RSA signing key, creating it once if it does not exist.
+
+    Every worker must sign with the same key, so the first one to start
+    writes the file with O_EXCL and the rest read it.
+    """
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        key = JsonWebKey.generate_key("RSA", 2048, is_private=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "wb") as f:
+                f.write(key.as_pem(is_private=True))
+            return key
+    with open(path, "rb") as f:
+        return JsonWebKey.import_key(f.read(), {"kty": "RSA"})
+
+
+def login_session_id():
+    """Id of the current login, shared by the Flask session and its SSO tokens."""
+    sid = session.get("auth_sid")
+    if not sid:
+        sid = session["auth_sid"] = uuid.uuid4().hex
+        session["auth_iat"] = int(time.time())
+    return sid
+
+
+def token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def refresh_key(token):
+    return f"sso:refresh:{token_hash(token)}"
+
+
+def session_key(sid):
+    return f"sso:session:{sid}"
+
+
+def bearer_token():
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Bearer "):
+        return header[7:]
+    return request.cookies.get(ACCESS_COOKIE)
+
+
+# === Endpoints ===
+@sso_bp.route("/.well-known/jwks.json")
+def jwks():
+    response = jsonify(current_app.extensions["sso_tokens"].jwks())
+    response.headers["Cache-Control"] = "public, max-age=3600"
+    return response
+
+
+@sso_bp.route("/token/refresh", methods=["POST"])
+def refresh_token():
+    issuer = current_app.extensions["sso_tokens"]
+    token = request.form.get("refresh_token") or request.cookies.get(REFRESH_COOKIE)
+    if not token:
+        return jsonify({"error": "invalid_request"}), 400
+    try:
+        tokens = issuer.refresh(token)
+    except InvalidToken:
+        return jsonify({"error": "invalid_grant"}), 401
+    g.sso_tokens = tokens
+    return jsonify(tokens)
@@ -0,0 +1,108 @@
+# tests/test_introspection.py
+import json
+
+import pytest
+from flask import Flask
+
+from introspection import INACTIVE, Introspector, session_record_key, user_sessions_key
+from revocation import RevocationBus
+from sso_tokens import TokenIssuer
+
+
+class User:
+    id = 7
+    email = "ada@example.com"
+    name = "Ada"
+
+
+def make(redis_client, monkeypatch, tmp_path, api_key="k3y"):
+    monkeypatch.setenv("SESSION_MODE", "jwt")
+    monkeypatch.setenv("SSO_SIGNING_KEY_FILE", str(tmp_path / "key.pem"))
+    monkeypatch.setenv("INTROSPECT_LOCAL_TTL", "60")
+    if api_key:
+        monkeypatch.setenv("INTROSPECT_API_KEY", api_key)
+    else:
+        monkeypatch.delenv("INTROSPECT_API_KEY", raising=False)
+    app = Flask(__name__)
+    app.secret_key = "test"
+    revocations = RevocationBus(app, redis_client)
+    monkeypatch.setattr(revocations, "ensure_listening", lambda: None)  # events are applied locally
+    issuer = TokenIssuer(app, redis_client, revocations)
+    return app, Introspector(app, redis_client, issuer, revocations)
+
+
+@pytest.fixture
+def setup(redis_client, monkeypatch, tmp_path):
+    return make(redis_client, monkeypatch, tmp_path)
+
+
+def login(redis_client, flask_sid, user_id=7, sid="login-1"):
+    record = {"active": True, "sub": str(user_id), "email": "ada@example.com", "name": "Ada", "sid": sid, "iat": 0}
+    redis_client.set(session_record_key(flask_sid), json.dumps(record))
+    redis_client.sadd(user_sessions_key(user_id), flask_sid)
+
+
+def test_session_is_answered_from_redis_then_the_lru(setup, redis_client):
+    _, introspector = setup
+    login(redis_client, "flask-1")
+
+    assert introspector.introspect_session("flask-1")["email"] == "ada@example.com"
+    redis_client.delete(session_record_key("flask-1"))
+    assert introspector.introspect_session("flask-1")["active"]  # from the LRU
+    assert introspector.introspect_session("unknown") == INACTIVE
+    assert introspector.introspect_session("") == INACTIVE
+
+
+def test_logout_on_the_bus_ends_the_session_at_once(setup, redis_client):
+    _, introspector = setup
+    login(redis_client, "flask-1")
+    introspector.introspect_session("flask-1")
+
+    introspector.revoke("flask-1", "login-1", 7)
+
+    assert introspector.introspect_session("flask-1") == INACTIVE
+    assert not redis_client.exists(session_record_key("flask-1"))
+
+
+def test_revoke_user_ends_every_session(setup, redis_client):
+    _, introspector = setup
+    login(redis_client, "flask-1", sid="login-1")
+    login(redis_client, "flask-2", sid="login-2")
+
+    introspector.revoke_user(7)
+
+    assert introspector.introspect_session("flask-1") == INACTIVE
+    assert introspector.introspect_session("flask-2") == INACTIVE
+    assert not redis_client.exists(user_sessions_key(7))
+
+
+def test_access_tokens_are_verified_and_revoked(setup):
+    _, introspector = setup
+    token = introspector.tokens.issue(User(), sid="login-1")["access_token"]
+
+    result = introspector.introspect_token(token)
+    assert (result["active"], result["sub"], result["sid"]) == (True, "7", "login-1")
+    assert introspector.introspect_token(token + "x") == INACTIVE
+
+    introspector.revocations.revoke_login("login-1")
+    assert introspector.introspect_token(token) == INACTIVE  # cached, but checked against the bus
+
+
+def test_endpoint_requires_the_api_key(setup, redis_client):
+    app, _ = setup
+    login(redis_client, "flask-1")
+    client = app.test_client()
+
+    assert client.post("/introspect", data={"session": "flask-1"}).status_code == 401
+    assert client.post("/introspect", data={"session": "flask-1"},
+                       headers={"X-Introspect-Key": "wrong"}).status_code == 401
+    response = client.post("/introspect", json={"session": "flask-1"}, headers={"X-Introspect-Key": "k3y"})
+    assert response.get_json()["sub"] == "7"
+    assert client.post("/introspect", data={}, headers={"X-Introspect-Key": "k3y"}).status_code == 400
+
+
+def test_endpoint_is_not_served_without_an_api_key(redis_client, monkeypatch, tmp_path):
+    app, _ = make(redis_client, monkeypatch, tmp_path, api_key=None)
+    login(redis_client, "flask-1")
+
+    assert app.test_client().post("/introspect", data={"session": "flask-1"}).status_code == 404
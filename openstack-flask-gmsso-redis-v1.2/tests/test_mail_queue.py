@@ -0,0 +1,142 @@
+# tests/test_mail_queue.py
+import json
+import smtplib
+import time
+
+import pytest
+from flask import Flask
+
+import mail_queue
+from mail_queue import DEAD_KEY, QUEUE_KEY, RETRY_KEY, SENDERS_KEY, MailQueue, heartbeat_key, processing_key
+
+
+class FakeMail:
+    """Flask-Mail's connect(), recording what is sent; ``failures`` are raised first, one per send."""
+
+    def __init__(self):
+        self.sent = []
+        self.failures = []
+
+    def connect(self):
+        mail = self
+
+        class Connection:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def send(self, msg):
+                if mail.failures:
+                    raise mail.failures.pop(0)
+                mail.sent.append(msg)
+
+        return Connection()
+
+
+@pytest.fixture
+def queue(redis_client):
+    app = Flask(__name__)
+    app.config.update(MAIL_USERNAME="noreply@example.com", MAIL_QUEUE_BATCH_SIZE=10, MAIL_QUEUE_MAX_ATTEMPTS=3)
+    queue = MailQueue(app, FakeMail(), redis_client)
+    with app.app_context():
+        yield queue
+
+
+def drain(queue):
+    batch = queue._next_batch()
+    queue._send_batch(batch)
+    return batch
+
+
+def test_delivers_and_settles(queue, redis_client):
+    queue.enqueue("a@example.com", "Hello", "<p>hi</p>")
+    queue.enqueue("b@example.com", "Hello", "<p>hi</p>")
+
+    assert len(drain(queue)) == 2
+
+    assert [msg.recipients for msg in queue.mail.sent] == [["a@example.com"], ["b@example.com"]]
+    assert queue.pending() == {"queued": 0, "sending": 0, "retrying": 0, "dead": 0}
+    assert redis_client.llen(queue.processing_key) == 0
+
+
+def test_transient_failure_is_retried_with_backoff(queue, redis_client):
+    queue.mail.failures.append(smtplib.SMTPDataError(451, b"try later"))
+    queue.enqueue("a@example.com", "Hello", "<p>hi</p>")
+
+    before = time.time()
+    drain(queue)
+
+    [(raw, due)] = redis_client.zrange(RETRY_KEY, 0, -1, withscores=True)
+    record = json.loads(raw)
+    assert record["attempts"] == 1
+    assert "try later" in record["last_error"]
+    assert due >= before + queue.app.config["MAIL_QUEUE_BACKOFF"]
+    assert redis_client.llen(queue.processing_key) == 0
+
+    redis_client.zadd(RETRY_KEY, {raw: 0})  # due now
+    queue._promote_due_retries()
+    drain(queue)
+    assert len(queue.mail.sent) == 1
+    assert queue.pending()["retrying"] == 0
+
+
+def test_gives_up_after_max_attempts(queue, redis_client):
+    queue.mail.failures.extend(smtplib.SMTPDataError(451, b"try later") for _ in range(3))
+    queue.enqueue("a@example.com", "Hello", "<p>hi</p>")
+
+    for _ in range(3):
+        drain(queue)
+        for raw in redis_client.zrange(RETRY_KEY, 0, -1):
+            redis_client.zadd(RETRY_KEY, {raw: 0})
+        queue._promote_due_retries()
+
+    assert queue.pending() == {"queued": 0, "sending": 0, "retrying": 0, "dead": 1}
+    assert json.loads(redis_client.lindex(DEAD_KEY, 0))["attempts"] == 3
+
+
+def test_permanent_failure_is_dead_lettered_at_once(queue, redis_client):
+    queue.mail.failures.append(smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"no such user")}))
+    queue.enqueue("a@example.com", "Hello", "<p>hi</p>")
+
+    drain(queue)
+
+    assert queue.pending() == {"queued": 0, "sending": 0, "retrying": 0, "dead": 1}
+
+
+@pytest.mark.parametrize("raw", [
+    b"not json",
+    b"\xff\xfe",
+    b"[1, 2]",
+    json.dumps({"to": "a@example.com"}).encode(),
+    json.dumps({"to": "a", "subject": "s", "html": "h", "sender": "x", "attempts": "1"}).encode(),
+])
+def test_undecodable_entries_are_dead_lettered_not_retried(queue, redis_client, raw):
+    queue.enqueue("good@example.com", "Hello", "<p>hi</p>")
+    redis_client.lpush(QUEUE_KEY, raw)
+
+    drain(queue)
+
+    assert [msg.recipients for msg in queue.mail.sent] == [["good@example.com"]]
+    assert redis_client.lrange(DEAD_KEY, 0, -1) == [raw]
+    assert redis_client.llen(queue.processing_key) == 0
+    assert mail_queue._decode(raw) is None
+
+
+def test_dead_sender_messages_are_requeued(queue, redis_client):
+    # Another sender took a message and died before settling it (no heartbeat left)
+    record = json.dumps({"to": "a@example.com", "subject": "s", "html": "h", "sender": "x", "attempts": 0})
+    redis_client.sadd(SENDERS_KEY, "gone:1:abc")
+    redis_client.lpush(processing_key("gone:1:abc"), record)
+    # A live one is left alone
+    redis_client.sadd(SENDERS_KEY, "alive:2:def")
+    redis_client.set(heartbeat_key("alive:2:def"), 1)
+    redis_client.lpush(processing_key("alive:2:def"), record)
+
+    queue._heartbeat()
+    queue._recover_orphans()
+
+    assert redis_client.lrange(QUEUE_KEY, 0, -1) == [record.encode()]
+    assert redis_client.llen(processing_key("alive:2:def")) == 1
+    assert set(queue._senders()) == {queue.sender_id, "alive:2:def"}
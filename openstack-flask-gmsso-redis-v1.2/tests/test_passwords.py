@@ -0,0 +1,110 @@
+# tests/test_passwords.py
+import threading
+
+import pytest
+from flask import Flask
+
+import passwords
+from passwords import PasswordHasher, PasswordHasherBusy, normalize_method
+
+FAST_PBKDF2 = "pbkdf2:sha256:1000"
+
+
+def make(monkeypatch, method, workers=0, **env):
+    monkeypatch.setenv("PASSWORD_HASH_METHOD", method)
+    monkeypatch.setenv("PASSWORD_HASH_WORKERS", str(workers))
+    monkeypatch.setenv("PASSWORD_ARGON2_MEMORY_COST", "1024")
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return PasswordHasher(Flask(__name__))
+
+
+def test_hash_and_verify(monkeypatch):
+    hasher = make(monkeypatch, FAST_PBKDF2)
+    stored = hasher.hash("s3cret")
+    assert stored.startswith("pbkdf2:sha256:1000$")
+    assert hasher.verify(stored, "s3cret")
+    assert not hasher.verify(stored, "wrong")
+    assert not hasher.verify(None, "s3cret")
+
+
+def test_older_hashes_need_a_rehash(monkeypatch):
+    old = make(monkeypatch, "pbkdf2:sha256:500").hash("s3cret")
+    hasher = make(monkeypatch, FAST_PBKDF2)
+    assert hasher.needs_rehash(old)
+    assert not hasher.needs_rehash(hasher.hash("s3cret"))
+
+
+@pytest.mark.parametrize("method, expanded", [
+    ("pbkdf2", f"pbkdf2:sha256:{passwords.DEFAULT_PBKDF2_ITERATIONS}"),
+    ("pbkdf2:sha512", f"pbkdf2:sha512:{passwords.DEFAULT_PBKDF2_ITERATIONS}"),
+    ("scrypt", "scrypt:32768:8:1"),
+    ("scrypt:16384", "scrypt:16384:8:1"),
+    ("scrypt:16384:4:2", "scrypt:16384:4:2"),
+])
+def test_normalize_method_matches_the_stored_prefix(method, expanded):
+    assert normalize_method(method) == expanded
+
+
+@pytest.mark.skipif(passwords.Argon2Hasher is None, reason="argon2-cffi is not installed")
+def test_argon2(monkeypatch):
+    pbkdf2 = make(monkeypatch, FAST_PBKDF2).hash("s3cret")
+    hasher = make(monkeypatch, "argon2")
+    stored = hasher.hash("s3cret")
+    assert stored.startswith("$argon2")
+    assert hasher.verify(stored, "s3cret")
+    assert not hasher.verify(stored, "wrong")
+    assert hasher.verify(pbkdf2, "s3cret")  # older hashes still log in, then get upgraded
+    assert hasher.needs_rehash(pbkdf2)
+    assert not hasher.needs_rehash(stored)
+
+
+def test_argon2_without_argon2_cffi_falls_back_to_the_default(monkeypatch, caplog):
+    monkeypatch.setattr(passwords, "Argon2Hasher", None)
+    hasher = make(monkeypatch, "argon2")
+
+    assert hasher.method == passwords.DEFAULT_METHOD
+    assert "argon2-cffi is not installed" in caplog.text
+    stored = "pbkdf2:sha256:1000$salt$hash"
+    assert hasher.needs_rehash(stored)  # no RuntimeError on login
+
+
+def test_pool_hashes_in_another_process(monkeypatch):
+    hasher = make(monkeypatch, FAST_PBKDF2, workers=1)
+    try:
+        stored = hasher.hash("s3cret")
+        assert hasher.verify(stored, "s3cret")
+    finally:
+        hasher.shutdown()
+
+
+def test_full_queue_raises_busy(monkeypatch):
+    hasher = make(monkeypatch, FAST_PBKDF2, workers=1, PASSWORD_HASH_MAX_PENDING="1",
+                  PASSWORD_HASH_QUEUE_TIMEOUT="0.05")
+    started, release = threading.Event(), threading.Event()
+
+    class Future:
+        def add_done_callback(self, callback):
+            self.callback = callback
+
+        def result(self):
+            started.set()
+            release.wait(5)
+            self.callback(self)
+            return "hash"
+
+    class Pool:
+        def submit(self, fn, *args):
+            return Future()
+
+    monkeypatch.setattr(hasher, "_pool", Pool)
+    waiting = threading.Thread(target=hasher.hash, args=("first",))
+    waiting.start()
+    started.wait(5)
+    try:
+        with pytest.raises(PasswordHasherBusy):
+            hasher.hash("second")
+    finally:
+        release.set()
+        waiting.join()
+    assert hasher.hash("third") == "hash"  # the slot was given back
@@ -0,0 +1,112 @@
+# tests/test_rate_limit.py
+import pytest
+from flask import Flask
+
+import rate_limit
+from rate_limit import RateLimiter
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(60 * 16667 + 20.0)  # a third of the way into a 60 s window
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def app(redis_client, monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_LOGIN_IP", "3/60")
+    monkeypatch.setenv("RATE_LIMIT_LOGIN_ACCOUNT", "2/60")
+    app = Flask(__name__)
+    limiter = RateLimiter(app, redis_client)
+
+    @app.route("/login", methods=["GET", "POST"])
+    @limiter.limit("login_ip", "login_account", failures_only=True)
+    def login():
+        if app.config.get("LOGIN_OK"):
+            return "ok"
+        limiter.failed("login_account", rate_limit.request.form.get("email"))
+        return "bad password"
+
+    @app.route("/reset", methods=["POST"])
+    @limiter.limit(account_rule="login_account")
+    def reset():
+        return "sent"
+
+    app.limiter = limiter
+    return app
+
+
+def post(client, path="/login", email="a@example.com", ip="10.0.0.1"):
+    return client.post(path, data={"email": email}, environ_base={"REMOTE_ADDR": ip})
+
+
+def test_ip_window_blocks_with_retry_after(app, clock):
+    client = app.test_client()
+    app.config["LOGIN_OK"] = True
+    assert [post(client, email=f"u{i}@example.com").status_code for i in range(4)] == [200, 200, 200, 429]
+
+    response = post(client, email="other@example.com")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "40"  # what is left of the window
+    assert post(client, ip="10.0.0.2").status_code == 200
+    assert client.get("/login", environ_base={"REMOTE_ADDR": "10.0.0.1"}).status_code == 200  # GET is not counted
+
+
+def test_previous_window_is_weighted_by_its_overlap(app, clock):
+    client = app.test_client()
+    app.config["LOGIN_OK"] = True
+    for i in range(3):
+        post(client, email=f"u{i}@example.com")
+
+    clock.now += 60  # next window: 3 * (1 - 1/3) = 2 still count
+    assert post(client, email="x@example.com").status_code == 200
+    assert post(client, email="y@example.com").status_code == 429
+
+    clock.now += 40  # start of the window after: the one hit before it still counts in full
+    assert post(client, email="z@example.com").status_code == 200
+
+
+def test_successful_logins_do_not_use_up_the_account_window(app, clock):
+    client = app.test_client()
+    app.config["LOGIN_OK"] = True
+    for i in range(3):
+        assert post(client, ip=f"10.0.1.{i}").status_code == 200
+
+    app.config["LOGIN_OK"] = False
+    assert post(client, ip="10.0.2.1").status_code == 200  # first failure
+    assert post(client, ip="10.0.2.2").status_code == 200  # second failure
+    assert post(client, ip="10.0.2.3").status_code == 429  # blocked before the password is checked
+    assert post(client, email="B@example.com ", ip="10.0.2.4").status_code == 200  # another account
+
+    stats = app.limiter.stats()
+    assert stats["login_account"] == {"allowed": 3, "blocked": 1}  # the three failures
+
+
+def test_without_failures_only_every_request_counts(app, clock):
+    client = app.test_client()
+    assert [post(client, "/reset", ip=f"10.0.3.{i}").status_code for i in range(3)] == [200, 200, 429]
+    assert post(client, "/reset", email=" A@Example.com", ip="10.0.3.9").status_code == 429  # same account
+
+
+def test_fails_open_when_redis_is_down(app, clock, monkeypatch):
+    def down(*args, **kwargs):
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(app.limiter, "_script", down)
+    client = app.test_client()
+    assert all(post(client).status_code == 200 for _ in range(5))
+
+
+def test_parse_limit_and_account_key():
+    assert rate_limit.parse_limit("5/60") == (5, 60)
+    assert rate_limit.account_key(" A@Example.com") == rate_limit.account_key("a@example.com")
+    assert "example" not in rate_limit.account_key("a@example.com")
@@ -0,0 +1,120 @@
+# tests/test_revocation.py
+import time
+
+import fakeredis
+import pytest
+from flask import Flask, session
+
+from revocation import CHANNEL, LOG_KEY, RevocationBus
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def make(server):
+    """A worker's bus; workers share one Redis."""
+    app = Flask(__name__)
+    app.secret_key = "test"
+    return app, RevocationBus(app, fakeredis.FakeRedis(server=server))
+
+
+def eventually(check, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_logout_reaches_every_worker(server):
+    _, first = make(server)
+    _, second = make(server)
+    second.ensure_listening()
+    assert eventually(lambda: first.redis.pubsub_numsub(CHANNEL)[0][1] == 1)  # subscribed
+
+    first.revoke_login("login-1")
+
+    assert first.is_revoked("login-1")
+    assert eventually(lambda: second.is_revoked("login-1"))
+    assert not second.is_revoked("login-2")
+
+
+def test_a_late_worker_replays_the_log(server):
+    _, first = make(server)
+    first.revoke_login("login-1")
+    first.revoke_user(7)
+
+    _, late = make(server)
+    assert eventually(lambda: late.is_revoked("login-1"))
+    assert late.is_revoked(user=7, issued_at=0)
+
+
+def test_user_revocation_covers_only_what_was_issued_before(server):
+    _, bus = make(server)
+    bus.ensure_listening = lambda: None
+    bus.revoke_user(7)
+    now = int(time.time())
+
+    assert bus.is_revoked(user=7, issued_at=now - 60)
+    assert bus.is_revoked(user="7", issued_at=None)  # no issue time: older than the revocation
+    assert not bus.is_revoked(user=7, issued_at=now + 1)
+    assert not bus.is_revoked(user=8, issued_at=now - 60)
+
+
+def test_expired_events_are_forgotten(server):
+    _, bus = make(server)
+    bus.ensure_listening = lambda: None
+    bus.revoke_login("login-1", ttl=-1)
+    bus.revoke_user(7, ttl=-1)
+
+    assert not bus.is_revoked("login-1")
+    assert not bus.is_revoked(user=7, issued_at=0)
+    bus._sweep()
+    assert bus._sids == {} and bus._users == {}
+    assert bus.redis.zcard(LOG_KEY) == 0
+
+
+def test_listeners_are_told_and_their_errors_contained(server):
+    _, bus = make(server)
+    bus.ensure_listening = lambda: None
+    seen = []
+    bus.on_revoke(lambda event: 1 / 0)
+    bus.on_revoke(seen.append)
+
+    bus.revoke_login("login-1", session_id="flask-1")
+
+    assert seen[0]["session"] == "flask-1"
+
+
+def test_revoked_flask_session_is_cleared_on_the_next_request(server):
+    app, bus = make(server)
+    bus.ensure_listening = lambda: None
+
+    @app.route("/set")
+    def set_session():
+        session["auth_sid"] = "login-1"
+        session["auth_iat"] = int(time.time())
+        return "ok"
+
+    @app.route("/get")
+    def get_session():
+        return session.get("auth_sid") or "none"
+
+    client = app.test_client()
+    client.get("/set")
+    assert client.get("/get").text == "login-1"
+    bus.revoke_login("login-1")
+    assert client.get("/get").text == "none"
+
+
+def test_redis_down_still_revokes_locally(server):
+    _, bus = make(server)
+    bus.ensure_listening = lambda: None
+    server.connected = False
+
+    bus.revoke_login("login-1")
+
+    assert bus.is_revoked("login-1")
@@ -0,0 +1,144 @@
+# tests/test_sso_tokens.py
+import pytest
+from flask import Flask
+
+import sso_tokens
+from revocation import RevocationBus
+from sso_tokens import InvalidToken, TokenIssuer, TokenVerifier
+
+
+class User:
+    id = 7
+    email = "ada@example.com"
+    name = "Ada"
+
+
+@pytest.fixture(scope="module")
+def key_file(tmp_path_factory):
+    # One RSA key for the whole module: generating one takes a while
+    return str(tmp_path_factory.mktemp("keys") / "sso_signing_key.pem")
+
+
+def make(redis_client, monkeypatch, key_file, mode="jwt", **env):
+    monkeypatch.setenv("SESSION_MODE", mode)
+    monkeypatch.setenv("SSO_SIGNING_KEY_FILE", key_file)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    app = Flask(__name__)
+    app.secret_key = "test"
+    revocations = RevocationBus(app, redis_client)
+    monkeypatch.setattr(revocations, "ensure_listening", lambda: None)  # events are applied locally
+    return app, TokenIssuer(app, redis_client, revocations), revocations
+
+
+@pytest.fixture
+def issuer(redis_client, monkeypatch, key_file):
+    return make(redis_client, monkeypatch, key_file)[1]
+
+
+def test_access_token_verifies_with_the_users_claims(issuer):
+    tokens = issuer.issue(User(), sid="login-1")
+    claims = issuer.verify(tokens["access_token"])
+    assert (claims["sub"], claims["email"], claims["name"], claims["sid"]) == ("7", "ada@example.com", "Ada", "login-1")
+    assert tokens["expires_in"] == issuer.access_ttl
+
+
+def test_tampered_expired_and_foreign_tokens_are_rejected(issuer, redis_client, monkeypatch, key_file, tmp_path):
+    token = issuer.issue(User())["access_token"]
+    header, payload, signature = token.split(".")
+    with pytest.raises(InvalidToken):
+        issuer.verify(".".join([header, payload[:-4] + "AAAA", signature]))
+
+    expired = issuer.sign(dict(issuer.claims_for(User(), "old"), exp=1))
+    with pytest.raises(InvalidToken):
+        issuer.verify(expired)
+
+    other = make(redis_client, monkeypatch, key_file, SSO_AUDIENCE="someone-else")[1]
+    with pytest.raises(InvalidToken):
+        issuer.verify(other.issue(User())["access_token"])
+
+    stranger = make(redis_client, monkeypatch, str(tmp_path / "other.pem"))[1]
+    with pytest.raises(InvalidToken):
+        issuer.verify(stranger.issue(User())["access_token"])
+
+
+def test_refresh_rotates_and_works_once(issuer):
+    first = issuer.issue(User(), sid="login-1")
+    second = issuer.refresh(first["refresh_token"])
+
+    assert second["refresh_token"] != first["refresh_token"]
+    assert issuer.verify(second["access_token"])["sid"] == "login-1"
+    with pytest.raises(InvalidToken):
+        issuer.refresh(first["refresh_token"])
+
+
+def test_revoke_session_invalidates_its_refresh_tokens(issuer):
+    tokens = issuer.issue(User(), sid="login-1")
+    other = issuer.issue(User(), sid="login-2")
+
+    issuer.revoke_session("login-1")
+
+    with pytest.raises(InvalidToken):
+        issuer.refresh(tokens["refresh_token"])
+    issuer.refresh(other["refresh_token"])
+
+
+def test_revoked_login_is_rejected_before_the_token_expires(issuer):
+    tokens = issuer.issue(User(), sid="login-1")
+    issuer.revocations.revoke_login("login-1")
+
+    with pytest.raises(InvalidToken):
+        issuer.verify(tokens["access_token"])
+    with pytest.raises(InvalidToken):
+        issuer.refresh(tokens["refresh_token"])
+
+
+def test_refresh_endpoint(redis_client, monkeypatch, key_file):
+    app, issuer, _ = make(redis_client, monkeypatch, key_file)
+    client = app.test_client()
+    tokens = issuer.issue(User())
+
+    response = client.post("/token/refresh", data={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    assert "sso_access=" in response.headers["Set-Cookie"]
+    assert client.post("/token/refresh", data={"refresh_token": tokens["refresh_token"]}).status_code == 401
+    assert client.post("/token/refresh").status_code == 200  # the rotated token, from its cookie
+    assert app.test_client().post("/token/refresh").status_code == 400  # no token, no cookie
+
+
+def test_downstream_verifier_uses_the_published_jwks(redis_client, monkeypatch, key_file):
+    app, issuer, _ = make(redis_client, monkeypatch, key_file)
+    client = app.test_client()
+    fetched = []
+
+    class Response:
+        def __init__(self, url):
+            self.body = client.get(url).get_json()
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return self.body
+
+    def get(url, timeout):
+        fetched.append(url)
+        return Response(url)
+
+    monkeypatch.setattr(sso_tokens.requests, "get", get)
+    verifier = TokenVerifier("/.well-known/jwks.json")
+    for _ in range(3):
+        assert verifier.verify(issuer.issue(User())["access_token"])["sub"] == "7"
+    assert fetched == ["/.well-known/jwks.json"]  # fetched once
+
+
+def test_other_session_modes_load_no_key_and_serve_no_routes(redis_client, monkeypatch, tmp_path):
+    key_file = str(tmp_path / "unused.pem")
+    app, issuer, _ = make(redis_client, monkeypatch, key_file, mode="redis")
+
+    assert not issuer.enabled
+    assert issuer.key is None
+    assert app.test_client().get("/.well-known/jwks.json").status_code == 404
+    with pytest.raises(InvalidToken):
+        issuer.verify("anything")
+    assert not (tmp_path / "unused.pem").exists()
@@ -0,0 +1,260 @@
+# tracing.py
+import base64
+import inspect
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+log = logging.getLogger("tracing")
+
+try:
+    from opentelemetry import context as otel_context
+    from opentelemetry import propagate, trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    from opentelemetry.trace import Status, StatusCode
+except ImportError:  # tracing is optional
+    trace = None
+    SpanExporter = object
+
+_tracer = None
+
+
+def init_tracing(app=None, service_name=None):
+    """Set up OpenTelemetry tracing; a no-op unless ``TRACING_ENABLED`` is true.
+
+    - ``TRACING_EXPORTER``: ``otlp`` (default, OTLP/HTTP to
+      ``OTEL_EXPORTER_OTLP_ENDPOINT``, e.g. a local collector on :4318) or
+      ``file`` (OTLP JSON lines in ``TRACING_FILE``).
+    - ``TRACING_SAMPLE_RATIO``: fraction of new traces kept (default ``0.1``).
+      Child spans follow their parent's decision, so a trace is either
+      complete or absent, and unsampled requests cost almost nothing.
+
+    Spans are exported by a background batch processor, never on the
+    request thread.
+    """
+    global _tracer
+    if os.getenv("TRACING_ENABLED", "False").lower() not in ["true", "1", "t"]:
+        return False
+    if trace is None:
+        log.warning("TRACING_ENABLED is set but opentelemetry-sdk is not installed")
+        return False
+
+    service_name = service_name or os.getenv("OTEL_SERVICE_NAME", "openstack-flask")
+    ratio = float(os.getenv("TRACING_SAMPLE_RATIO", 0.1))
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(ratio)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(_make_exporter(app)))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer(service_name)
+
+    if app is not None:
+        try:
+            from opentelemetry.instrumentation.flask import FlaskInstrumentor
+        except ImportError:
+            log.warning("opentelemetry-instrumentation-flask not installed; no per-request spans")
+        else:
+            FlaskInstrumentor().instrument_app(app, excluded_urls="metrics,static")
+    return True
+
+
+def _make_exporter(app):
+    if os.getenv("TRACING_EXPORTER", "otlp").lower() == "file":
+        default_dir = app.instance_path if app is not None else "."
+        return FileSpanExporter(os.getenv("TRACING_FILE", os.path.join(default_dir, "traces.jsonl")))
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    return OTLPSpanExporter()
+
+
+class FileSpanExporter(SpanExporter):
+    """Append spans as OTLP JSON, one ``ExportTraceServiceRequest`` per line.
+
+    This is the format of the collector's ``file`` exporter, so the file
+    can be replayed into a collector (``otlpjsonfile`` receiver) later.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, spans):
+        from google.protobuf.json_format import MessageToDict
+        from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+
+        request = MessageToDict(encode_spans(spans))
+        for resource_spans in request.get("resourceSpans", []):
+            for scope_spans in resource_spans.get("scopeSpans", []):
+                for item in scope_spans.get("spans", []):
+                    _hex_ids(item)
+        line = json.dumps(request, separators=(",", ":"))
+        try:
+            with self._lock, open(self.path, "a") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            log.warning("Could not write traces: %s", e, extra={"path": self.path})
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def _hex_ids(item):
+    # Protobuf's JSON mapping base64-encodes bytes; OTLP/JSON wants hex ids
+    for key in ("traceId", "spanId", "parentSpanId"):
+        if item.get(key):
+            item[key] = base64.b64decode(item[key]).hex()
+    for link in item.get("links", []):
+        _hex_ids(link)
+
+
+def enabled():
+    return _tracer is not None
+
+
+@contextmanager
+def span(name, attributes=None, parent=None):
+    """Child span of the current span (or of ``parent``, a carrier from ``inject()``)."""
+    if _tracer is None:
+        yield None
+        return
+    ctx = propagate.extract(parent) if parent else None
+    with _tracer.start_as_current_span(name, context=ctx, attributes=attributes) as current:
+        yield current
+
+
+def inject():
+    """Carrier (``{"traceparent": ...}``) for continuing the current trace elsewhere."""
+    carrier = {}
+    if _tracer is not None:
+        propagate.inject(carrier)
+    return carrier
+
+
+# === OpenStack ===
+SERVICES = ("identity", "compute", "network", "image", "block_storage", "object_store", "load_balancer")
+
+
+class TracedConnection:
+    """Wrap an ``openstack.connection.Connection`` so every service proxy call is a span.
+
+    ``conn.network.create_network(...)`` becomes a span named
+    ``network.create_network``. Listing calls return generators; their span
+    stays open until iteration ends, since that is when the pages are fetched.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._proxies = {}
+
+    def __getattr__(self, name):
+        if name in SERVICES:
+            proxy = self._proxies.get(name)
+            if proxy is None:
+                proxy = self._proxies[name] = _TracedProxy(name, getattr(self._conn, name))
+            return proxy
+        return getattr(self._conn, name)
+
+
+class _TracedProxy:
+    def __init__(self, service, proxy):
+        self._service = service
+        self._proxy = proxy
+
+    def __getattr__(self, name):
+        attr = getattr(self._proxy, name)
+        if name.startswith("_") or not callable(attr) or _tracer is None:
+            return attr
+        return _traced_call(self._service, name, attr)
+
+
+def _traced_call(service, operation, fn):
+    def wrapper(*args, **kwargs):
+        current = _tracer.start_span(
+            f"{service}.{operation}",
+            attributes={"openstack.service": service, "openstack.operation": operation},
+        )
+        token = otel_context.attach(trace.set_span_in_context(current))
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            _record_error(current, e)
+            current.end()
+            raise
+        finally:
+            otel_context.detach(token)
+        if inspect.isgenerator(result):
+            return _traced_iter(current, result)
+        current.end()
+        return result
+    return wrapper
+
+
+def _traced_iter(current, iterator):
+    try:
+        yield from iterator
+    except Exception as e:
+        _record_error(current, e)
+        raise
+    finally:
+        current.end()
+
+
+def _record_error(current, error):
+    current.record_exception(error)
+    current.set_status(Status(StatusCode.ERROR, str(error)))
+
+
+def trace_connection(conn):
+    if _tracer is None or isinstance(conn, TracedConnection):
+        return conn
+    return TracedConnection(conn)
+
+
+# === Redis and SQL ===
+def trace_redis(client):
+    """One span per command or pipeline (Flask-Session reads and writes included)."""
+    if _tracer is None:
+        return client
+    try:
+        from opentelemetry.instrumentation.redis import RedisInstrumentor
+    except ImportError:
+        log.warning("opentelemetry-instrumentation-redis not installed; Redis calls are not traced")
+        return client
+    RedisInstrumentor.instrument_client(client)
+    return client
+
+
+def trace_engine(engine):
+    """One span per SQL statement, named after its verb (``SELECT``, ``INSERT``, ...)."""
+    if _tracer is None:
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        current = _tracer.start_span(verb, attributes={
+            "db.system": engine.dialect.name,
+            "db.statement": statement[:1000],
+        })
+        conn.info.setdefault("trace_spans", []).append(current)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        conn.info["trace_spans"].pop().end()
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+        if spans:
+            current = spans.pop()
+            _record_error(current, context.original_exception)
+            current.end()
@@ -0,0 +1,58 @@
+# gunicorn.conf.py
+#
+# Production server for the Keycloak SSO app (gunicorn reads this file from
+# the working directory):
+#
+#   gunicorn main:app
+#
+# - WEB_CONCURRENCY: worker processes (default 2 x cores + 1)
+# - GUNICORN_THREADS: threads per worker (default 4)
+# - BACKGROUND_JOBS: False to keep the OAuth token refresher out of this tier
+#
+# kill -HUP <master> restarts the workers gracefully. The app is preloaded,
+# so new code needs kill -USR2 <master> (a new master) and then
+# kill -QUIT <old master>.
+import os
+
+
+def _cores():
+    try:
+        return len(os.sched_getaffinity(0))  # the CPUs this container may use
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', 5000)}")
+# Threaded workers; the token refresher and the revocation listener are threads too
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", 2 * _cores() + 1))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+
+# Import the app (SQLAlchemy, Authlib, Flask-Dance...) once in the master;
+# workers share those pages copy-on-write instead of importing them again
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+# Recycle workers now and then so slow leaks never accumulate, staggered
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    from main import app, db, background
+
+    # The master's connection (db.create_all at import) must not be shared with the workers
+    with app.app_context():
+        db.engine.dispose(close=False)
+    if os.getenv("BACKGROUND_JOBS", "True").lower() in ["true", "1", "t"]:
+        background.start()
+
+
+def worker_exit(server, worker):
+    from main import background
+
+    # Hand the lease to another worker now instead of after it expires
+    background.stop()
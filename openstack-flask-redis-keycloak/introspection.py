@@ -0,0 +1,181 @@
+# introspection.py
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+
+from flask import Blueprint, current_app, jsonify, request, session
+from flask_login import user_logged_in, user_logged_out
+from itsdangerous import BadSignature, Signer
+
+from cache import TTLCache
+from sso_tokens import InvalidToken, login_session_id
+
+log = logging.getLogger("introspection")
+
+INACTIVE = {"active": False}
+
+introspection_bp = Blueprint("introspection", __name__)
+
+
+class Introspector:
+    """Answer "is this session/token valid and who is it?" for other services.
+
+    At login a compact claims record is written to Redis under the Flask
+    session id. Lookups go through an in-process LRU first, then Redis; the
+    user database is never touched. Access tokens are verified locally.
+    Every answer is checked against the in-memory ``RevocationBus``, so a
+    logout or password reset in any worker takes effect everywhere as soon
+    as the pub/sub event arrives.
+
+    ``/introspect`` hands out user claims, so it is only registered when
+    ``INTROSPECT_API_KEY`` is set, and every caller must send that key.
+    """
+
+    def __init__(self, app=None, redis_client=None, token_issuer=None, revocations=None):
+        self.redis = redis_client
+        self.tokens = token_issuer
+        self.revocations = revocations
+        self.cache = TTLCache()
+        if app is not None:
+            self.init_app(app, redis_client, token_issuer, revocations)
+
+    def init_app(self, app, redis_client=None, token_issuer=None, revocations=None):
+        self.redis = redis_client or self.redis
+        self.tokens = token_issuer or self.tokens
+        self.revocations = revocations or self.revocations
+        self.revocations.on_revoke(self._evict)
+        self.local_ttl = float(os.getenv("INTROSPECT_LOCAL_TTL", 5))
+        self.cache = TTLCache(int(os.getenv("INTROSPECT_CACHE_SIZE", 10000)))
+        self.api_key = os.getenv("INTROSPECT_API_KEY")
+        self.session_ttl = int(app.permanent_session_lifetime.total_seconds())
+        self.signer = None
+        if app.config.get("SESSION_USE_SIGNER"):
+            self.signer = Signer(app.secret_key, salt="flask-session", key_derivation="hmac")
+        user_logged_in.connect(self._on_login, app, weak=False)
+        user_logged_out.connect(self._on_logout, app, weak=False)
+        app.extensions["introspection"] = self
+        if self.api_key:
+            app.register_blueprint(introspection_bp)
+        else:
+            log.warning("INTROSPECT_API_KEY is not set; /introspect is disabled")
+
+    # === Records ===
+    def _on_login(self, app, user, **extra):
+        record = {
+            "active": True,
+            "sub": str(user.id),
+            "email": user.email,
+            "name": getattr(user, "name", None) or getattr(user, "username", None),
+            "sid": login_session_id(),
+            "iat": session["auth_iat"],
+        }
+        pipe = self.redis.pipeline()
+        pipe.set(session_record_key(session.sid), json.dumps(record), ex=self.session_ttl)
+        pipe.sadd(user_sessions_key(user.id), session.sid)
+        pipe.expire(user_sessions_key(user.id), self.session_ttl)
+        pipe.execute()
+
+    def _on_logout(self, app, user, **extra):
+        self.revoke(session.sid, session.get("auth_sid"), getattr(user, "id", None))
+
+    def revoke(self, flask_sid, auth_sid=None, user_id=None):
+        pipe = self.redis.pipeline()
+        pipe.delete(session_record_key(flask_sid))
+        if user_id is not None:
+            pipe.srem(user_sessions_key(user_id), flask_sid)
+        pipe.execute()
+        self.revocations.revoke_login(auth_sid, session_id=flask_sid)
+
+    def revoke_user(self, user_id):
+        """Invalidate every session and token of a user (password reset, account change)."""
+        flask_sids = self.redis.smembers(user_sessions_key(user_id))
+        pipe = self.redis.pipeline()
+        for flask_sid in flask_sids:
+            flask_sid = flask_sid.decode() if isinstance(flask_sid, bytes) else flask_sid
+            pipe.delete(session_record_key(flask_sid))
+        pipe.delete(user_sessions_key(user_id))
+        pipe.execute()
+        self.revocations.revoke_user(user_id)
+
+    def _evict(self, event):
+        if event.get("session"):
+            self.cache.pop(("session", event["session"]))
+
+    # === Lookups ===
+    def introspect_session(self, cookie_value):
+        flask_sid = self._unsign(cookie_value)
+        if not flask_sid:
+            return INACTIVE
+        result = self.cache.get(("session", flask_sid))
+        if result is None:
+            raw = self.redis.get(session_record_key(flask_sid))
+            result = json.loads(raw) if raw else INACTIVE
+            self.cache.set(("session", flask_sid), result, self.local_ttl)
+        return result if self._active(result) else INACTIVE
+
+    def introspect_token(self, token):
+        if self.tokens is None or not self.tokens.enabled:
+            return INACTIVE
+        key = ("token", hashlib.sha256(token.encode()).digest())
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached if self._active(cached) else INACTIVE
+        try:
+            claims = self.tokens.verify(token)
+        except InvalidToken:
+            self.cache.set(key, INACTIVE, self.local_ttl)
+            return INACTIVE
+        result = {
+            "active": True,
+            "sub": claims["sub"],
+            "email": claims.get("email"),
+            "name": claims.get("name"),
+            "sid": claims.get("sid"),
+            "iat": claims.get("iat"),
+            "exp": claims["exp"],
+        }
+        self.cache.set(key, result, max(0, min(self.local_ttl, claims["exp"] - time.time())))
+        return result if self._active(result) else INACTIVE
+
+    def _active(self, result):
+        if not result.get("active"):
+            return False
+        return not self.revocations.is_revoked(result.get("sid"), result.get("sub"), result.get("iat"))
+
+    def _unsign(self, cookie_value):
+        if not cookie_value:
+            return None
+        if self.signer is None:
+            return cookie_value
+        try:
+            return self.signer.unsign(cookie_value).decode()
+        except BadSignature:
+            return None
+
+
+def session_record_key(flask_sid):
+    return f"introspect:session:{flask_sid}"
+
+
+def user_sessions_key(user_id):
+    return f"introspect:user:{user_id}"
+
+
+@introspection_bp.route("/introspect", methods=["POST"])
+def introspect():
+    introspector = current_app.extensions["introspection"]
+    supplied = request.headers.get("X-Introspect-Key", "")
+    if not introspector.api_key or not hmac.compare_digest(supplied, introspector.api_key):
+        return jsonify({"error": "unauthorized"}), 401
+
+    data = request.get_json(silent=True) or request.form
+    if data.get("token"):
+        result = introspector.introspect_token(data["token"])
+    elif data.get("session"):
+        result = introspector.introspect_session(data["session"])
+    else:
+        return jsonify({"error": "invalid_request"}), 400
+    return jsonify(result)
@@ -0,0 +1,209 @@
+# log_setup.py
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+try:
+    from flask_login import current_user
+except ImportError:  # apps without Flask-Login only get request ids
+    current_user = None
+
+# Attributes every LogRecord has; anything else was passed with extra={...}
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any ``extra`` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_") and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the request id and user id of the thread that logged them.
+
+    Runs on the logging thread before the record is queued, since the
+    listener thread has no request context.
+    """
+
+    def filter(self, record):
+        if has_request_context():
+            if getattr(record, "request_id", None) is None:
+                record.request_id = g.get("request_id")
+            if getattr(record, "user_id", None) is None:
+                record.user_id = _current_user_id()
+        return True
+
+
+def _current_user_id():
+    if current_user is None:
+        return None
+    try:
+        if current_user.is_authenticated:
+            return current_user.get_id()
+    except Exception:
+        pass
+    return None
+
+
+class SamplingFilter(logging.Filter):
+    """Let through ``burst`` records per message template per ``window`` seconds.
+
+    Later repeats are dropped and counted; the next record that gets through
+    carries ``suppressed=<count>``, so nothing is lost silently.
+    """
+
+    def __init__(self, burst=5, window=60.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            started, count, suppressed = self._seen.get(key, (now, 0, 0))
+            if now - started > self.window:
+                started, count = now, 0
+            if count >= self.burst:
+                self._seen[key] = (started, count, suppressed + 1)
+                return False
+            self._seen[key] = (started, count + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: when the queue is full the record is dropped."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Keep extra fields and the traceback separate instead of flattening into msg
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def configure_logging(app=None):
+    """Route all logging through a bounded queue to a JSON writer thread.
+
+    - ``LOG_LEVEL``: root level (default ``INFO``)
+    - ``LOG_LEVELS``: per-logger levels, e.g. ``reaper=WARNING,mail_queue=DEBUG``
+    - ``LOG_FORMAT``: ``json`` (default) or ``text``
+    - ``LOG_FILE``: also append to this file
+    - ``LOG_SAMPLED``: loggers whose repeats are sampled (default ``reaper``),
+      ``LOG_SAMPLE_BURST`` per ``LOG_SAMPLE_WINDOW`` seconds
+    - ``LOG_QUEUE_SIZE``: records buffered before new ones are dropped
+
+    With an app, each request gets an id (``X-Request-ID`` is honoured and
+    echoed back) that is attached to every record logged while serving it.
+    """
+    global _listener
+    if _listener is None:
+        if os.getenv("LOG_FORMAT", "json").lower() == "text":
+            formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        else:
+            formatter = JsonFormatter()
+        outputs = [logging.StreamHandler(sys.stdout)]
+        if os.getenv("LOG_FILE"):
+            outputs.append(logging.FileHandler(os.getenv("LOG_FILE")))
+        for output in outputs:
+            output.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000)))
+        handler = DroppingQueueHandler(log_queue)
+        handler.addFilter(RequestContextFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        for item in os.getenv("LOG_LEVELS", "").split(","):
+            if "=" in item:
+                name, level = item.split("=", 1)
+                logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+        sampler = SamplingFilter(
+            burst=int(os.getenv("LOG_SAMPLE_BURST", 5)),
+            window=float(os.getenv("LOG_SAMPLE_WINDOW", 60)),
+        )
+        for name in os.getenv("LOG_SAMPLED", "reaper").split(","):
+            if name.strip():
+                logging.getLogger(name.strip()).addFilter(sampler)
+
+        _listener = logging.handlers.QueueListener(log_queue, *outputs, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        # Pre-forking servers (gunicorn --preload) fork after this; the writer thread does not survive it
+        os.register_at_fork(after_in_child=_restart_after_fork)
+
+    if app is not None:
+        # Flask's own handler would write synchronously; everything goes through the queue
+        app.logger.removeHandler(default_handler)
+        app.before_request(_assign_request_id)
+        app.after_request(_echo_request_id)
+
+
+def _restart_after_fork():
+    """Give a forked worker its own queue and writer thread."""
+    global _listener
+    atexit.unregister(_listener.stop)
+    log_queue = queue.Queue(maxsize=_listener.queue.maxsize)
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, DroppingQueueHandler):
+            handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def _assign_request_id():
+    g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+
+
+def _echo_request_id(response):
+    if "request_id" in g:
+        response.headers["X-Request-ID"] = g.request_id
+    return response
@@ -3,11 +3,12 @@
 import sys
 import os
 import re
+import logging
 from flask import Flask, redirect, url_for, flash, render_template, request, session, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm.exc import NoResultFound
 from flask_dance.contrib.google import make_google_blueprint, google
-from flask_dance.consumer.storage.sqla import OAuthConsumerMixin, SQLAlchemyStorage
+from flask_dance.consumer.storage.sqla import OAuthConsumerMixin
 from flask_dance.consumer import oauth_authorized, oauth_error
 from flask_login import (
     LoginManager, UserMixin, current_user,
@@ -19,6 +20,14 @@ from itsdangerous import URLSafeTimedSerializer, SignatureExpired
 from flask_mail import Mail, Message
 from flask_session import Session # Import Flask-Session
 import redis # Import redis library
+from rate_limit import RateLimiter
+from oidc_cache import CachedOIDCApp, provider_cache_from_env
+from sso_tokens import TokenIssuer, InvalidToken, bearer_token
+from introspection import Introspector
+from revocation import RevocationBus
+from oauth_tokens import OAuthTokenStore
+from leader import LeaderLease
+import log_setup
 
 # --- Authlib imports for Keycloak ---
 from authlib.integrations.flask_client import OAuth as AuthlibOAuth
@@ -33,11 +42,28 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY")
 
+# setup JSON logging through a non-blocking queue, tagged with request and user ids
+log_setup.configure_logging(app)
+log = logging.getLogger("auth")
+
 # setup Redis session
 app.config['SESSION_TYPE'] = 'redis'
-app.config['SESSION_REDIS'] = redis.from_url('redis://192.168.0.207:6379') # Update Redis URL if needed
+redis_client = redis.from_url(os.getenv('REDIS_URL', 'redis://192.168.0.207:6379')) # Update Redis URL if needed
+app.config['SESSION_REDIS'] = redis_client
 Session(app)
 
+# setup rate limiting for auth endpoints (Redis sliding window)
+limiter = RateLimiter(app, redis_client)
+
+# setup logout/revocation fan-out to every worker (Redis pub/sub)
+revocation_bus = RevocationBus(app, redis_client)
+
+# setup SSO tokens: signed access/refresh tokens and JWKS endpoint (SESSION_MODE=jwt)
+sso_tokens = TokenIssuer(app, redis_client, revocation_bus)
+
+# setup session/token introspection for other services (LRU + Redis, no DB)
+introspector = Introspector(app, redis_client, sso_tokens, revocation_bus)
+
 # setup database models
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///signup-update8.db"
 db = SQLAlchemy(app)
@@ -63,6 +89,12 @@ class OAuth(OAuthConsumerMixin, db.Model): # Rename to avoid conflict, or use a
     user_id = db.Column(db.Integer, db.ForeignKey(User.id), nullable=False)
     user = db.relationship(User, backref=db.backref("oauth", cascade="all, delete-orphan"))
 
+# setup OAuth token store: encrypted at rest, cached in Redis, refreshed in the background
+oauth_tokens = OAuthTokenStore(app, db, OAuth, redis_client)
+
+# Under gunicorn the OAuth refresher runs in one process per deployment
+background = LeaderLease(redis_client, "keycloak-background", [oauth_tokens])
+
 # setup Flask-Login
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -72,6 +104,20 @@ login_manager.login_view = "login" # Redirect to 'login' if not authenticated
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+# API clients may authenticate with an SSO access token instead of a session
+@login_manager.request_loader
+def load_user_from_token(request):
+    if not sso_tokens.enabled:
+        return None
+    token = bearer_token()
+    if not token:
+        return None
+    try:
+        claims = sso_tokens.verify(token)
+    except InvalidToken:
+        return None
+    return User.query.get(int(claims["sub"]))
+
 # setup Google OAuth (বিদ্যমান)
 google_blueprint = make_google_blueprint(
     client_id=os.getenv("GOOGLE_CLIENT_ID"),
@@ -79,22 +125,32 @@ google_blueprint = make_google_blueprint(
     scope=["profile", "email", "openid"], # Added 'openid' scope
     redirect_to="index"
 )
-google_blueprint.backend = SQLAlchemyStorage(OAuth, db.session, user=current_user)
+google_blueprint.storage = oauth_tokens.storage(user=lambda: current_user)
 app.register_blueprint(google_blueprint, url_prefix="/login")
+limiter.limit_endpoint(app, "google.authorized", "oauth_callback_ip")
 
 
 # --- Keycloak Setup using Authlib ---
 oauth = AuthlibOAuth(app) # Create an OAuth instance for Authlib
 
 # Register Keycloak as an OAuth provider
+keycloak_metadata_url = f'{os.getenv("KEYCLOAK_SERVER_URL")}/realms/{os.getenv("KEYCLOAK_REALM")}/.well-known/openid-configuration'
 keycloak = oauth.register(
     name='keycloak',
     client_id=os.getenv("KEYCLOAK_CLIENT_ID"),
     client_secret=os.getenv("KEYCLOAK_CLIENT_SECRET"),
-    server_metadata_url=f'{os.getenv("KEYCLOAK_SERVER_URL")}/realms/{os.getenv("KEYCLOAK_REALM")}/.well-known/openid-configuration',
+    server_metadata_url=keycloak_metadata_url,
     client_kwargs={
         'scope': 'openid email profile', # Define required scopes
     },
+    client_cls=CachedOIDCApp, # Discovery document and JWKS come from the Redis-backed cache
+)
+keycloak.provider_cache = provider_cache_from_env(redis_client, keycloak_metadata_url)
+oauth_tokens.register_provider(
+    'keycloak',
+    lambda: keycloak.load_server_metadata()['token_endpoint'],
+    os.getenv("KEYCLOAK_CLIENT_ID"),
+    os.getenv("KEYCLOAK_CLIENT_SECRET"),
 )
 # ------------------------------------
 
@@ -114,15 +170,23 @@ def login_keycloak():
     return keycloak.authorize_redirect(redirect_uri)
 
 @app.route('/auth/keycloak')
+@limiter.limit("oauth_callback_ip", methods=("GET",))
 def auth_keycloak():
     try:
         # Get the authorization token from Keycloak
         token = keycloak.authorize_access_token()
-        user_info = token.get('userinfo') # Get user info directly from token if available
+        user_info = token.get('userinfo') # Claims from the ID token, verified locally against the cached JWKS
+
+        if not user_info and 'id_token' in token:
+            # Authlib only skips parsing the ID token when the login state has no
+            # nonce; without it a replayed token cannot be told apart, so refuse
+            log.warning("Keycloak login refused: ID token without a nonce in the login state")
+            flash("Keycloak login failed. Please try again.", "danger")
+            return redirect(url_for('login'))
 
         if not user_info:
-            # If userinfo is not in token, fetch it explicitly
-            user_info_response = keycloak.get('userinfo')
+            # Only without an ID token do we need the extra userinfo round-trip
+            user_info_response = keycloak.get(keycloak.load_server_metadata()['userinfo_endpoint'])
             user_info = user_info_response.json()
 
         if user_info:
@@ -142,14 +206,14 @@ def auth_keycloak():
                 # Link to existing user if not already linked
                 oauth_entry = OAuth.query.filter_by(provider='keycloak', provider_user_id=keycloak_user_id).first()
                 if not oauth_entry:
-                    new_oauth = OAuth(
+                    oauth_entry = OAuth(
                         provider='keycloak',
                         provider_user_id=keycloak_user_id,
                         user_id=existing_user.id,
-                        token=token # Store token if needed later
                     )
-                    db.session.add(new_oauth)
-                    db.session.commit()
+                    db.session.add(oauth_entry)
+                oauth_tokens.save(oauth_entry, token) # Encrypted; kept fresh by the background refresher
+                db.session.commit()
                 login_user(existing_user)
                 flash("Successfully signed in with Keycloak.", "success")
                 # Store user info in session for SSO-like behavior (optional, Flask-Login handles this)
@@ -172,9 +236,9 @@ def auth_keycloak():
                     provider='keycloak',
                     provider_user_id=keycloak_user_id,
                     user_id=new_user.id,
-                    token=token
                 )
                 db.session.add(new_oauth)
+                oauth_tokens.save(new_oauth, token)
                 db.session.commit()
 
                 login_user(new_user)
@@ -189,7 +253,7 @@ def auth_keycloak():
             return redirect(url_for('login'))
 
     except Exception as e:
-        print(f"Keycloak OAuth error: {e}") # Log the error for debugging
+        log.exception("Keycloak OAuth error") # Traceback goes to the log, not the request thread's stdout
         flash(f"OAuth error occurred: {str(e)}", "danger")
         return redirect(url_for('login'))
 # ------------------------------------
@@ -255,4 +319,5 @@ with app.app_context():
     db.create_all()
 
 if __name__ == '__main__':
+    oauth_tokens.start()
     app.run(debug=True, host='0.0.0.0', port=5000) # Adjust host/port as needed
\ No newline at end of file
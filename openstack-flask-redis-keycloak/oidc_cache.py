@@ -0,0 +1,133 @@
+# oidc_cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from authlib.integrations.flask_client import FlaskOAuth2App
+
+log = logging.getLogger("oidc_cache")
+
+
+class OIDCProviderCache:
+    """Discovery document and JWKS cached in process memory and in Redis.
+
+    Lookups go memory -> Redis -> Keycloak, so in a multi-worker deployment
+    only one worker per TTL actually fetches ``.well-known/openid-configuration``
+    and the JWKS. When a token is signed with a ``kid`` we have not seen
+    (Keycloak rotated its keys) the JWKS is refreshed, but at most once per
+    ``min_refresh`` seconds across all workers so a forged ``kid`` cannot make
+    us hammer Keycloak.
+    """
+
+    def __init__(self, redis_client, metadata_url, ttl=3600, min_refresh=60, timeout=5):
+        self.redis = redis_client
+        self.metadata_url = metadata_url
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self.timeout = timeout
+        prefix = hashlib.sha1(metadata_url.encode()).hexdigest()[:12]
+        self.metadata_key = f"oidc:{prefix}:metadata"
+        self.jwks_key = f"oidc:{prefix}:jwks"
+        self.refresh_lock_key = f"oidc:{prefix}:jwks-refresh"
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key, url_fn):
+        entry = self._local.get(key)
+        if entry and entry[1] > time.time():
+            return entry[0]
+        with self._lock:
+            entry = self._local.get(key)
+            if entry and entry[1] > time.time():
+                return entry[0]
+            value = self._from_redis(key)
+            if value is None:
+                value = self._fetch(url_fn())
+                self._to_redis(key, value)
+            self._local[key] = (value, time.time() + self.ttl)
+            return value
+
+    def _from_redis(self, key):
+        try:
+            raw = self.redis.get(key)
+        except Exception as e:
+            log.warning("OIDC cache: Redis unavailable: %s", e)
+            return None
+        return json.loads(raw) if raw else None
+
+    def _to_redis(self, key, value):
+        try:
+            self.redis.set(key, json.dumps(value), ex=self.ttl)
+        except Exception as e:
+            log.warning("OIDC cache: could not store key: %s", e, extra={"key": key})
+
+    def _fetch(self, url):
+        resp = requests.get(url, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def metadata(self):
+        return self._get(self.metadata_key, lambda: self.metadata_url)
+
+    def jwks(self):
+        return self._get(self.jwks_key, lambda: self.metadata()["jwks_uri"])
+
+    def refresh_jwks(self):
+        """Re-fetch the JWKS after a key rotation, rate limited across workers."""
+        try:
+            allowed = self.redis.set(self.refresh_lock_key, "1", nx=True, ex=self.min_refresh)
+        except Exception:
+            allowed = True
+        if not allowed:
+            # Someone refreshed recently; pick up their copy from Redis
+            self._local.pop(self.jwks_key, None)
+            return self.jwks()
+        with self._lock:
+            try:
+                value = self._fetch(self.metadata()["jwks_uri"])
+            except Exception as e:
+                entry = self._local.get(self.jwks_key)
+                if entry is None:
+                    raise
+                log.warning("OIDC cache: JWKS refresh failed, keeping cached keys: %s", e)
+                return entry[0]
+            self._to_redis(self.jwks_key, value)
+            self._local[self.jwks_key] = (value, time.time() + self.ttl)
+            return value
+
+
+class CachedOIDCApp(FlaskOAuth2App):
+    """Authlib client whose discovery document and JWKS come from OIDCProviderCache.
+
+    Authlib verifies the ID token locally with these keys, so the user's
+    claims are available in ``token['userinfo']`` without a userinfo call.
+    """
+
+    provider_cache = None
+
+    def load_server_metadata(self):
+        if self.provider_cache is not None and "_loaded_at" not in self.server_metadata:
+            metadata = dict(self.provider_cache.metadata())
+            metadata["_loaded_at"] = time.time()
+            self.server_metadata.update(metadata)
+        return super().load_server_metadata()
+
+    def fetch_jwk_set(self, force=False):
+        if self.provider_cache is None:
+            return super().fetch_jwk_set(force)
+        if force:
+            return self.provider_cache.refresh_jwks()
+        return self.provider_cache.jwks()
+
+
+def provider_cache_from_env(redis_client, metadata_url):
+    return OIDCProviderCache(
+        redis_client,
+        metadata_url,
+        ttl=int(os.getenv("OIDC_CACHE_TTL", 3600)),
+        min_refresh=int(os.getenv("OIDC_JWKS_MIN_REFRESH", 60)),
+    )
@@ -0,0 +1,160 @@
+# rate_limit.py
+import hashlib
+import logging
+import os
+import time
+from functools import wraps
+
+from flask import Response, request
+
+log = logging.getLogger("rate_limit")
+
+# Sliding-window counter: the previous fixed window is weighted by how much
+# of it still overlaps the sliding window. Two small integers per key, one
+# round trip per check, no matter how hard a client is hammering us.
+# ARGV[5] == '0' only checks the window; the attempt is counted later, by
+# RateLimiter.failed, if it turns out to be a failure.
+SLIDING_WINDOW_LUA = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local estimate = previous * (1 - tonumber(ARGV[3])) + current
+if estimate >= tonumber(ARGV[1]) then
+    redis.call('HINCRBY', KEYS[3], ARGV[4] .. ':blocked', 1)
+    return 0
+end
+if ARGV[5] == '0' then
+    return 1
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]) * 2)
+redis.call('HINCRBY', KEYS[3], ARGV[4] .. ':allowed', 1)
+return 1
+"""
+
+STATS_KEY = "rl:stats"
+
+# name -> (limit, window seconds), overridable with RATE_LIMIT_<NAME>="limit/window"
+DEFAULT_LIMITS = {
+    "login_ip": (20, 60),
+    "login_account": (5, 60),
+    "signup_ip": (5, 60),
+    "reset_ip": (5, 60),
+    "reset_account": (3, 900),
+    "oauth_callback_ip": (20, 60),
+}
+
+
+def parse_limit(value):
+    limit, window = value.split("/")
+    return int(limit), int(window)
+
+
+def account_key(value):
+    # Keep raw emails out of Redis keys
+    return hashlib.sha1(value.strip().lower().encode()).hexdigest()[:16]
+
+
+class RateLimiter:
+    """Redis-backed sliding-window rate limiter.
+
+    Checks run before the view body, so a rejected request never reaches
+    the database or a password hash. If Redis is unreachable the limiter
+    fails open and logs a warning rather than locking everyone out.
+
+    With ``failures_only`` the account rule only checks the window before
+    the view runs; the view calls ``failed`` when the attempt fails, so a
+    user who logs in successfully never uses up their own account's quota.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.redis = redis_client
+        self.limits = dict(DEFAULT_LIMITS)
+        self.enabled = True
+        self._script = None
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client=None):
+        self.redis = redis_client or self.redis
+        for name in DEFAULT_LIMITS:
+            value = os.getenv(f"RATE_LIMIT_{name.upper()}")
+            if value:
+                self.limits[name] = parse_limit(value)
+        self.enabled = os.getenv("RATE_LIMIT_ENABLED", "True").lower() in ["true", "1", "t"]
+        self._script = self.redis.register_script(SLIDING_WINDOW_LUA)
+        app.extensions["rate_limiter"] = self
+
+    def hit(self, name, identity, count=True):
+        """Count one attempt; return 0 if allowed, else seconds to wait."""
+        limit, window = self.limits[name]
+        now = time.time()
+        index = int(now // window)
+        elapsed = (now % window) / window
+        keys = [f"rl:{name}:{identity}:{index}", f"rl:{name}:{identity}:{index - 1}", STATS_KEY]
+        try:
+            allowed = self._script(keys=keys, args=[limit, window, elapsed, name, int(count)])
+        except Exception as e:
+            log.warning("Rate limiter unavailable, allowing request: %s", e)
+            return 0
+        if allowed:
+            return 0
+        return max(1, int(window * (1 - elapsed)))
+
+    def check(self, ip_rule=None, account_rule=None, account_field="email", failures_only=False):
+        if not self.enabled:
+            return None
+        checks = []
+        if ip_rule:
+            checks.append((ip_rule, request.remote_addr or "unknown", True))
+        if account_rule:
+            account = request.form.get(account_field)
+            if account:
+                checks.append((account_rule, account_key(account), not failures_only))
+        for rule, identity, count in checks:
+            retry_after = self.hit(rule, identity, count)
+            if retry_after:
+                return too_many_requests(retry_after)
+        return None
+
+    def failed(self, name, account):
+        """Count a failed attempt against an account rule used with failures_only."""
+        if self.enabled and account:
+            self.hit(name, account_key(account))
+
+    def limit(self, ip_rule=None, account_rule=None, methods=("POST",), account_field="email",
+              failures_only=False):
+        """Decorator for views; only the given HTTP methods are counted."""
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if request.method in methods:
+                    rejected = self.check(ip_rule, account_rule, account_field, failures_only)
+                    if rejected is not None:
+                        return rejected
+                return view(*args, **kwargs)
+            return wrapped
+        return decorator
+
+    def limit_endpoint(self, app, endpoint, ip_rule, methods=("GET",)):
+        """Limit a view we do not own, e.g. a Flask-Dance callback."""
+        @app.before_request
+        def _limit_endpoint():
+            if request.endpoint == endpoint and request.method in methods:
+                return self.check(ip_rule)
+
+    def stats(self):
+        raw = self.redis.hgetall(STATS_KEY)
+        counters = {}
+        for field, value in raw.items():
+            name, outcome = field.decode().rsplit(":", 1)
+            counters.setdefault(name, {"allowed": 0, "blocked": 0})[outcome] = int(value)
+        return counters
+
+
+def too_many_requests(retry_after):
+    return Response(
+        f"Too many attempts. Try again in {retry_after} seconds.\n",
+        status=429,
+        headers={"Retry-After": str(retry_after)},
+        mimetype="text/plain",
+    )
@@ -0,0 +1,124 @@
+# benchmarks/bench_metering.py
+#
+# Time cost reports over a synthetic month of usage events: thousands of
+# projects, each with instances that are created, stopped and deleted at
+# random. The vectorised report is checked against a plain Python
+# loop over the same events.
+#
+#   python benchmarks/bench_metering.py
+#   python benchmarks/bench_metering.py --projects 5000 --instances 90
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import metering  # noqa: E402
+from metering import CREATE, DELETE, EVENT, STOP, UsageMeter  # noqa: E402
+
+DAY = 86400
+# m1.tiny .. m1.xlarge
+FLAVORS = [("1", 1, 512), ("2", 1, 2048), ("3", 2, 4096), ("4", 4, 8192), ("5", 8, 16384)]
+
+
+def write_log(path, projects, instances, month_start, seed):
+    """A month of create, stop and delete events; returns the event count."""
+    rng = np.random.default_rng(seed)
+    count = projects * instances
+    with open(path + ".names", "w") as f:
+        for i in range(count):
+            f.write(f"instance\tserver-{i}\n")
+        for p in range(projects):
+            f.write(f"user\tuser-{p}\n")
+            f.write(f"project\tproject-{p}\n")
+        for flavor_id, vcpus, ram in FLAVORS:
+            f.write(f"flavor\t{flavor_id}\t{vcpus}\t{ram}\n")
+
+    # create, stop, delete, at sorted random times in the month
+    per_instance = 3
+    times = np.sort(rng.uniform(month_start, month_start + 30 * DAY, (count, per_instance)), axis=1)
+    kinds = np.array([CREATE, STOP, DELETE], dtype="u1")
+    alive = rng.random(count) < 0.3  # these are still running at the end: drop their last two events
+    events = np.zeros((count, per_instance), EVENT)
+    events["ts"] = times
+    events["instance"] = np.arange(count)[:, None]
+    events["user"] = events["project"] = (np.arange(count) // instances)[:, None]
+    events["flavor"] = rng.integers(0, len(FLAVORS), count)[:, None]
+    events["event"] = kinds
+    keep = np.ones((count, per_instance), bool)
+    keep[alive, -2:] = False
+    events = events[keep]
+    events = events[np.argsort(events["ts"], kind="stable")]  # appended in time order
+    events.tofile(path)
+    return len(events)
+
+
+def python_costs(events, rates, start, end, owners):
+    """The same report, one event at a time."""
+    total = [0.0] * owners
+    last = {}
+    for ts, instance, user, project, flavor, kind, _ in events.tolist():
+        if ts >= end:
+            break
+        previous = last.get(instance)
+        if previous is not None and previous[1] == CREATE:
+            total[previous[2]] += max(0.0, min(ts, end) - max(previous[0], start)) / 3600 * rates[previous[3]]
+        last[instance] = (ts, kind, project, flavor)
+    for ts, kind, project, flavor in last.values():
+        if kind == CREATE:
+            total[project] += max(0.0, end - max(ts, start)) / 3600 * rates[flavor]
+    return np.array(total)
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost report speed over a month of usage events")
+    parser.add_argument("--projects", type=int, default=5000)
+    parser.add_argument("--instances", type=int, default=90, help="instances per project")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-metering-"), "usage.log")
+    month_start = time.time() - 30 * DAY
+    started = time.perf_counter()
+    count = write_log(path, args.projects, args.instances, month_start, args.seed)
+    print(f"{count:,} events, {os.path.getsize(path) / 1e6:.0f} MB, written in {time.perf_counter() - started:.1f} s")
+
+    meter = UsageMeter(path=path)
+    month_end = month_start + 30 * DAY
+    week = (month_end - 7 * DAY, month_end)
+    for label, (start, end), by in (
+        ("month by project", (month_start, month_end), "project"),
+        ("month by user", (month_start, month_end), "user"),
+        ("last week by project", week, "project"),
+    ):
+        seconds, (ids, hours, cost) = timed(lambda: meter.costs(start, end, by), args.repeat)
+        print(f"{label:22} {seconds * 1000:8.1f} ms  {len(ids):,} {by}s, total {cost.sum():,.2f}")
+
+    seconds, report = timed(lambda: meter.report(month_start, month_end), args.repeat)
+    print(f"{'report() as JSON rows':22} {seconds * 1000:8.1f} ms  {len(report):,} rows")
+
+    started = time.perf_counter()
+    expected = python_costs(np.fromfile(path, EVENT), meter._rates(), week[0], week[1], args.projects)
+    python_seconds = time.perf_counter() - started
+    _, _, cost = meter.costs(*week)
+    assert np.allclose(cost, expected), "vectorised and Python reports differ"
+    print(f"{'Python loop, last week':22} {python_seconds * 1000:8.1f} ms  (same totals)")
+    print(f"rates: {metering.PRICE_VCPU_HOUR}/vCPU-hour, {metering.PRICE_GB_RAM_HOUR}/GB-hour")
+
+
+if __name__ == "__main__":
+    main()
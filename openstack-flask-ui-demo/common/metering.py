@@ -0,0 +1,195 @@
+# metering.py
+#
+# Usage metering and cost reports, shared by the 02 and 03 apps (04 only uses
+# estimate()). Every create, stop and delete the app makes is appended to a
+# binary event log, 24 bytes per event. Instance, user, project and flavor ids are stored as small integers;
+# the ids themselves go to a names file next to the log, once each.
+#
+#   meter = UsageMeter(conn)
+#   meter.record(CREATE, server.id, user_id, project_id, flavor_id)
+#   meter.report(start, end, by="project")   # [{"project": ..., "hours": ..., "cost": ...}]
+#
+# A report maps the whole log into NumPy arrays and prices it in a few
+# vectorised passes: a month of events for thousands of projects takes well
+# under a second. An instance is billed while it is running, from its create
+# event to the next event of the same instance, at its flavor's hourly
+# rate (PRICE_VCPU_HOUR per vCPU plus PRICE_GB_RAM_HOUR per GB of RAM).
+#
+# One process writes the log: run the app as a single process (`python app.py`).
+import os
+import threading
+import time
+
+import numpy as np
+
+CREATE, STOP, DELETE = 1, 3, 4  # 2 is not used: no app starts instances it meters
+EVENTS = {"create": CREATE, "stop": STOP, "delete": DELETE}
+
+EVENT = np.dtype([
+    ("ts", "<f8"),         # epoch seconds
+    ("instance", "<u4"),
+    ("user", "<u4"),
+    ("project", "<u4"),
+    ("flavor", "<u2"),
+    ("event", "u1"),
+    ("_pad", "u1"),
+])
+
+PRICE_VCPU_HOUR = float(os.getenv("PRICE_VCPU_HOUR", 0.02))
+PRICE_GB_RAM_HOUR = float(os.getenv("PRICE_GB_RAM_HOUR", 0.005))
+
+# Rates for the quick estimate on the calculate_cost page
+PRICE_INSTANCE_HOUR = float(os.getenv("PRICE_INSTANCE_HOUR", 0.05))
+PRICE_STORAGE_GB = float(os.getenv("PRICE_STORAGE_GB", 0.10))
+PRICE_TRANSFER_GB = float(os.getenv("PRICE_TRANSFER_GB", 0.09))
+
+
+def estimate(instance_seconds, storage_gb, transfer_gb):
+    """Cost of the given usage at the flat rates above."""
+    return (
+        instance_seconds / 3600 * PRICE_INSTANCE_HOUR
+        + storage_gb * PRICE_STORAGE_GB
+        + transfer_gb * PRICE_TRANSFER_GB
+    )
+
+
+class _Names:
+    """Ids of one kind, numbered in the order they were first seen."""
+
+    __slots__ = ("ids", "index")
+
+    def __init__(self):
+        self.ids = []
+        self.index = {}
+
+    def add(self, name):
+        self.index[name] = len(self.ids)
+        self.ids.append(name)
+
+
+class UsageMeter:
+    def __init__(self, conn=None, path=None):
+        self.conn = conn  # only used to look up flavor sizes
+        self.path = path or os.getenv("METERING_LOG", "usage.log")
+        self._lock = threading.Lock()
+        self._names = {kind: _Names() for kind in ("instance", "user", "project", "flavor")}
+        self._sizes = []  # flavor number -> (vcpus, ram MB)
+        self._load_names()
+        self._log = open(self.path, "ab")
+        self._names_file = open(self.path + ".names", "a", encoding="utf-8")
+
+    def record(self, event, instance_id, user_id, project_id, flavor, ts=None):
+        """Append one event. ``flavor`` is a flavor id, or a flavor object with ``vcpus`` and ``ram``."""
+        row = np.zeros(1, EVENT)
+        with self._lock:
+            row["ts"] = time.time() if ts is None else ts
+            row["instance"] = self._number("instance", instance_id)
+            row["user"] = self._number("user", user_id or "")
+            row["project"] = self._number("project", project_id or "")
+            row["flavor"] = self._flavor_number(flavor)
+            row["event"] = EVENTS.get(event, event)
+            self._names_file.flush()  # names before the events that use them
+            self._log.write(row.tobytes())
+            self._log.flush()
+
+    def events(self):
+        """The whole log as a structured array (memory-mapped, not copied)."""
+        with self._lock:
+            self._log.flush()
+            count = os.path.getsize(self.path) // EVENT.itemsize  # ignore a torn last write
+        if count == 0:
+            return np.zeros(0, EVENT)
+        return np.memmap(self.path, EVENT, mode="r", shape=(count,))
+
+    def costs(self, start, end, by="project"):
+        """Billed hours and cost per ``by`` (project or user) between ``start`` and ``end`` (epoch seconds).
+
+        Returns ``(ids, hours, cost)``: the ids of that kind and two arrays indexed like them.
+        """
+        events = self.events()
+        with self._lock:
+            ids = list(self._names[by].ids)
+            rates = self._rates()
+        ts = events["ts"]
+        in_order = bool(np.all(ts[1:] >= ts[:-1]))  # appended in time order, unless the clock stepped back
+        if in_order:
+            events = events[:np.searchsorted(ts, end)]
+        else:
+            events = events[ts < end]
+        if len(events) == 0:
+            return ids, np.zeros(len(ids)), np.zeros(len(ids))
+
+        # Each instance's events in time order; every event opens an interval
+        # that the next event of the same instance closes
+        ts, instance = events["ts"], events["instance"]
+        order = _stable_order(instance) if in_order else np.lexsort((ts, instance))
+        ts, instance = ts[order], instance[order]
+        kind, flavor, owner = events["event"][order], events["flavor"][order], events[by][order]
+        until = np.full(len(ts), float(end))
+        same = instance[1:] == instance[:-1]
+        until[:-1][same] = ts[1:][same]
+
+        running = kind == CREATE
+        seconds = np.clip(np.minimum(until, end) - np.maximum(ts, start), 0, None) * running
+        cost = seconds / 3600 * rates[flavor]
+
+        hours = np.bincount(owner, weights=seconds, minlength=len(ids)) / 3600
+        return ids, hours, np.bincount(owner, weights=cost, minlength=len(ids))
+
+    def report(self, start, end, by="project"):
+        """Costs between ``start`` and ``end`` as a list of dicts, most expensive first."""
+        ids, hours, cost = self.costs(start, end, by)
+        billed = np.flatnonzero(hours)
+        billed = billed[np.argsort(-cost[billed], kind="stable")]
+        return [{by: ids[i], "hours": round(float(hours[i]), 3), "cost": round(float(cost[i]), 4)} for i in billed]
+
+    def _rates(self):
+        sizes = np.array(self._sizes or [(0, 0)], dtype=float).reshape(-1, 2)
+        return sizes[:, 0] * PRICE_VCPU_HOUR + sizes[:, 1] / 1024 * PRICE_GB_RAM_HOUR
+
+    def _number(self, kind, name):
+        names = self._names[kind]
+        number = names.index.get(name)
+        if number is None:
+            number = len(names.ids)
+            names.add(name)
+            self._names_file.write(f"{kind}\t{name}\n")
+        return number
+
+    def _flavor_number(self, flavor):
+        if isinstance(flavor, str):
+            key, size = flavor, None
+        else:
+            # A server's embedded flavor (microversion 2.47+) has a name and a size but no id
+            key, size = flavor.id or flavor.original_name or flavor.name, (flavor.vcpus, flavor.ram)
+        names = self._names["flavor"]
+        number = names.index.get(key)
+        if number is None:
+            if size is None or size[0] is None:
+                found = self.conn.compute.get_flavor(key)
+                size = (found.vcpus, found.ram)
+            number = len(names.ids)
+            names.add(key)
+            self._sizes.append(size)
+            self._names_file.write(f"flavor\t{key}\t{size[0]}\t{size[1]}\n")
+        return number
+
+    def _load_names(self):
+        if not os.path.exists(self.path + ".names"):
+            return
+        with open(self.path + ".names", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # torn last write
+                fields = line[:-1].split("\t")
+                self._names[fields[0]].add(fields[1])
+                if fields[0] == "flavor":
+                    self._sizes.append((int(fields[2]), int(fields[3])))
+
+
+def _stable_order(keys):
+    """``np.argsort(keys, kind="stable")`` for uint32 keys, as up to two 16-bit radix passes."""
+    order = np.argsort((keys & 0xFFFF).astype(np.uint16), kind="stable")
+    if len(keys) and keys.max() > 0xFFFF:
+        order = order[np.argsort((keys[order] >> 16).astype(np.uint16), kind="stable")]
+    return order
@@ -0,0 +1,109 @@
+# tests/test_metering.py
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import metering
+from metering import CREATE, DELETE, STOP, UsageMeter
+
+HOUR = 3600.0
+SMALL = SimpleNamespace(id="small", original_name=None, name="small", vcpus=1, ram=1024)
+LARGE = SimpleNamespace(id="large", original_name=None, name="large", vcpus=4, ram=8192)
+
+
+def rate(flavor):
+    return flavor.vcpus * metering.PRICE_VCPU_HOUR + flavor.ram / 1024 * metering.PRICE_GB_RAM_HOUR
+
+
+@pytest.fixture
+def meter(tmp_path):
+    return UsageMeter(path=str(tmp_path / "usage.log"))
+
+
+def test_an_instance_is_billed_from_create_to_its_next_event(meter):
+    meter.record(CREATE, "vm-1", "ada", "p1", SMALL, ts=0)
+    meter.record(STOP, "vm-1", "ada", "p1", SMALL, ts=2 * HOUR)
+    meter.record(DELETE, "vm-1", "ada", "p1", SMALL, ts=5 * HOUR)
+    meter.record(CREATE, "vm-2", "bob", "p2", LARGE, ts=HOUR)  # still running at the end
+
+    report = meter.report(0, 10 * HOUR)
+
+    assert report == [
+        {"project": "p2", "hours": 9.0, "cost": round(9 * rate(LARGE), 4)},
+        {"project": "p1", "hours": 2.0, "cost": round(2 * rate(SMALL), 4)},
+    ]
+
+
+def test_intervals_are_clipped_to_the_window(meter):
+    meter.record(CREATE, "vm-1", "ada", "p1", SMALL, ts=0)
+    meter.record(DELETE, "vm-1", "ada", "p1", SMALL, ts=4 * HOUR)
+    meter.record(CREATE, "vm-2", "ada", "p1", SMALL, ts=20 * HOUR)  # after the window
+
+    ids, hours, cost = meter.costs(HOUR, 3 * HOUR)
+
+    assert ids == ["p1"]
+    assert hours.tolist() == [2.0]
+    assert cost[0] == pytest.approx(2 * rate(SMALL))
+    assert meter.report(5 * HOUR, 6 * HOUR) == []
+
+
+def test_costs_by_user(meter):
+    meter.record(CREATE, "vm-1", "ada", "p1", SMALL, ts=0)
+    meter.record(CREATE, "vm-2", "bob", "p1", SMALL, ts=0)
+    meter.record(DELETE, "vm-2", "bob", "p1", SMALL, ts=HOUR)
+
+    report = meter.report(0, 3 * HOUR, by="user")
+
+    assert [(row["user"], row["hours"]) for row in report] == [("ada", 3.0), ("bob", 1.0)]
+
+
+def test_events_out_of_time_order_are_priced_the_same(meter, tmp_path):
+    ordered = UsageMeter(path=str(tmp_path / "ordered.log"))
+    events = [(CREATE, "vm-1", 0), (CREATE, "vm-2", HOUR), (STOP, "vm-1", 3 * HOUR), (DELETE, "vm-2", 4 * HOUR)]
+    for event, instance, ts in events:
+        ordered.record(event, instance, "ada", "p1", SMALL, ts=ts)
+    for event, instance, ts in [events[1], events[3], events[0], events[2]]:  # the clock stepped back
+        meter.record(event, instance, "ada", "p1", SMALL, ts=ts)
+
+    assert meter.report(0, 10 * HOUR) == ordered.report(0, 10 * HOUR)
+    assert meter.report(0, 10 * HOUR)[0]["hours"] == 6.0
+
+
+def test_the_log_survives_a_restart_and_a_torn_write(meter):
+    meter.record(CREATE, "vm-1", "ada", "p1", SMALL, ts=0)
+    meter.record(CREATE, "vm-2", "ada", "p1", LARGE, ts=0)
+    meter._log.write(b"\x00" * 10)  # the process died mid-event
+    meter._log.flush()
+
+    reopened = UsageMeter(path=meter.path)
+
+    assert len(reopened.events()) == 2
+    assert reopened.report(0, HOUR)[0]["cost"] == round(rate(SMALL) + rate(LARGE), 4)
+
+
+def test_flavor_ids_are_looked_up_once(tmp_path):
+    calls = []
+
+    class Compute:
+        def get_flavor(self, flavor_id):
+            calls.append(flavor_id)
+            return SMALL
+
+    meter = UsageMeter(SimpleNamespace(compute=Compute()), path=str(tmp_path / "usage.log"))
+    meter.record(CREATE, "vm-1", "ada", "p1", "1", ts=0)
+    meter.record(CREATE, "vm-2", "ada", "p1", "1", ts=0)
+
+    assert calls == ["1"]
+    assert meter.report(0, HOUR)[0]["hours"] == 2.0
+
+
+def test_empty_log(meter):
+    ids, hours, cost = meter.costs(0, HOUR)
+    assert (ids, len(hours), len(cost)) == ([], 0, 0)
+    assert meter.report(0, HOUR) == []
+
+
+def test_stable_order_matches_a_stable_argsort():
+    keys = np.random.default_rng(0).integers(0, 200_000, 5_000).astype(np.uint32)
+    assert (metering._stable_order(keys) == np.argsort(keys, kind="stable")).all()
@@ -1,12 +1,20 @@
 import openstack
+import os
+import sys
+import time
 from flask import Flask, jsonify, request, render_template
 from openstack import connection
 import threading
+# metering.py lives in ../common, shared with the other apps
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from metering import CREATE, DELETE, STOP, UsageMeter, estimate
 
 app = Flask(__name__)
 
 # Establish OpenStack connection
 conn = connection.Connection(cloud='openstack')
+# Instance state changes, for the cost reports
+meter = UsageMeter(conn)
 
 @app.route('/')
 def home():
@@ -42,7 +50,8 @@ def create_instance():
             flavor_id=flavor_id,
             networks=[{"uuid": network_id}]
         )
-        
+        meter.record(CREATE, instance.id, conn.current_user_id, conn.current_project_id, flavor_id)
+
         conn.compute.wait_for_server(instance)
 
         if package_type == 'free':
@@ -57,16 +66,42 @@ def create_instance():
     return render_template('create_instance.html', images=images, flavors=flavors, networks=networks)
 
 def shutdown_instance(instance_id):
-    conn.compute.stop_server(instance_id)
+    instance = conn.compute.get_server(instance_id)
+    conn.compute.stop_server(instance)
+    meter.record(STOP, instance.id, instance.user_id, instance.project_id, instance.flavor)
 
 @app.route('/instances/<instance_id>', methods=['DELETE'])
 def delete_instance(instance_id):
     instance = conn.compute.get_server(instance_id)
     if instance:
         conn.compute.delete_server(instance)
+        meter.record(DELETE, instance.id, instance.user_id, instance.project_id, instance.flavor)
         return jsonify({'status': 'Instance deleted'})
     else:
         return jsonify({'error': 'Instance not found'}), 404
 
+@app.route('/calculate_cost', methods=['GET', 'POST'])
+def calculate_cost():
+    if request.method == 'GET':
+        return render_template('calculate_cost.html')
+    data = request.get_json(silent=True) or request.form
+    try:
+        total_cost = estimate(
+            float(data['instance_usage_time']), float(data['storage_usage']), float(data['data_transferred'])
+        )
+    except (KeyError, ValueError):
+        return jsonify({'error': 'instance_usage_time, storage_usage and data_transferred must be numbers'}), 400
+    return jsonify({'total_cost': total_cost})
+
+@app.route('/api/costs', methods=['GET'])
+def usage_costs():
+    # Metered cost per project or user; start/end are epoch seconds, the default is the last 30 days
+    by = request.args.get('by', 'project')
+    if by not in ('project', 'user'):
+        return jsonify({'error': "by must be 'project' or 'user'"}), 400
+    end = request.args.get('end', time.time(), type=float)
+    start = request.args.get('start', end - 30 * 86400, type=float)
+    return jsonify({'by': by, 'start': start, 'end': end, 'costs': meter.report(start, end, by)})
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port='5000')
@@ -1,12 +1,26 @@
 import openstack
+import os
+import sys
+import time
 from flask import Flask, jsonify, request, render_template
 from openstack import connection
 import threading
+from quota import QuotaExceeded, QuotaGuard
+from floating_ips import FloatingIPPool
+# metering.py lives in ../common, shared with the other apps
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from metering import CREATE, DELETE, STOP, UsageMeter, estimate
 
 app = Flask(__name__)
 
 # Establish OpenStack connection
 conn = connection.Connection(cloud='openstack')
+# Cached quota and usage: launches that cannot fit are refused before calling Nova
+quota = QuotaGuard(conn)
+# Pre-allocated floating IPs, handed out at launch and taken back on delete
+ip_pool = FloatingIPPool(conn, os.getenv("FLOATING_NETWORK", "public"), quota=quota)
+# Instance state changes, for the cost reports
+meter = UsageMeter(conn)
 
 @app.route('/')
 def home():
@@ -15,7 +29,11 @@ def home():
 @app.route('/instances', methods=['GET'])
 def list_instances():
     instances = conn.compute.servers()
-    instance_list = [{'name': instance.name, 'status': instance.status, 'id': instance.id} for instance in instances]
+    instance_list = [{
+        'name': instance.name, 'status': instance.status, 'id': instance.id,
+        'floating': [address['addr'] for addresses in (instance.addresses or {}).values()
+                     for address in addresses if address.get('OS-EXT-IPS:type') == 'floating'],
+    } for instance in instances]
     return render_template('list_instances.html', instances=instance_list)
 
 @app.route('/api/images', methods=['GET'])
@@ -47,21 +65,42 @@ def create_instance():
     package_type = request.form['package']
     ssh_key_name = request.form['ssh_key']
 
-    # Create the server
-    instance = conn.compute.create_server(
-        name=name,
-        image_id=image_id,
-        flavor_id=flavor_id,
-        networks=[{"uuid": network_id}],
-        key_name=ssh_key_name
-    )
-
-    # Wait for the server to be active
-    conn.compute.wait_for_server(instance)
+    # Check cores, RAM and instances against the quota first, then take the
+    # floating IP: from the pool, or allocated within the floating IP quota
+    project_id = conn.current_project_id
+    try:
+        reservation = quota.reserve(project_id, flavor_id)
+    except QuotaExceeded as e:
+        return jsonify({'error': str(e)}), 403
 
-    # Allocate a floating IP and associate it with the instance
-    floating_ip = conn.network.create_ip(floating_network_id='public')  # Replace 'public' with your actual floating network ID
-    conn.compute.add_floating_ip_to_server(instance, floating_ip.floating_ip_address)
+    # Create the server
+    with reservation:
+        try:
+            floating_ip = ip_pool.acquire(project_id)
+        except QuotaExceeded as e:
+            return jsonify({'error': str(e)}), 403
+        try:
+            instance = conn.compute.create_server(
+                name=name,
+                image_id=image_id,
+                flavor_id=flavor_id,
+                networks=[{"uuid": network_id}],
+                key_name=ssh_key_name
+            )
+        except Exception:
+            ip_pool.put(project_id, floating_ip)
+            raise
+        reservation.commit()
+    meter.record(CREATE, instance.id, conn.current_user_id, project_id, flavor_id)
+
+    # Wait for the server to be active, then associate the floating IP with it
+    try:
+        conn.compute.wait_for_server(instance)
+        conn.compute.add_floating_ip_to_server(instance, floating_ip[1])
+    except Exception:
+        ip_pool.put(project_id, floating_ip)
+        raise
+    ip_pool.associated(floating_ip)
 
     if package_type == 'free':
         # Schedule instance shutdown after 10 minutes
@@ -70,16 +109,45 @@ def create_instance():
     return jsonify({'name': instance.name, 'status': instance.status, 'id': instance.id})
 
 def shutdown_instance(instance_id):
-    conn.compute.stop_server(instance_id)
+    instance = conn.compute.get_server(instance_id)
+    conn.compute.stop_server(instance)
+    meter.record(STOP, instance.id, instance.user_id, instance.project_id, instance.flavor)
 
 @app.route('/instances/<instance_id>', methods=['DELETE'])
 def delete_instance(instance_id):
     instance = conn.compute.get_server(instance_id)
     if instance:
+        ip_pool.reclaim(instance.project_id, instance)
         conn.compute.delete_server(instance)
+        quota.release(instance.project_id, instance.flavor)
+        meter.record(DELETE, instance.id, instance.user_id, instance.project_id, instance.flavor)
         return jsonify({'status': 'Instance deleted'})
     else:
         return jsonify({'error': 'Instance not found'}), 404
 
+@app.route('/calculate_cost', methods=['GET', 'POST'])
+def calculate_cost():
+    if request.method == 'GET':
+        return render_template('calculate_cost.html')
+    data = request.get_json(silent=True) or request.form
+    try:
+        total_cost = estimate(
+            float(data['instance_usage_time']), float(data['storage_usage']), float(data['data_transferred'])
+        )
+    except (KeyError, ValueError):
+        return jsonify({'error': 'instance_usage_time, storage_usage and data_transferred must be numbers'}), 400
+    return jsonify({'total_cost': total_cost})
+
+@app.route('/api/costs', methods=['GET'])
+def usage_costs():
+    # Metered cost per project or user; start/end are epoch seconds, the default is the last 30 days
+    by = request.args.get('by', 'project')
+    if by not in ('project', 'user'):
+        return jsonify({'error': "by must be 'project' or 'user'"}), 400
+    end = request.args.get('end', time.time(), type=float)
+    start = request.args.get('start', end - 30 * 86400, type=float)
+    return jsonify({'by': by, 'start': start, 'end': end, 'costs': meter.report(start, end, by)})
+
 if __name__ == '__main__':
+    ip_pool.start()
     app.run(debug=True, host='0.0.0.0', port='5000')
@@ -0,0 +1,192 @@
+# floating_ips.py
+#
+# Floating IP pool. Allocating a floating IP for every launch costs a Neutron
+# round trip on the request path, and IPs that are never released drain the
+# public network. FloatingIPPool keeps a few allocated, unassociated IPs per
+# project ready to hand out, and takes them back when an instance is deleted.
+#
+#   ip = pool.acquire(project_id)           # (id, address), usually without an API call
+#   conn.compute.add_floating_ip_to_server(server, ip[1])
+#   ...
+#   pool.reclaim(project_id, server)        # before delete_server
+#
+# With a quota.QuotaGuard, every IP the pool allocates is first reserved
+# against the project's floating IP quota, and every IP it releases is given
+# back, so the guard's count includes the IPs waiting in the pool. acquire()
+# raises QuotaExceeded when the pool is empty and the quota is used up.
+#
+# A reconciler lists the pool's IPs in one call every
+# FLOATING_IP_RECONCILE_INTERVAL seconds. IPs that are unassociated but not
+# in the pool (a launch that crashed, a restart) are put back in the pool, or
+# released when the pool is full. Only IPs the pool allocated itself, marked
+# by their description, are ever touched, and only once they are a minute old
+# so that a launch still attaching one is left alone.
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from quota import QuotaExceeded
+
+log = logging.getLogger("floating_ips")
+
+DESCRIPTION = "ui-demo floating IP pool"
+GRACE = timedelta(seconds=60)
+
+
+class FloatingIPPool:
+    def __init__(self, conn, network="public", size=None, interval=None, quota=None):
+        self.conn = conn
+        self.network = network
+        self.quota = quota  # QuotaGuard told about allocations and releases, or None
+        self.size = int(size if size is not None else os.getenv("FLOATING_IP_POOL_SIZE", 2))
+        self.max_free = self.size * 2
+        self.interval = float(interval if interval is not None else os.getenv("FLOATING_IP_RECONCILE_INTERVAL", 300))
+        self._network_id = None
+        self._lock = threading.Lock()
+        self._free = {}        # project id -> deque of (id, address)
+        self._leased = set()   # ids handed out and not yet associated
+        self._filling = set()  # projects with a top-up running
+        self._stop = threading.Event()
+
+    @property
+    def network_id(self):
+        # Neutron takes the floating network by ID only; look the name up once
+        if self._network_id is None:
+            network = self.conn.network.find_network(self.network)
+            if network is None:
+                raise LookupError(f"External network '{self.network}' not found")
+            self._network_id = network.id
+        return self._network_id
+
+    def available(self, project_id):
+        with self._lock:
+            return len(self._free.get(project_id, ()))
+
+    def acquire(self, project_id):
+        """A free floating IP of ``project_id`` as ``(id, address)``; allocated now if the pool is empty.
+
+        The IP is taken (or reserved against the quota) before anything else
+        can, so two launches never count on the same one.
+        """
+        with self._lock:
+            free = self._free.setdefault(project_id, deque())
+            ip = free.popleft() if free else None
+            if ip is not None:
+                self._leased.add(ip[0])
+        if ip is None:
+            ip = self._allocate(project_id)
+            with self._lock:
+                self._leased.add(ip[0])
+        self._top_up(project_id)
+        return ip
+
+    def associated(self, ip):
+        """``ip`` is attached to a server; the reconciler may look at it again."""
+        with self._lock:
+            self._leased.discard(ip[0])
+
+    def put(self, project_id, ip):
+        """Give back an unassociated IP, e.g. when the launch it was for failed."""
+        with self._lock:
+            self._leased.discard(ip[0])
+            free = self._free.setdefault(project_id, deque())
+            if ip in free:
+                return
+            keep = len(free) < self.max_free
+            if keep:
+                free.append(ip)
+        if not keep:
+            self._delete(project_id, ip)
+
+    def reclaim(self, project_id, server):
+        """Detach ``server``'s floating IPs and return them to the pool; call before deleting it."""
+        for addresses in (server.addresses or {}).values():
+            for address in addresses:
+                if address.get("OS-EXT-IPS:type") != "floating":
+                    continue
+                for ip in self.conn.network.ips(floating_ip_address=address["addr"]):
+                    self.conn.network.update_ip(ip, port_id=None)
+                    if ip.description == DESCRIPTION:
+                        self.put(project_id, (ip.id, ip.floating_ip_address))
+
+    def reconcile(self):
+        """Take back leaked IPs in bulk; those that do not fit in the pool are released."""
+        cutoff = datetime.now(timezone.utc) - GRACE
+        with self._lock:
+            known = {ip[0] for free in self._free.values() for ip in free} | self._leased
+        leaked = [
+            ip for ip in self.conn.network.ips(floating_network_id=self.network_id, description=DESCRIPTION)
+            if not ip.port_id and ip.id not in known and _created(ip) < cutoff
+        ]
+        for ip in leaked:
+            self.put(ip.project_id, (ip.id, ip.floating_ip_address))
+        if leaked:
+            log.info("Reclaimed leaked floating IPs", extra={"count": len(leaked)})
+        return len(leaked)
+
+    def start(self):
+        threading.Thread(target=self._run, name="floating-ip-reconciler", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.reconcile()
+            except Exception:
+                log.exception("Floating IP reconcile failed")
+            self._stop.wait(self.interval)
+
+    def _allocate(self, project_id):
+        if self.quota is None:
+            return self._create(project_id)
+        with self.quota.reserve_floating_ips(project_id) as reservation:
+            ip = self._create(project_id)
+            reservation.commit()
+        return ip
+
+    def _create(self, project_id):
+        ip = self.conn.network.create_ip(
+            floating_network_id=self.network_id, project_id=project_id, description=DESCRIPTION,
+        )
+        return ip.id, ip.floating_ip_address
+
+    def _delete(self, project_id, ip):
+        try:
+            self.conn.network.delete_ip(ip[0], ignore_missing=True)
+        except Exception:
+            log.exception("Could not release floating IP", extra={"floating_ip": ip[1]})
+            return
+        if self.quota is not None:
+            self.quota.add_floating_ips(project_id, -1)
+
+    def _top_up(self, project_id):
+        with self._lock:
+            if project_id in self._filling or len(self._free[project_id]) >= self.size:
+                return
+            self._filling.add(project_id)
+        threading.Thread(target=self._fill, args=(project_id,), name="floating-ip-fill", daemon=True).start()
+
+    def _fill(self, project_id):
+        try:
+            while self.available(project_id) < self.size:
+                ip = self._allocate(project_id)
+                with self._lock:
+                    self._free[project_id].append(ip)
+        except QuotaExceeded as e:
+            log.info("Floating IP pre-allocation stopped: %s", e, extra={"project_id": project_id})
+        except Exception:
+            # Out of quota or addresses: launches fall back to allocating on demand
+            log.warning("Floating IP pre-allocation stopped", exc_info=True, extra={"project_id": project_id})
+        finally:
+            with self._lock:
+                self._filling.discard(project_id)
+
+
+def _created(ip):
+    if not ip.created_at:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    return datetime.fromisoformat(ip.created_at.replace("Z", "+00:00"))
@@ -0,0 +1,133 @@
+# tests/test_floating_ips.py
+import time
+from datetime import timedelta
+
+import pytest
+
+import floating_ips
+from floating_ips import DESCRIPTION, FloatingIPPool
+from quota import QuotaExceeded, QuotaGuard
+
+
+@pytest.fixture
+def project(conn):
+    return conn.current_project_id
+
+
+def settled(pool, timeout=5.0):
+    """Wait for the pool's background top-ups to finish."""
+    deadline = time.monotonic() + timeout
+    while pool._filling:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def allocated(simulator):
+    return {r["id"] for r in simulator.state.floatingips.values() if r["description"] == DESCRIPTION}
+
+
+def test_acquire_allocates_on_demand_then_tops_up(conn, simulator, project):
+    pool = FloatingIPPool(conn, size=2, interval=60)
+
+    ip = pool.acquire(project)
+    assert settled(pool)
+    assert pool.available(project) == 2
+    assert len(allocated(simulator)) == 3
+
+    spare = set(ip[0] for ip in pool._free[project])
+    assert pool.acquire(project)[0] in spare  # from the pool, no allocation on the request path
+    assert ip[0] not in spare
+
+
+def test_put_keeps_ips_up_to_twice_the_size_and_releases_the_rest(conn, simulator, project):
+    pool = FloatingIPPool(conn, size=1, interval=60)
+    ips = [pool._create(project) for _ in range(3)]
+
+    for ip in ips:
+        pool.put(project, ip)
+    pool.put(project, ips[0])  # already back: not kept twice
+
+    assert pool.available(project) == 2
+    assert allocated(simulator) == {ips[0][0], ips[1][0]}
+
+
+def test_reclaim_detaches_and_pools_the_servers_ip(conn, simulator, project):
+    pool = FloatingIPPool(conn, size=1, interval=60)
+    server = conn.compute.create_server(name="vm", image_id=next(iter(simulator.state.images)), flavor_id="1",
+                                        networks=[{"uuid": simulator.state.private["id"]}])
+    ip = pool.acquire(project)
+    assert settled(pool)
+    conn.compute.add_floating_ip_to_server(server, ip[1])
+    pool.associated(ip)
+    other = conn.network.create_ip(floating_network_id=simulator.state.public["id"])  # not the pool's
+    conn.compute.add_floating_ip_to_server(server, other.floating_ip_address)
+
+    pool.reclaim(project, conn.compute.get_server(server.id))
+
+    assert list(pool._free[project])[-1] == ip
+    assert simulator.state.floatingips[ip[0]]["port_id"] is None
+    assert simulator.state.floatingips[other.id]["port_id"] is None
+    assert other.id not in allocated(simulator)
+
+
+def test_reconcile_takes_back_only_old_leaked_pool_ips(conn, simulator, project, monkeypatch):
+    crashed = FloatingIPPool(conn, size=0, interval=60)
+    leaked = crashed.acquire(project)  # never associated: the worker died
+    held = crashed.acquire(project)
+    conn.network.create_ip(floating_network_id=simulator.state.public["id"])  # someone else's
+
+    pool = FloatingIPPool(conn, size=2, interval=60)
+    pool._leased.add(held[0])
+    assert pool.reconcile() == 0  # too young: a launch may still be attaching it
+
+    monkeypatch.setattr(floating_ips, "GRACE", timedelta(0))
+    assert pool.reconcile() == 1
+    assert list(pool._free[project]) == [leaked]
+
+
+def test_pool_ips_count_against_the_floating_ip_quota(conn, simulator, project):
+    simulator.state.default_quota.update(floatingip=3)
+    guard = QuotaGuard(conn, ttl=3600)
+    pool = FloatingIPPool(conn, size=2, interval=60, quota=guard)
+
+    pool.acquire(project)
+    assert settled(pool)
+    assert guard.usage(project)["floating_ips"] == (3, 0, 3)  # one handed out, two waiting
+
+    pool.acquire(project)
+    pool.acquire(project)
+    assert settled(pool)
+    with pytest.raises(QuotaExceeded) as e:
+        pool.acquire(project)  # empty pool, quota used up: no call to Neutron
+    assert e.value.resource == "floating_ips"
+    assert len(allocated(simulator)) == 3
+
+
+def test_released_ips_give_the_quota_back(conn, simulator, project):
+    simulator.state.default_quota.update(floatingip=2)
+    guard = QuotaGuard(conn, ttl=3600)
+    pool = FloatingIPPool(conn, size=0, interval=60, quota=guard)
+
+    ip = pool.acquire(project)
+    pool.put(project, ip)  # no room in a pool of size 0
+
+    assert guard.usage(project)["floating_ips"] == (0, 0, 2)
+    assert not allocated(simulator)
+
+
+def test_floating_ip_reservations(conn, simulator, project):
+    simulator.state.default_quota.update(floatingip=2)
+    guard = QuotaGuard(conn, ttl=3600)
+
+    first = guard.reserve_floating_ips(project, 2)
+    with pytest.raises(QuotaExceeded):
+        guard.reserve_floating_ips(project)
+    first.release()
+
+    with guard.reserve_floating_ips(project) as reservation:
+        reservation.commit()
+    assert guard.usage(project)["floating_ips"] == (1, 0, 2)
+    guard.add_floating_ips(project, -1)
+    assert guard.usage(project)["floating_ips"] == (0, 0, 2)
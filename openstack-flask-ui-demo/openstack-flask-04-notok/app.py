@@ -1,6 +1,11 @@
 import openstack
+import os
+import sys
 from flask import Flask, jsonify, request, render_template
 from openstack import connection
+# metering.py lives in ../common, shared with the other apps
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from metering import estimate
 
 app = Flask(__name__)
 
@@ -86,5 +91,18 @@ def list_ssh_keys():
     keys = conn.compute.keypairs()
     return jsonify({'keys': [{'name': key.name} for key in keys]})
 
+@app.route('/calculate_cost', methods=['GET', 'POST'])
+def calculate_cost():
+    if request.method == 'GET':
+        return render_template('calculate_cost.html')
+    data = request.get_json(silent=True) or request.form
+    try:
+        total_cost = estimate(
+            float(data['instance_usage_time']), float(data['storage_usage']), float(data['data_transferred'])
+        )
+    except (KeyError, ValueError):
+        return jsonify({'error': 'instance_usage_time, storage_usage and data_transferred must be numbers'}), 400
+    return jsonify({'total_cost': total_cost})
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port='5000')
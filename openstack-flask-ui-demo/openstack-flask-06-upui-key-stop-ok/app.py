@@ -1,48 +1,64 @@
 import openstack
-import threading
+import logging
+import os
 import time
-from datetime import datetime
-from dateutil import parser 
-import pytz 
 from flask import send_file
 from flask import Flask, jsonify, request, render_template, flash, redirect
 from openstack import connection
+import metrics
+import tracing
+import log_setup
+import leader
+from quota import QuotaExceeded, QuotaGuard
+from inventory import Inventory
+import reaper
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here' 
+# JSON logs through a non-blocking queue; repeated reaper messages are sampled
+log_setup.configure_logging(app)
+log = logging.getLogger("reaper")
+# Prometheus metrics at /metrics (route latency, OpenStack calls, reaper ticks)
+metrics.init_app(app)
+# OpenTelemetry traces (TRACING_ENABLED): one span per request and per Nova/Neutron/Glance call
+tracing.init_tracing(app, "ui-demo")
 # Establish OpenStack connection
-conn = connection.Connection(cloud='openstack')
+conn = tracing.trace_connection(metrics.instrument_connection(connection.Connection(cloud='openstack')))
+# Cached quota and usage: launches that cannot fit are refused before calling Nova
+quota = QuotaGuard(conn)
+# Servers, ports, networks, floating IPs and keypairs, kept in sync with
+# changes-since listings; pages and the reaper read it instead of Nova
+inventory = Inventory(conn)
+
+# Stops run concurrently, each retried on its own; one still in flight is not issued again
+stopper = reaper.Stopper(conn.compute.stop_server)
 
 def stop_active_instances():
-    while True:
+    tick_start = time.perf_counter()
+    with tracing.span('reaper.tick'):
         try:
-            # Fetch all servers
-            instances = conn.compute.servers()
-            for instance in instances:
-                if instance.status == 'ACTIVE':
-                    # Check the time since the instance was created
-                    creation_time_str = instance.created_at
-                    
-                    # Parse the creation time string into a datetime object
-                    creation_time = parser.parse(creation_time_str)  # This will be an aware datetime
-                    
-                    # Get current time as an aware datetime in UTC
-                    current_time = datetime.now(pytz.utc)
-
-                    # Calculate elapsed time in minutes
-                    elapsed_time = (current_time - creation_time).total_seconds() / 60  # Convert to minutes
-
-                    # Stop the instance if it has been active for more than 1 minute
-                    if elapsed_time > 1:
-                        conn.compute.stop_server(instance)
-                        print(f'Stopped instance {instance.name} after exceeding time limit.')
-
-        except Exception as e:
-            print(f'Error checking instances: {str(e)}')
+            # All servers, from the inventory snapshot
+            active = [instance for instance in inventory.servers() if instance.status == 'ACTIVE']
+            stopper.settled({instance.id for instance in active})
 
-        time.sleep(60)  # Wait for 1 minute before checking again
+            # Stop the instances that have been active for more than REAPER_MAX_AGE (1 minute),
+            # checked for the whole fleet at once; those already powering off, rebooting etc. are left alone
+            idle = [instance for instance in active if not instance.task_state]
+            expired = reaper.expired([instance.created_at for instance in idle], time.time())
+            stopper.submit([idle[i] for i in expired])
 
-# Start the background thread
-threading.Thread(target=stop_active_instances, daemon=True).start()
+        except Exception as e:
+            metrics.REAPER_ERRORS.inc()
+            log.exception('Error checking instances')
+    metrics.REAPER_TICK.observe(time.perf_counter() - tick_start)
+
+# One reaper for the whole deployment, in whichever process holds the lease
+# (Redis with REDIS_URL, else a lock file on this host): started below for
+# `python app.py`, and in every worker by gunicorn.conf.py
+reaper_lease = leader.lease(
+    "ui-demo-reaper",
+    [leader.Periodic(stop_active_instances, os.getenv("REAPER_INTERVAL", 60), name="reaper")],
+    os.getenv("REAPER_LOCK", "/tmp/ui-demo-reaper.lock"),
+)
 
 @app.route('/')
 def home():
@@ -56,10 +72,9 @@ def before_request():
 @app.route('/instances', methods=['GET'])
 def list_instances():
     try:
-        # Fetching instances from OpenStack
-        instances = conn.compute.servers()
-        instance_list = [{'name': instance.name, 'status': instance.status, 'id': instance.id} for instance in instances]
-        return render_template('list_instances.html', instances=instance_list)
+        # Fetching instances from the inventory snapshot
+        instances = inventory.servers()
+        return render_template('list_instances.html', instances=instances)
     except Exception as e:
         flash(f'Error fetching instances: {str(e)}')  # Provide user feedback
         return redirect('/')  # Redirect if there's an error
@@ -67,9 +82,11 @@ def list_instances():
 @app.route('/instances/<instance_id>', methods=['DELETE'])
 def delete_instance(instance_id):
     try:
-        instance = conn.compute.get_server(instance_id)  # Get the specific instance
+        instance = inventory.current(instance_id)  # from Nova: the snapshot may still list a deleted one
         if instance:
-            conn.compute.delete_server(instance)  # Delete the instance
+            conn.compute.delete_server(instance.id)  # Delete the instance
+            inventory.discard(instance.id)
+            quota.release(instance.project_id, instance.flavor)
             flash('Instance deleted successfully.')
         else:
             flash('Instance not found.')
@@ -81,7 +98,7 @@ def delete_instance(instance_id):
 
 @app.route('/instances/<instance_id>', methods=['GET'])
 def get_instance(instance_id):
-    instance = conn.compute.get_server(instance_id)
+    instance = inventory.server(instance_id)
     if instance:
         instance_info = {'name': instance.name, 'status': instance.status, 'id': instance.id}
         return jsonify(instance_info)
@@ -111,30 +128,36 @@ def create_instance():
 
         # Create the instance
         try:
-            instance = conn.compute.create_server(
-                name=name,
-                image_id=image_id,
-                flavor_id=flavor_id,
-                networks=[{"uuid": network_id}],
-                key_name=keypair_name  # Associate the new key pair with the instance
-            )
+            with quota.reserve(conn.current_project_id, flavor_id) as reservation:
+                instance = conn.compute.create_server(
+                    name=name,
+                    image_id=image_id,
+                    flavor_id=flavor_id,
+                    networks=[{"uuid": network_id}],
+                    key_name=keypair_name  # Associate the new key pair with the instance
+                )
+                reservation.commit()
             instance = conn.compute.wait_for_server(instance)
+            inventory.upsert(instance)  # listed right away, not after the next sync
             flash('Instance created successfully.')
             return redirect('/instances')
+        except QuotaExceeded as e:
+            metrics.QUOTA_REJECTED.labels(e.resource).inc()
+            flash(f'Cannot create instance: {str(e)}')
         except Exception as e:
             flash(f'Error creating instance: {str(e)}')
 
     images = conn.compute.images()
     flavors = conn.compute.flavors()
-    networks = conn.network.networks()
+    networks = inventory.networks()
     return render_template('create_instance.html', images=images, flavors=flavors, networks=networks)
 
 @app.route('/instances/<instance_id>/start', methods=['POST'])
 def start_instance(instance_id):
     try:
-        instance = conn.compute.get_server(instance_id)
+        instance = inventory.current(instance_id)
         if instance and instance.status != 'ACTIVE':
-            conn.compute.start_server(instance)
+            conn.compute.start_server(instance.id)
             flash('Instance started successfully.')
         else:
             flash('Instance is already running or not found.')
@@ -145,9 +168,9 @@ def start_instance(instance_id):
 @app.route('/instances/<instance_id>/stop', methods=['POST'])
 def stop_instance(instance_id):
     try:
-        instance = conn.compute.get_server(instance_id)
+        instance = inventory.current(instance_id)
         if instance and instance.status != 'SHUTOFF':
-            conn.compute.stop_server(instance)
+            conn.compute.stop_server(instance.id)
             flash('Instance stopped successfully.')
         else:
             flash('Instance is already stopped or not found.')
@@ -158,9 +181,9 @@ def stop_instance(instance_id):
 @app.route('/instances/<instance_id>/restart', methods=['POST'])
 def restart_instance(instance_id):
     try:
-        instance = conn.compute.get_server(instance_id)
+        instance = inventory.current(instance_id)
         if instance:
-            conn.compute.reboot_server(instance)  # You can also use soft reboot if needed
+            conn.compute.reboot_server(instance.id, 'HARD')  # You can also use soft reboot if needed
             flash('Instance restarted successfully.')
         else:
             flash('Instance not found.')
@@ -180,4 +203,6 @@ def download_key(key_name):
 
 
 if __name__ == '__main__':
+    inventory.start()
+    reaper_lease.start()
     app.run(debug=True, host='0.0.0.0', port='5000')
\ No newline at end of file
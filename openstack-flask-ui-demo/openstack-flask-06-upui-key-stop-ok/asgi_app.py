@@ -0,0 +1,245 @@
+# asgi_app.py
+#
+# The instance manager of app.py as an ASGI app (Quart), for large fleets and
+# many concurrent users. Nova, Neutron and Glance are called through
+# openstack_async.AsyncOpenStack, so a request waiting on OpenStack holds no
+# thread, and the reaper stops instances concurrently instead of one by one.
+#
+#   hypercorn asgi_app:app --bind 0.0.0.0:5000
+import asyncio
+import logging
+import os
+import time
+from collections import namedtuple
+
+from quart import Quart, Response, flash, g, jsonify, redirect, render_template, request, send_file
+
+import log_setup
+import metrics
+import reaper
+import tracing
+import leader
+from openstack_async import AsyncOpenStack, collect
+
+app = Quart(__name__)
+app.secret_key = 'your_secret_key_here'
+log_setup.configure_logging()
+log = logging.getLogger("reaper")
+if tracing.init_tracing(None, "ui-demo-asgi"):
+    try:
+        from opentelemetry.instrumentation.asgi import OpenTelemetryMiddleware
+    except ImportError:
+        logging.getLogger("tracing").warning("opentelemetry-instrumentation-asgi not installed; no per-request spans")
+    else:
+        app.asgi_app = OpenTelemetryMiddleware(app.asgi_app, excluded_urls="metrics,static")
+
+cloud = AsyncOpenStack(cloud='openstack')
+# Stops calling Nova at once
+REAPER_CONCURRENCY = int(os.getenv("REAPER_CONCURRENCY", 50))
+REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", 60))
+# Each stop retried on its own; one still in flight is not issued again
+stopper = reaper.AsyncStopper(cloud.stop_server, concurrency=REAPER_CONCURRENCY)
+Instance = namedtuple("Instance", "id name")
+# Same lease as app.py: one reaper in the deployment, however many workers hypercorn runs
+reaper_lease = leader.lease("ui-demo-reaper", [], os.getenv("REAPER_LOCK", "/tmp/ui-demo-reaper.lock"))
+
+
+async def reap_once():
+    """Start stopping every ACTIVE instance created more than REAPER_MAX_AGE seconds ago."""
+    # Nova filters on status, so only ACTIVE servers cross the wire
+    active = await collect(cloud.servers(status='ACTIVE'))
+    stopper.settled({instance['id'] for instance in active})
+    # Those already powering off, rebooting etc. are left alone
+    idle = [instance for instance in active if not instance.get('OS-EXT-STS:task_state')]
+    expired = reaper.expired([instance['created'] for instance in idle], time.time())
+    stopper.submit([Instance(idle[i]['id'], idle[i]['name']) for i in expired])
+
+
+async def stop_active_instances():
+    while True:
+        if not reaper_lease.leading:
+            await asyncio.sleep(REAPER_INTERVAL)
+            continue
+        tick_start = time.perf_counter()
+        with tracing.span('reaper.tick'):
+            try:
+                await reap_once()
+            except Exception:
+                metrics.REAPER_ERRORS.inc()
+                log.exception('Error checking instances')
+        metrics.REAPER_TICK.observe(time.perf_counter() - tick_start)
+        await asyncio.sleep(REAPER_INTERVAL)
+
+
+@app.before_serving
+async def startup():
+    await cloud.start()
+    reaper_lease.start()
+    app.reaper = asyncio.ensure_future(stop_active_instances())
+
+
+@app.after_serving
+async def shutdown():
+    app.reaper.cancel()
+    stopper.cancel()
+    # Hand the lease over now; releasing it may wait on Redis, so off the event loop
+    await asyncio.get_running_loop().run_in_executor(None, reaper_lease.stop)
+    await cloud.close()
+
+
+@app.before_request
+async def before_request():
+    g.metrics_start = time.perf_counter()
+    if request.method == 'POST':
+        form = await request.form
+        if '_method' in form:
+            request.method = form['_method'].upper()
+
+
+@app.after_request
+async def record_latency(response):
+    if 'metrics_start' in g:
+        # The route template ("/instances/<instance_id>") keeps label cardinality bounded
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        metrics.REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(
+            time.perf_counter() - g.metrics_start
+        )
+    return response
+
+
+@app.route('/metrics')
+async def metrics_view():
+    body, status, content_type = metrics.exposition(request.headers.get("Authorization", ""))
+    return Response(body, status=status, content_type=content_type)
+
+
+@app.route('/')
+async def home():
+    return await render_template('home.html')
+
+
+@app.route('/instances', methods=['GET'])
+async def list_instances():
+    try:
+        instance_list = [
+            {'name': instance['name'], 'status': instance['status'], 'id': instance['id']}
+            async for instance in cloud.servers()
+        ]
+        return await render_template('list_instances.html', instances=instance_list)
+    except Exception as e:
+        await flash(f'Error fetching instances: {str(e)}')
+        return redirect('/')
+
+
+@app.route('/instances/<instance_id>', methods=['DELETE'])
+async def delete_instance(instance_id):
+    try:
+        instance = await cloud.get_server(instance_id)
+        if instance:
+            await cloud.delete_server(instance_id)
+            await flash('Instance deleted successfully.')
+        else:
+            await flash('Instance not found.')
+    except Exception as e:
+        await flash(f'Error deleting instance: {str(e)}')
+    return redirect('/instances')
+
+
+@app.route('/instances/<instance_id>', methods=['GET'])
+async def get_instance(instance_id):
+    instance = await cloud.get_server(instance_id)
+    if instance:
+        return jsonify({'name': instance['name'], 'status': instance['status'], 'id': instance['id']})
+    return jsonify({'error': 'Instance not found'}), 404
+
+
+@app.route('/create_instance', methods=['GET', 'POST'])
+async def create_instance():
+    if request.method == 'POST':
+        form = await request.form
+        name = form['name']
+        image_id = form['image']
+        flavor_id = form['flavor']
+        network_id = form['network']
+        keypair_name = form['keypair_name']
+
+        # Create a new key pair if a name is provided
+        if keypair_name:
+            try:
+                keypair = await cloud.create_keypair(keypair_name)
+                with open(f"{keypair_name}.pem", "w") as key_file:
+                    key_file.write(keypair['private_key'])
+                await flash(f'New key pair {keypair_name} created successfully.')
+            except Exception as e:
+                await flash(f'Error creating key pair: {str(e)}')
+
+        try:
+            instance = await cloud.create_server(
+                name, image_id, flavor_id, [{"uuid": network_id}], key_name=keypair_name,
+            )
+            await cloud.wait_for_server(instance['id'])
+            await flash('Instance created successfully.')
+            return redirect('/instances')
+        except Exception as e:
+            await flash(f'Error creating instance: {str(e)}')
+
+    # The three catalogs are fetched at the same time
+    images, flavors, networks = await asyncio.gather(
+        collect(cloud.images()), collect(cloud.flavors()), collect(cloud.networks()),
+    )
+    return await render_template('create_instance.html', images=images, flavors=flavors, networks=networks)
+
+
+@app.route('/instances/<instance_id>/start', methods=['POST'])
+async def start_instance(instance_id):
+    try:
+        instance = await cloud.get_server(instance_id)
+        if instance and instance['status'] != 'ACTIVE':
+            await cloud.start_server(instance_id)
+            await flash('Instance started successfully.')
+        else:
+            await flash('Instance is already running or not found.')
+    except Exception as e:
+        await flash(f'Error starting instance: {str(e)}')
+    return redirect('/instances')
+
+
+@app.route('/instances/<instance_id>/stop', methods=['POST'])
+async def stop_instance(instance_id):
+    try:
+        instance = await cloud.get_server(instance_id)
+        if instance and instance['status'] != 'SHUTOFF':
+            await cloud.stop_server(instance_id)
+            await flash('Instance stopped successfully.')
+        else:
+            await flash('Instance is already stopped or not found.')
+    except Exception as e:
+        await flash(f'Error stopping instance: {str(e)}')
+    return redirect('/instances')
+
+
+@app.route('/instances/<instance_id>/restart', methods=['POST'])
+async def restart_instance(instance_id):
+    try:
+        instance = await cloud.get_server(instance_id)
+        if instance:
+            await cloud.reboot_server(instance_id)
+            await flash('Instance restarted successfully.')
+        else:
+            await flash('Instance not found.')
+    except Exception as e:
+        await flash(f'Error restarting instance: {str(e)}')
+    return redirect('/instances')
+
+
+@app.route('/download_key/<key_name>', methods=['GET'])
+async def download_key(key_name):
+    try:
+        return await send_file(f"{key_name}.pem", as_attachment=True)
+    except Exception as e:
+        await flash(f'Error downloading key: {str(e)}')
+        return redirect('/instances')
+
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,86 @@
+# benchmarks/bench_reaper.py
+#
+# CPU time of one reaper tick's decision (which ACTIVE servers to stop) over
+# a synthetic fleet, batch check against the previous per-server dateutil
+# parse. Both must pick the same servers.
+#
+#   python benchmarks/bench_reaper.py
+#   python benchmarks/bench_reaper.py --servers 10000 100000 --repeat 5
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytz  # noqa: E402
+from dateutil import parser as dateutil_parser  # noqa: E402
+
+import reaper  # noqa: E402
+from inventory import Flavor, ServerRow  # noqa: E402
+
+
+def fleet(count, now, seed):
+    """``count`` inventory rows, 70% ACTIVE, created over the last 72 hours."""
+    rng = random.Random(seed)
+    flavor = Flavor("1", 1, 512)
+    rows = []
+    for i in range(count):
+        created = datetime.fromtimestamp(now - rng.random() * 72 * 3600, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        rows.append(ServerRow(SimpleNamespace(
+            id=f"{i:08d}-0000-4000-8000-000000000000", name=f"fleet-{i:06d}",
+            status="ACTIVE" if rng.random() < 0.7 else "SHUTOFF", task_state=None,
+            project_id="admin", user_id="admin", key_name=None, created_at=created, updated_at=created,
+            addresses={"private": [{"addr": f"10.0.{i >> 8 & 255}.{i & 255}", "OS-EXT-IPS:type": "fixed"}]},
+        ), flavor))
+    return rows
+
+
+def batch_tick(instances, now):
+    active = [instance for instance in instances if instance.status == 'ACTIVE']
+    return [active[i].id for i in reaper.expired([instance.created_at for instance in active], now)]
+
+
+def dateutil_tick(instances, now):
+    """The reaper loop as it was: parse and compare one server at a time."""
+    stop = []
+    for instance in instances:
+        if instance.status == 'ACTIVE':
+            creation_time = dateutil_parser.parse(instance.created_at)
+            current_time = datetime.now(pytz.utc)
+            if (current_time - creation_time).total_seconds() / 60 > 1:
+                stop.append(instance.id)
+    return stop
+
+
+def cpu(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        result = fn()
+        best = min(best, time.process_time() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU time per reaper tick")
+    parser.add_argument("--servers", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    now = time.time()
+    for count in args.servers:
+        instances = fleet(count, now, args.seed)
+        batch_seconds, picked = cpu(lambda: batch_tick(instances, now), args.repeat)
+        loop_seconds, expected = cpu(lambda: dateutil_tick(instances, now), 1)
+        assert picked == expected, "batch and per-server checks picked different servers"
+        print(f"{count:>8,} servers  batch {batch_seconds * 1000:8.1f} ms  "
+              f"dateutil loop {loop_seconds * 1000:8.1f} ms  ({len(picked):,} to stop)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# gunicorn.conf.py
+#
+# Production server for the instance manager (gunicorn reads this file from
+# the working directory):
+#
+#   gunicorn app:app
+#
+# - WEB_CONCURRENCY: worker processes (default 2 x cores + 1)
+# - GUNICORN_THREADS: threads per worker (default 16: /create_instance
+#   holds its thread while it waits for the server to become ACTIVE)
+# - REAPER_ENABLED: False to run no reaper in this deployment
+# - REDIS_URL: the reaper lease (leader.py); without it the lease is per host
+# - INVENTORY_LOCK, INVENTORY_SNAPSHOT: the one inventory sync per host (inventory.py)
+#
+# kill -HUP <master> restarts the workers gracefully. The app is preloaded,
+# so new code needs kill -USR2 <master> (a new master) and then
+# kill -QUIT <old master>.
+import os
+
+# Aggregate every worker's samples at /metrics (see metrics.init_app). Must be
+# set before prometheus_client is imported by the preloaded app.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/ui-demo-metrics")
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def _cores():
+    try:
+        return len(os.sched_getaffinity(0))  # the CPUs this container may use
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', 5000)}")
+# Threaded workers (the inventory sync and the reaper run on threads as well).
+# For many concurrent requests use asgi_app.py under hypercorn.
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", 2 * _cores() + 1))
+threads = int(os.getenv("GUNICORN_THREADS", 16))
+
+# Import the app (openstacksdk and its dependencies) once in the master;
+# workers share those pages copy-on-write instead of importing them again
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+# Recycle workers now and then so slow leaks never accumulate, staggered
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")  # off unless set; requests are already timed in metrics
+errorlog = "-"
+
+
+def on_starting(server):
+    # Samples left by a previous run would be added to this one's
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    for name in os.listdir(path):
+        os.remove(os.path.join(path, name))
+
+
+def post_fork(server, worker):
+    from app import inventory, reaper_lease
+
+    # Every worker competes for the inventory lock; one per host syncs and the others read its snapshot file
+    inventory.start()
+    # Every worker competes for the lease; exactly one in the deployment runs the reaper
+    if os.getenv("REAPER_ENABLED", "True").lower() in ["true", "1", "t"]:
+        reaper_lease.start()
+
+
+def worker_exit(server, worker):
+    from app import inventory, reaper_lease
+
+    # Hand the reaper to another process now instead of after the lease expires
+    reaper_lease.stop()
+    inventory.stop()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
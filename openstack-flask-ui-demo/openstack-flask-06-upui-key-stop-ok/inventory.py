@@ -0,0 +1,566 @@
+# inventory.py
+#
+# Fleet inventory snapshot. The instance list, the detail view, the start and
+# stop guards and the reaper all read servers from here instead of listing
+# them from Nova, so what they cost upstream does not grow with the fleet.
+#
+#   inventory.servers()            # ServerRow list, at most INVENTORY_MAX_AGE seconds old
+#   inventory.server(server_id)    # one ServerRow, or None
+#   inventory.current(server_id)   # the same, read from Nova now: for actions on the server
+#   inventory.ports(server_id)     # PortRow tuple
+#   inventory.networks(), inventory.floating_ips(), inventory.keypairs()
+#
+# One process per host syncs: the gunicorn worker holding INVENTORY_LOCK
+# (leader.FileLease). Every INVENTORY_INTERVAL seconds it asks only for what
+# changed and appends that to the snapshot file (INVENTORY_SNAPSHOT); the
+# other workers apply what was appended when they next read:
+# - servers: Nova's `changes-since` lists the servers updated since the last
+#   sync, deleted ones included (status DELETED);
+# - ports, networks, floating IPs: Neutron lists them newest `updated_at`
+#   first, and the sync stops paging at the first one it has already seen;
+# - keypairs carry no timestamps: read in full every INVENTORY_KEYPAIR_INTERVAL.
+# Everything is re-read every INVENTORY_FULL_SYNC seconds, to catch what the
+# above cannot show (servers purged from Nova's database, deleted ports,
+# networks and floating IPs).
+#
+# A read that finds the snapshot older than INVENTORY_MAX_AGE (no syncing
+# worker, or it is failing) syncs first. If that sync fails, the last
+# snapshot is served and the failure logged. A worker that cannot read the
+# snapshot file (truncated, corrupt) stops reading it and syncs by itself
+# until the syncing worker writes a new one.
+import logging
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from openstack import exceptions
+
+import leader
+
+log = logging.getLogger("inventory")
+
+# Changes recorded while a sync was listing may carry a slightly older
+# timestamp than the newest one it saw; ask again for this much before it
+OVERLAP = timedelta(seconds=2)
+# A table with no timestamp to go by (an empty fleet) is asked from our own
+# clock instead, less this much in case it runs ahead of the cloud's
+SKEW = timedelta(minutes=5)
+# Rows per page when Neutron lists newest first
+PAGE_SIZE = 100
+
+Flavor = namedtuple("Flavor", "id vcpus ram")
+
+
+class ServerRow:
+    """What the app needs of a server; a few hundred bytes instead of an SDK resource."""
+
+    __slots__ = ("id", "name", "status", "task_state", "project_id", "user_id", "flavor", "key_name",
+                 "created_at", "updated_at", "_addresses")
+
+    def __init__(self, server, flavor):
+        self.id = server.id
+        self.name = server.name
+        self.status = server.status
+        self.task_state = server.task_state
+        self.project_id = server.project_id
+        self.user_id = server.user_id
+        self.flavor = flavor
+        self.key_name = server.key_name
+        self.created_at = server.created_at
+        self.updated_at = server.updated_at
+        self._addresses = tuple(
+            (network, address["addr"], address.get("OS-EXT-IPS:type"))
+            for network, addresses in (server.addresses or {}).items() for address in addresses
+        )
+
+    @property
+    def addresses(self):
+        """``{network: [{"addr": ..., "OS-EXT-IPS:type": ...}]}``, as on the SDK server."""
+        addresses = {}
+        for network, addr, kind in self._addresses:
+            addresses.setdefault(network, []).append({"addr": addr, "OS-EXT-IPS:type": kind})
+        return addresses
+
+
+class _Row:
+    """Copies the attributes named in ``__slots__`` from an SDK resource."""
+
+    __slots__ = ()
+
+    def __init__(self, resource):
+        for name in self.__slots__:
+            setattr(self, name, getattr(resource, name))
+
+
+class PortRow(_Row):
+    __slots__ = ("id", "network_id", "device_id", "status", "mac_address", "fixed_ips", "updated_at")
+
+    def __init__(self, port):
+        super().__init__(port)
+        self.fixed_ips = tuple(ip["ip_address"] for ip in self.fixed_ips or ())
+
+
+class NetworkRow(_Row):
+    __slots__ = ("id", "name", "status", "project_id", "is_router_external", "is_shared", "updated_at")
+
+
+class FloatingIPRow(_Row):
+    __slots__ = ("id", "floating_ip_address", "fixed_ip_address", "port_id", "floating_network_id",
+                 "project_id", "status", "updated_at")
+
+
+class KeypairRow(_Row):
+    __slots__ = ("name", "fingerprint", "type")
+
+
+class Inventory:
+    def __init__(self, conn, interval=None, max_age=None, full_sync=None, keypair_interval=None,
+                 lock_path=None, snapshot_path=None):
+        self.conn = conn
+        self.interval = float(interval if interval is not None else os.getenv("INVENTORY_INTERVAL", 10))
+        self.max_age = float(max_age if max_age is not None else os.getenv("INVENTORY_MAX_AGE", 30))
+        self.full_sync = float(full_sync if full_sync is not None else os.getenv("INVENTORY_FULL_SYNC", 3600))
+        self.keypair_interval = float(keypair_interval if keypair_interval is not None
+                                      else os.getenv("INVENTORY_KEYPAIR_INTERVAL", 300))
+        self.lock_path = lock_path or os.getenv("INVENTORY_LOCK", "/tmp/ui-demo-inventory.lock")
+        self.snapshot_path = snapshot_path or os.getenv("INVENTORY_SNAPSHOT", "/tmp/ui-demo-inventory/snapshot")
+        self.synced_at = None  # time.monotonic() of the last successful sync
+        self._lock = threading.Lock()       # guards the tables below
+        self._sync_lock = threading.Lock()  # one sync or snapshot load at a time
+        self._servers = {}       # id -> ServerRow
+        self._ports = {}         # device id -> tuple of PortRow
+        self._port_devices = {}  # port id -> device id
+        self._networks = {}      # id -> NetworkRow
+        self._floating_ips = {}  # id -> FloatingIPRow
+        self._keypairs = ()
+        self._flavors = {}   # Flavor values, shared by every row of that flavor
+        self._since = {}     # table -> timestamp to ask from next time; no servers entry means read everything
+        self._synced = None  # time.time() when the last sync began
+        self._full_at = 0.0
+        self._keypairs_at = 0.0
+        self._local = {}     # server id -> (time.time(), ServerRow or None): the app's own writes
+        self._lease = None
+        # The snapshot file: which one we have (token), how far we have read it,
+        # and, if we wrote it, how big its tables and the changes appended since are
+        self._token = None
+        self._offset = 0
+        self._checked = None  # its st_mtime_ns when last looked at
+        self._inode = None
+        self._size = None
+        self._appended = 0
+        self._unreadable = None  # inode of a snapshot file we failed to read
+
+    # --- Reads ---
+    def servers(self):
+        self._fresh()
+        with self._lock:
+            return list(self._servers.values())
+
+    def server(self, server_id):
+        """The server with ``server_id``, or None if it does not exist.
+
+        One created elsewhere since the last sync is looked up in Nova.
+        """
+        self._fresh()
+        row = self._servers.get(server_id)
+        if row is None:
+            try:
+                row = self.upsert(self.conn.compute.get_server(server_id))
+            except exceptions.NotFoundException:
+                return None
+        return row
+
+    def current(self, server_id):
+        """The server with ``server_id`` as Nova has it now, or None if it is gone.
+
+        For the start, stop and delete actions, which must not act on a
+        server the snapshot still shows after it was deleted.
+        """
+        try:
+            return self.upsert(self.conn.compute.get_server(server_id))
+        except exceptions.NotFoundException:
+            self.discard(server_id)
+            return None
+
+    def ports(self, server_id):
+        self._fresh()
+        return self._ports.get(server_id, ())
+
+    def networks(self):
+        self._fresh()
+        with self._lock:
+            return tuple(self._networks.values())
+
+    def floating_ips(self):
+        self._fresh()
+        with self._lock:
+            return tuple(self._floating_ips.values())
+
+    def keypairs(self):
+        self._fresh()
+        return self._keypairs
+
+    # --- Writes made by the app, seen before the next sync ---
+    def upsert(self, server):
+        """Record ``server`` (an SDK server) as it is now; returns its row."""
+        row = ServerRow(server, self._flavor(server.flavor))
+        with self._lock:
+            self._servers[row.id] = row
+            self._local[row.id] = (time.time(), row)
+        return row
+
+    def discard(self, server_id):
+        with self._lock:
+            self._servers.pop(server_id, None)
+            self._drop_ports(server_id)
+            self._local[server_id] = (time.time(), None)
+
+    # --- Sync ---
+    def sync(self):
+        """Bring the snapshot up to date: only what changed, or everything when a full sync is due."""
+        with self._sync_lock:
+            self._sync()
+
+    def start(self):
+        """Compete for the host's sync: the worker holding INVENTORY_LOCK syncs and writes the snapshot file."""
+        if self._lease is None:
+            # Created on first use: the lock must be taken after the fork
+            sync = leader.Periodic(self._run, self.interval, name="inventory-sync")
+            self._lease = leader.FileLease(self.lock_path, [sync], self.interval)
+        self._lease.start()
+
+    def stop(self):
+        if self._lease is not None:
+            self._lease.stop()
+
+    def _run(self):
+        try:
+            with self._sync_lock:
+                self._load()  # carry on from the last holder's snapshot, not from scratch
+                self._publish(self._sync())
+        except Exception:
+            log.exception("Inventory sync failed")
+
+    def _leading(self):
+        return self._lease is not None and self._lease.leading
+
+    def _fresh(self):
+        if not self._leading() and self._published():
+            with self._sync_lock:
+                self._load()
+        synced_at = self.synced_at
+        if synced_at is not None and time.monotonic() - synced_at <= self.max_age:
+            return
+        with self._sync_lock:
+            if self.synced_at is not synced_at:
+                return  # another thread synced while we waited
+            try:
+                changes = self._sync()
+                if self._leading():
+                    self._publish(changes)
+            except Exception:
+                if self.synced_at is None:
+                    raise  # nothing to serve
+                log.warning("Inventory sync failed, serving a stale snapshot", exc_info=True,
+                            extra={"age": round(time.monotonic() - self.synced_at, 1)})
+
+    def _sync(self):
+        """Sync; returns what changed, or None after reading everything."""
+        started, wall = time.monotonic(), time.time()
+        if "servers" not in self._since or wall - self._full_at > self.full_sync:
+            changes = self._sync_all(wall)
+        else:
+            changes = self._sync_changes(wall)
+        self._reapply(wall)
+        self._synced = wall
+        self.synced_at = started
+        log.debug("Inventory synced", extra={"servers": len(self._servers),
+                                             "seconds": round(time.monotonic() - started, 3)})
+        return changes
+
+    def _sync_all(self, wall):
+        servers = list(self.conn.compute.servers())
+        ports = list(self.conn.network.ports())
+        networks = list(self.conn.network.networks())
+        floating_ips = list(self.conn.network.ips())
+        keypairs = tuple(KeypairRow(keypair) for keypair in self.conn.compute.keypairs())
+        rows = {server.id: ServerRow(server, self._flavor(server.flavor)) for server in servers}
+        with self._lock:
+            self._servers = rows
+            self._ports, self._port_devices = {}, {}
+            for port in ports:
+                self._put_port(PortRow(port))
+            self._networks = {network.id: NetworkRow(network) for network in networks}
+            self._floating_ips = {ip.id: FloatingIPRow(ip) for ip in floating_ips}
+            self._keypairs = keypairs
+        self._since = {}
+        for table, items in (("servers", servers), ("ports", ports), ("networks", networks),
+                             ("floating_ips", floating_ips)):
+            self._advance(table, items, wall)
+        self._full_at = self._keypairs_at = wall
+        return None
+
+    def _sync_changes(self, wall):
+        servers = list(self.conn.compute.servers(changes_since=self._since["servers"]))
+        ports = self._neutron_changes(self.conn.network.ports, "ports")
+        networks = self._neutron_changes(self.conn.network.networks, "networks")
+        floating_ips = self._neutron_changes(self.conn.network.ips, "floating_ips")
+        # The overlap lists some rows again; only those that moved are changes
+        changes = {
+            "deleted": [server.id for server in servers if server.status == "DELETED" and server.id in self._servers],
+            "servers": [ServerRow(server, self._flavor(server.flavor)) for server in servers
+                        if server.status != "DELETED" and self._moved(self._servers, server)],
+            "ports": [PortRow(port) for port in ports if self._port_moved(port)],
+            "networks": [NetworkRow(network) for network in networks if self._moved(self._networks, network)],
+            "floating_ips": [FloatingIPRow(ip) for ip in floating_ips if self._moved(self._floating_ips, ip)],
+        }
+        if wall - self._keypairs_at > self.keypair_interval:
+            # No timestamps to ask by: read in full, but seldom
+            changes["keypairs"] = tuple(KeypairRow(keypair) for keypair in self.conn.compute.keypairs())
+            self._keypairs_at = wall
+        self._apply(changes)
+        for table, items in (("servers", servers), ("ports", ports), ("networks", networks),
+                             ("floating_ips", floating_ips)):
+            self._advance(table, items, wall)
+        return {table: rows for table, rows in changes.items() if rows or table == "keypairs"}
+
+    def _neutron_changes(self, list_resources, table):
+        """The ``table`` rows updated since we last asked: listed newest first, until an older one."""
+        since = self._since[table]
+        changed = []
+        for resource in list_resources(sort_key="updated_at", sort_dir="desc", limit=PAGE_SIZE):
+            # Same format as ours ("2024-05-01T12:00:00Z"), so the strings compare as times
+            if not resource.updated_at or resource.updated_at < since:
+                break  # no more pages are fetched
+            changed.append(resource)
+        return changed
+
+    def _advance(self, table, items, wall):
+        newest = max((item.updated_at for item in items if item.updated_at), default=None)
+        if newest is not None:
+            # The cloud's own timestamps, so the client's clock does not matter
+            since = datetime.fromisoformat(newest.replace("Z", "+00:00")) - OVERLAP
+        elif table not in self._since:
+            # Nothing to go by (an empty table): our own clock when the sync began
+            since = datetime.fromtimestamp(wall, timezone.utc) - SKEW
+        else:
+            return  # nothing new: ask from the same point next time
+        since = since.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        if table not in self._since or since > self._since[table]:
+            self._since[table] = since
+
+    def _apply(self, changes):
+        with self._lock:
+            for server_id in changes.get("deleted", ()):
+                self._servers.pop(server_id, None)
+                self._drop_ports(server_id)
+            for row in changes.get("servers", ()):
+                row.flavor = self._flavors.setdefault(tuple(row.flavor), row.flavor)
+                self._servers[row.id] = row
+            for row in changes.get("ports", ()):
+                self._put_port(row)
+            for row in changes.get("networks", ()):
+                self._networks[row.id] = row
+            for row in changes.get("floating_ips", ()):
+                self._floating_ips[row.id] = row
+            if "keypairs" in changes:
+                self._keypairs = changes["keypairs"]
+
+    def _reapply(self, synced):
+        """Keep the app's own writes that a sync begun at ``synced`` may not have seen; forget the rest."""
+        cutoff = synced - OVERLAP.total_seconds()
+        with self._lock:
+            for server_id, (at, row) in list(self._local.items()):
+                if at < cutoff:
+                    del self._local[server_id]
+                elif row is None:
+                    self._servers.pop(server_id, None)
+                    self._drop_ports(server_id)
+                else:
+                    current = self._servers.get(server_id)
+                    if current is None or (current.updated_at or "") < (row.updated_at or ""):
+                        self._servers[server_id] = row
+
+    # --- Snapshot file shared by the workers of this host ---
+    # A token line, the tables, then the changes of each later sync appended,
+    # every part a pickle behind its 8-byte length. The file's mtime is when
+    # its latest sync began, which is how fresh the readers are.
+    def _publish(self, changes):
+        """Share a sync with the other workers: a new file after a full sync, else its changes appended."""
+        if changes is None or self._size is None or self._appended > self._size:
+            self._write()
+        elif changes:
+            record = {"synced": self._synced, "since": dict(self._since), "keypairs_at": self._keypairs_at,
+                      "changes": changes}
+            if not self._append(record):
+                self._write()
+        try:
+            os.utime(self.snapshot_path, (self._synced, self._synced))
+        except FileNotFoundError:
+            self._write()  # removed under us
+            os.utime(self.snapshot_path, (self._synced, self._synced))
+        self._checked = os.stat(self.snapshot_path).st_mtime_ns
+
+    def _write(self):
+        directory = os.path.dirname(self.snapshot_path) or "."
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.stat(directory).st_uid != os.getuid():
+            raise RuntimeError(f"{directory} belongs to another user")
+        token = uuid.uuid4().hex
+        with self._lock:
+            # Copies of the tables, so that pickling does not hold up the readers
+            state = {"synced": self._synced, "since": dict(self._since), "keypairs_at": self._keypairs_at,
+                     "full_at": self._full_at, "servers": dict(self._servers), "ports": dict(self._ports),
+                     "port_devices": dict(self._port_devices), "networks": dict(self._networks),
+                     "floating_ips": dict(self._floating_ips), "keypairs": self._keypairs}
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".snapshot-")  # mode 0600
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(token.encode() + b"\n")
+                _write_part(f, state)
+                self._offset = self._size = f.tell()
+                self._inode = os.fstat(f.fileno()).st_ino
+            os.replace(tmp, self.snapshot_path)
+        except BaseException:
+            self._size = None
+            os.unlink(tmp)
+            raise
+        self._token = token
+        self._appended = 0
+
+    def _append(self, record):
+        """Append ``record`` to the file we wrote; False if it is no longer ours."""
+        with open(self.snapshot_path, "ab") as f:
+            if os.fstat(f.fileno()).st_ino != self._inode:
+                return False
+            try:
+                size = _write_part(f, record)
+            except BaseException:
+                self._size = None  # a part may be half written: the next sync writes a new file
+                raise
+        self._offset += size
+        self._appended += size
+        return True
+
+    def _published(self):
+        """Whether the snapshot file has changed since we last looked."""
+        try:
+            return os.stat(self.snapshot_path).st_mtime_ns != self._checked
+        except FileNotFoundError:
+            return False
+
+    def _load(self):
+        """Catch up with the snapshot file written by another worker; the caller holds ``_sync_lock``."""
+        st = None
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                st = os.fstat(f.fileno())
+                if st.st_mtime_ns == self._checked or st.st_ino == self._unreadable:
+                    return
+                self._checked = st.st_mtime_ns
+                # Unpickling runs code: only a file this user wrote and no one else can change
+                if st.st_uid != os.getuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+                    log.warning("Inventory snapshot ignored: not written by this user",
+                                extra={"path": self.snapshot_path})
+                    return
+                token = f.readline().strip().decode()
+                synced = None
+                if token != self._token:
+                    state = _read_part(f)
+                    if not token or state is None:
+                        raise ValueError("truncated snapshot")
+                    self._install(state)
+                    self._token, self._offset, self._size = token, f.tell(), None
+                    synced = state["synced"]
+                f.seek(self._offset)
+                # A part still being appended is read next time
+                for record in iter(lambda: _read_part(f), None):
+                    self._apply(record["changes"])
+                    self._since = record["since"]
+                    self._keypairs_at = record["keypairs_at"]
+                    self._offset = f.tell()
+                    synced = record["synced"]
+        except FileNotFoundError:
+            return
+        except Exception:
+            # Sync by ourselves (see _fresh) until the file is replaced
+            if st is not None:
+                self._unreadable = st.st_ino
+            log.warning("Inventory snapshot not loaded", exc_info=True, extra={"path": self.snapshot_path})
+            return
+        if synced is not None:
+            self._synced = synced
+            self._reapply(synced)
+        # As old as the sync that last confirmed it (the file's mtime), and never fresher than now
+        age = max(0.0, time.time() - st.st_mtime_ns / 1e9)
+        if self.synced_at is None or time.monotonic() - age > self.synced_at:
+            self.synced_at = time.monotonic() - age
+
+    def _install(self, state):
+        with self._lock:
+            self._servers = state["servers"]
+            self._ports = state["ports"]
+            self._port_devices = state["port_devices"]
+            self._networks = state["networks"]
+            self._floating_ips = state["floating_ips"]
+            self._keypairs = state["keypairs"]
+            self._flavors = {tuple(row.flavor): row.flavor for row in self._servers.values()}
+        self._since = state["since"]
+        self._full_at = state["full_at"]
+        self._keypairs_at = state["keypairs_at"]
+
+    # --- Helpers; the table ones are called with _lock held ---
+    def _put_port(self, row):
+        device_id = self._port_devices.get(row.id)
+        if device_id is not None:
+            rest = tuple(port for port in self._ports.get(device_id, ()) if port.id != row.id)
+            if rest:
+                self._ports[device_id] = rest
+            else:
+                self._ports.pop(device_id, None)
+        self._ports[row.device_id] = self._ports.get(row.device_id, ()) + (row,)
+        self._port_devices[row.id] = row.device_id
+
+    def _drop_ports(self, server_id):
+        for port in self._ports.pop(server_id, ()):
+            self._port_devices.pop(port.id, None)
+
+    def _port_moved(self, port):
+        rows = self._ports.get(self._port_devices.get(port.id), ())
+        return all(row.id != port.id or row.updated_at != port.updated_at for row in rows)
+
+    @staticmethod
+    def _moved(rows, item):
+        row = rows.get(item.id)
+        return row is None or row.updated_at != item.updated_at
+
+    def _flavor(self, flavor):
+        # Embedded in the server since microversion 2.47, with a name but no id
+        key = (flavor.id or flavor.original_name, flavor.vcpus, flavor.ram)
+        row = self._flavors.get(key)
+        if row is None:
+            row = self._flavors[key] = Flavor(*key)
+        return row
+
+
+def _write_part(f, value):
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    f.write(len(data).to_bytes(8, "big") + data)  # a reader that finds it short reads it again next time
+    return 8 + len(data)
+
+
+def _read_part(f):
+    """The next pickled part of ``f``, or None at its end or if it is not all there yet."""
+    size = f.read(8)
+    if len(size) < 8:
+        return None
+    data = f.read(int.from_bytes(size, "big"))
+    if len(data) < int.from_bytes(size, "big"):
+        return None
+    return pickle.loads(data)
@@ -0,0 +1,201 @@
+# leader.py
+#
+# Run the reaper in exactly one process of the deployment. With REDIS_URL
+# set, every process of every replica (gunicorn workers, asgi_app.py) competes
+# for one Redis lease. Without it, a lock file decides, and that only holds
+# on a single host: a second replica would run a second reaper, so
+# lease() logs a warning and REAPER_ENABLED=False must be set on the others.
+#
+#   reaper_lease = lease("ui-demo-reaper", [Periodic(tick, 60)])
+#   reaper_lease.start()    # in every worker; the holder starts the jobs
+#   reaper_lease.stop()     # on exit: hand over at once
+import fcntl
+import logging
+import os
+import threading
+import uuid
+
+log = logging.getLogger("leader")
+
+# Extend the lease only if we still hold it; release likewise
+_RENEW = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def lease(name, jobs, lock_path=None):
+    """A :class:`LeaderLease` on ``REDIS_URL``, or a :class:`FileLease` on ``lock_path`` without it."""
+    url = os.getenv("REDIS_URL")
+    if url:
+        import redis
+        return LeaderLease(redis.Redis.from_url(url), name, jobs)
+    log.warning("REDIS_URL is not set: %s runs once per host, not once per deployment", name)
+    return FileLease(lock_path or f"/tmp/{name}.lock", jobs)
+
+
+class Periodic:
+    """Call ``fn`` every ``interval`` seconds on a thread of its own, from ``start()`` until ``stop()``."""
+
+    def __init__(self, fn, interval, name=None):
+        self.fn = fn
+        self.interval = float(interval)
+        self.name = name or getattr(fn, "__name__", "periodic")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        if self._thread and self._thread.is_alive():
+            return  # stopped and restarted within one tick: keep the running loop
+        self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        while not self._stop.is_set():
+            self.fn()
+            self._stop.wait(self.interval)
+
+
+class LeaderLease:
+    """Run background jobs in exactly one process of the whole deployment.
+
+    Every process calls ``start()``. Each tries to take a Redis lease
+    (``SET NX PX``); the holder starts the jobs and renews the lease every
+    ``ttl / 3`` seconds, the others retry at the same pace. When the holder
+    exits, ``stop()`` hands the lease over at once; if it dies, another
+    process takes over within ``ttl`` (LEADER_TTL, 30) seconds. A holder that
+    cannot renew stops its jobs before the lease can pass to anyone else.
+
+    ``jobs`` are objects with ``start()`` and ``stop()``, such as
+    :class:`Periodic`; ``leading`` can also be polled, as asgi_app.py does.
+    """
+
+    def __init__(self, redis_client, name, jobs, ttl=None):
+        self.redis = redis_client
+        self.key = f"leader:{name}"
+        self.jobs = list(jobs)
+        self.ttl = float(ttl or os.getenv("LEADER_TTL", 30))
+        self.token = None
+        self.leading = False
+        self._thread = None
+        self._stop = threading.Event()
+        self._renew = redis_client.register_script(_RENEW)
+        self._release = redis_client.register_script(_RELEASE)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        # A fresh token per process: a forked worker must not inherit its parent's lease
+        self.token = f"{os.getpid()}:{uuid.uuid4().hex}"
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name=f"leader-{self.key}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self.leading:
+            self._demote()
+            try:
+                self._release(keys=[self.key], args=[self.token])
+            except Exception as e:
+                log.warning("Leader lease not released: %s", e, extra={"lease": self.key})
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                # Redis unreachable: we cannot prove we still hold the lease
+                log.warning("Leader lease check failed: %s", e, extra={"lease": self.key})
+                if self.leading:
+                    self._demote()
+            self._stop.wait(self.ttl / 3)
+
+    def tick(self):
+        ttl_ms = int(self.ttl * 1000)
+        if self.leading:
+            if not self._renew(keys=[self.key], args=[self.token, ttl_ms]):
+                log.warning("Leader lease lost; stopping background jobs", extra={"lease": self.key})
+                self._demote()
+        elif self.redis.set(self.key, self.token, nx=True, px=ttl_ms):
+            self.leading = True
+            log.info("Leader lease taken", extra={"lease": self.key})
+            for job in self.jobs:
+                job.start()
+
+    def _demote(self):
+        self.leading = False
+        for job in self.jobs:
+            job.stop()
+
+
+class FileLease:
+    """Run background jobs in exactly one process on this host.
+
+    Every worker calls ``start()``. Each tries to take an exclusive lock on
+    ``path``. The process that gets it starts ``jobs`` and keeps the lock
+    until ``stop()`` or its exit; the others retry every ``interval``
+    seconds. The kernel drops the lock when its holder exits, so another
+    worker takes over within ``interval`` seconds after a crash or a graceful
+    reload. Replicas on other hosts do not see the lock.
+    """
+
+    def __init__(self, path, jobs, interval=None):
+        self.path = path
+        self.jobs = list(jobs)
+        self.interval = float(interval or os.getenv("LEADER_INTERVAL", 10))
+        self.leading = False
+        self._fd = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="leader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.leading:
+            self.leading = False
+            for job in self.jobs:
+                job.stop()
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def run(self):
+        while not self._stop.is_set():
+            if self.try_acquire():
+                for job in self.jobs:
+                    job.start()
+                return
+            self._stop.wait(self.interval)
+
+    def try_acquire(self):
+        if self.leading:
+            return True
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        os.ftruncate(self._fd, 0)
+        os.write(self._fd, f"{os.getpid()}\n".encode())  # who is running it, for operators
+        self.leading = True
+        return True
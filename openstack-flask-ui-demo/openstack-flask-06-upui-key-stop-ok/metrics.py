@@ -0,0 +1,149 @@
+# metrics.py
+import hmac
+import inspect
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+# OpenStack calls and reaper passes take from tens of ms to minutes
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Flask request latency",
+    ["method", "route", "status"],
+)
+OPENSTACK_LATENCY = Histogram(
+    "openstack_call_duration_seconds", "OpenStack SDK call latency",
+    ["service", "operation"], buckets=SLOW_BUCKETS,
+)
+OPENSTACK_ERRORS = Counter(
+    "openstack_call_errors_total", "OpenStack SDK calls that raised",
+    ["service", "operation", "error"],
+)
+REAPER_TICK = Histogram(
+    "reaper_tick_duration_seconds", "Duration of one pass of the instance reaper",
+    buckets=SLOW_BUCKETS,
+)
+REAPER_STOPPED = Counter("reaper_instances_stopped_total", "Instances stopped by the reaper")
+REAPER_ERRORS = Counter("reaper_errors_total", "Reaper passes or stops that failed")
+REAPER_RETRIES = Counter("reaper_stop_retries_total", "Reaper stops retried after a transient failure")
+QUOTA_REJECTED = Counter(
+    "quota_rejected_launches_total", "Instance launches refused by admission control",
+    ["resource"],
+)
+
+
+def init_app(app):
+    """Time every request and serve the registry at ``/metrics``.
+
+    Set ``METRICS_TOKEN`` to require ``Authorization: Bearer <token>`` from
+    the scraper. Under a pre-forking server set ``PROMETHEUS_MULTIPROC_DIR``
+    so every worker's samples are aggregated.
+    """
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_latency(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            # The route template ("/instances/<instance_id>") keeps label cardinality bounded
+            route = request.url_rule.rule if request.url_rule else "<unmatched>"
+            REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(
+                time.perf_counter() - start
+            )
+        return response
+
+    def metrics_view():
+        body, status, content_type = exposition(request.headers.get("Authorization", ""))
+        return Response(body, status=status, mimetype=content_type)
+
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+
+
+def exposition(authorization):
+    """``(body, status, content_type)`` for a scrape; shared by the Flask and ASGI apps."""
+    token = os.getenv("METRICS_TOKEN")
+    if token and not hmac.compare_digest(authorization, f"Bearer {token}"):
+        return "unauthorized\n", 401, "text/plain"
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), 200, CONTENT_TYPE_LATEST
+
+
+# === OpenStack ===
+SERVICES = ("identity", "compute", "network", "image", "block_storage", "object_store", "load_balancer")
+
+
+class InstrumentedConnection:
+    """Wrap an ``openstack.connection.Connection`` so service proxy calls are timed.
+
+    ``conn.network.create_network(...)`` is recorded as service ``network``,
+    operation ``create_network``. Listing calls return generators; those are
+    timed until the caller finishes iterating, which is when the API pages
+    are actually fetched.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._proxies = {}
+
+    def __getattr__(self, name):
+        if name in SERVICES:
+            proxy = self._proxies.get(name)
+            if proxy is None:
+                proxy = self._proxies[name] = _TimedProxy(name, getattr(self._conn, name))
+            return proxy
+        return getattr(self._conn, name)
+
+
+class _TimedProxy:
+    def __init__(self, service, proxy):
+        self._service = service
+        self._proxy = proxy
+
+    def __getattr__(self, name):
+        attr = getattr(self._proxy, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        return _timed_call(self._service, name, attr)
+
+
+def _timed_call(service, operation, fn):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            OPENSTACK_ERRORS.labels(service, operation, type(e).__name__).inc()
+            OPENSTACK_LATENCY.labels(service, operation).observe(time.perf_counter() - start)
+            raise
+        if inspect.isgenerator(result):
+            return _timed_iter(service, operation, result, start)
+        OPENSTACK_LATENCY.labels(service, operation).observe(time.perf_counter() - start)
+        return result
+    return wrapper
+
+
+def _timed_iter(service, operation, iterator, start):
+    try:
+        yield from iterator
+    except Exception as e:
+        OPENSTACK_ERRORS.labels(service, operation, type(e).__name__).inc()
+        raise
+    finally:
+        OPENSTACK_LATENCY.labels(service, operation).observe(time.perf_counter() - start)
+
+
+def instrument_connection(conn):
+    if isinstance(conn, InstrumentedConnection):
+        return conn
+    return InstrumentedConnection(conn)
+
@@ -0,0 +1,213 @@
+# openstack_async.py
+import asyncio
+import os
+import time
+
+import httpx
+import openstack.config
+
+import metrics
+import tracing
+
+# Version suffix each catalog endpoint needs when the catalog lists the bare service URL
+API_VERSIONS = {"compute": "", "network": "/v2.0", "image": "/v2"}
+
+
+class OpenStackError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class NotFound(OpenStackError):
+    pass
+
+
+class AsyncOpenStack:
+    """Nova, Neutron and Glance over their REST APIs with one shared ``httpx.AsyncClient``.
+
+    Keystone is only used to get a token and the service catalog (through the
+    same clouds.yaml the SDK reads). The token is reused by every call until
+    shortly before it expires, or until a service answers 401. Thousands of
+    calls can be in flight at once; ``OS_MAX_CONNECTIONS`` caps the sockets.
+    Resources are returned as the plain JSON dicts the APIs send.
+    """
+
+    def __init__(self, cloud="openstack"):
+        self.cloud = cloud
+        self.client = None
+        self.endpoints = {}
+        self._session = None
+        self._token = None
+        self._expires = 0.0
+        self._token_lock = None
+
+    async def start(self):
+        max_connections = int(os.getenv("OS_MAX_CONNECTIONS", 1000))
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=min(max_connections, 200)),
+            timeout=float(os.getenv("OS_TIMEOUT", 60)),
+        )
+        self._token_lock = asyncio.Lock()
+        await self.token()
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+    # === Keystone ===
+    async def token(self, stale=None):
+        """Current token. Re-authenticates, once for all waiting callers, near expiry or
+        when ``stale`` (a token a service just rejected) is still the current one."""
+        if self._token and self._token != stale and time.time() < self._expires:
+            return self._token
+        async with self._token_lock:
+            if not self._token or self._token == stale or time.time() >= self._expires:
+                await asyncio.to_thread(self._authenticate, stale is not None)
+        return self._token
+
+    def _authenticate(self, force):
+        # keystoneauth does the password/application-credential dance from clouds.yaml
+        if self._session is None:
+            region = openstack.config.OpenStackConfig().get_one(cloud=self.cloud)
+            self._session = region.get_session()
+            self._interface = region.get_interface()
+            self._region_name = region.get_region_name()
+        if force:
+            self._session.invalidate()
+        self._token = self._session.get_token()
+        access = self._session.auth.get_access(self._session)
+        # Renew a minute early so no request goes out with an expiring token
+        self._expires = access.expires.timestamp() - 60 if access.expires else time.time() + 3000
+        for service, suffix in API_VERSIONS.items():
+            url = self._session.get_endpoint(
+                service_type=service, interface=self._interface, region_name=self._region_name,
+            ).rstrip("/")
+            if suffix and not url.endswith(suffix):
+                url += suffix
+            self.endpoints[service] = url
+
+    # === HTTP ===
+    async def request(self, service, method, path, operation, params=None, body=None):
+        url = path if path.startswith("http") else self.endpoints[service] + path
+        start = time.perf_counter()
+        with tracing.span(f"{service}.{operation}", {"openstack.service": service, "openstack.operation": operation}):
+            try:
+                token = await self.token()
+                response = await self._send(method, url, params, body, token)
+                if response.status_code == 401:
+                    token = await self.token(stale=token)
+                    response = await self._send(method, url, params, body, token)
+            except httpx.HTTPError as e:
+                metrics.OPENSTACK_ERRORS.labels(service, operation, type(e).__name__).inc()
+                raise
+            finally:
+                metrics.OPENSTACK_LATENCY.labels(service, operation).observe(time.perf_counter() - start)
+        if response.status_code >= 400:
+            error = NotFound if response.status_code == 404 else OpenStackError
+            metrics.OPENSTACK_ERRORS.labels(service, operation, error.__name__).inc()
+            raise error(response.status_code, _error_message(response))
+        return response.json() if response.content else None
+
+    async def _send(self, method, url, params, body, token):
+        headers = {"X-Auth-Token": token, "Accept": "application/json"}
+        return await self.client.request(method, url, params=params, json=body, headers=headers)
+
+    async def _paginate(self, service, path, key, operation, params=None):
+        """Yield every item of a list call, following ``<key>_links``/Glance ``next`` links."""
+        url, query = path, params
+        while url:
+            data = await self.request(service, "GET", url, operation, params=query)
+            for item in data.get(key, []):
+                yield item
+            url, query = _next_link(self.endpoints[service], data, key), None
+
+    # === Nova ===
+    def servers(self, **filters):
+        return self._paginate("compute", "/servers/detail", "servers", "servers", filters or None)
+
+    async def get_server(self, server_id):
+        try:
+            data = await self.request("compute", "GET", f"/servers/{server_id}", "get_server")
+        except NotFound:
+            return None
+        return data["server"]
+
+    async def create_server(self, name, image_id, flavor_id, networks, key_name=None):
+        server = {"name": name, "imageRef": image_id, "flavorRef": flavor_id, "networks": networks}
+        if key_name:
+            server["key_name"] = key_name
+        data = await self.request("compute", "POST", "/servers", "create_server", body={"server": server})
+        return data["server"]
+
+    async def wait_for_server(self, server_id, status="ACTIVE", interval=2, wait=120):
+        deadline = time.monotonic() + wait
+        while True:
+            server = await self.get_server(server_id)
+            if server is None:
+                raise NotFound(404, f"Server {server_id} disappeared while waiting for {status}")
+            if server["status"] == status:
+                return server
+            if server["status"] == "ERROR":
+                fault = server.get("fault", {}).get("message", "no fault recorded")
+                raise OpenStackError(500, f"Server {server_id} went to ERROR: {fault}")
+            if time.monotonic() >= deadline:
+                raise OpenStackError(408, f"Timed out waiting for server {server_id} to reach {status}")
+            await asyncio.sleep(interval)
+
+    async def _action(self, server_id, action, operation):
+        await self.request("compute", "POST", f"/servers/{server_id}/action", operation, body=action)
+
+    async def stop_server(self, server_id):
+        await self._action(server_id, {"os-stop": None}, "stop_server")
+
+    async def start_server(self, server_id):
+        await self._action(server_id, {"os-start": None}, "start_server")
+
+    async def reboot_server(self, server_id, reboot_type="SOFT"):
+        await self._action(server_id, {"reboot": {"type": reboot_type}}, "reboot_server")
+
+    async def delete_server(self, server_id):
+        await self.request("compute", "DELETE", f"/servers/{server_id}", "delete_server")
+
+    def flavors(self):
+        return self._paginate("compute", "/flavors/detail", "flavors", "flavors")
+
+    async def create_keypair(self, name):
+        data = await self.request("compute", "POST", "/os-keypairs", "create_keypair", body={"keypair": {"name": name}})
+        return data["keypair"]
+
+    # === Glance and Neutron ===
+    def images(self):
+        return self._paginate("image", "/images", "images", "images")
+
+    def networks(self, **filters):
+        return self._paginate("network", "/networks", "networks", "networks", filters or None)
+
+
+def _next_link(endpoint, data, key):
+    for link in data.get(f"{key}_links", []):
+        if link.get("rel") == "next":
+            return link["href"]
+    if data.get("next"):
+        # Glance: "/v2/images?marker=..." relative to the unversioned endpoint
+        return endpoint.rsplit("/v2", 1)[0] + data["next"]
+    return None
+
+
+def _error_message(response):
+    try:
+        body = response.json()
+    except ValueError:
+        return response.text[:200]
+    if isinstance(body, dict) and body:
+        # {"itemNotFound": {"message": ...}}, {"NeutronError": {"message": ...}}, {"error": {"message": ...}}
+        detail = next(iter(body.values()))
+        if isinstance(detail, dict) and detail.get("message"):
+            return detail["message"]
+    return response.text[:200]
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
@@ -0,0 +1,215 @@
+# quota.py
+#
+# Admission control for instance launches. QuotaGuard keeps each project's
+# Nova limits and Neutron floating IP quota in memory, together with what the
+# project uses and what launches still in flight have reserved. A launch that
+# cannot fit is turned away before any API call is made.
+#
+#   with quota.reserve(project_id, flavor_id, floating_ips=1) as reservation:
+#       server = conn.compute.create_server(...)
+#       reservation.commit()        # now counted as used
+#   ...
+#   quota.release(project_id, server.flavor)   # after delete_server
+#
+# Creates and deletes made through the guard update the view as they happen.
+# Everything else (other clients, Horizon) is picked up when the view is
+# re-read, in the background, once it is older than QUOTA_TTL seconds. If the
+# quota cannot be read at all, launches are let through and Nova decides.
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger("quota")
+
+RESOURCES = ("instances", "cores", "ram", "floating_ips")
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, resource, requested, in_use, limit):
+        super().__init__(
+            f"Quota exceeded for {resource}: requested {requested}, "
+            f"{in_use} of {limit} already in use or reserved"
+        )
+        self.resource = resource
+        self.requested = requested
+        self.in_use = in_use
+        self.limit = limit
+
+
+class _Project:
+    __slots__ = ("limits", "used", "reserved", "changes", "loaded_at", "refreshing")
+
+    def __init__(self, limits, used):
+        self.limits = limits                         # -1 is unlimited
+        self.used = used
+        self.reserved = dict.fromkeys(RESOURCES, 0)  # held by launches in flight
+        self.changes = dict.fromkeys(RESOURCES, 0)   # running total of our own creates and deletes
+        self.loaded_at = time.monotonic()
+        self.refreshing = False
+
+
+class Reservation:
+    """Capacity held for one launch until it is committed or released.
+
+    Leaving the ``with`` block without calling :meth:`commit` releases it, so
+    a failed ``create_server`` gives the capacity back.
+    """
+
+    def __init__(self, guard, project_id, amounts):
+        self.guard = guard
+        self.project_id = project_id
+        self.amounts = amounts
+        self.settled = False
+
+    def commit(self):
+        """The server exists: count the reservation as used."""
+        self.guard._settle(self, used=True)
+
+    def release(self):
+        self.guard._settle(self, used=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if not self.settled:
+            self.release()
+        return False
+
+
+class QuotaGuard:
+    def __init__(self, conn, ttl=None):
+        self.conn = conn
+        self.ttl = float(ttl if ttl is not None else os.getenv("QUOTA_TTL", 60))
+        self._lock = threading.Lock()
+        self._projects = {}
+        self._flavors = {}  # flavor id -> (vcpus, ram); flavors do not change size
+
+    def reserve(self, project_id, flavor_id, floating_ips=0):
+        """Hold the capacity of one server of ``flavor_id``, or raise :class:`QuotaExceeded`."""
+        vcpus, ram = self.flavor_size(flavor_id)
+        amounts = {"instances": 1, "cores": vcpus, "ram": ram, "floating_ips": floating_ips}
+        project = self._project(project_id)
+        if project is None:
+            return Reservation(self, project_id, amounts)
+        with self._lock:
+            for resource in RESOURCES:
+                amount, limit = amounts[resource], project.limits[resource]
+                in_use = project.used[resource] + project.reserved[resource]
+                if amount and limit >= 0 and in_use + amount > limit:
+                    raise QuotaExceeded(resource, amount, in_use, limit)
+            for resource in RESOURCES:
+                project.reserved[resource] += amounts[resource]
+        return Reservation(self, project_id, amounts)
+
+    def release(self, project_id, flavor, floating_ips=0):
+        """A server was deleted; ``flavor`` is its ``server.flavor``."""
+        vcpus, ram = flavor.vcpus, flavor.ram  # embedded in the server since microversion 2.47
+        if vcpus is None:
+            vcpus, ram = self.flavor_size(flavor.id)
+        self._change(project_id, {"instances": -1, "cores": -vcpus, "ram": -ram, "floating_ips": -floating_ips})
+
+    def add_floating_ips(self, project_id, count):
+        """Floating IPs allocated (or freed, with a negative count) outside a launch."""
+        self._change(project_id, {"floating_ips": count})
+
+    def flavor_size(self, flavor_id):
+        size = self._flavors.get(flavor_id)
+        if size is None:
+            flavor = self.conn.compute.get_flavor(flavor_id)
+            size = self._flavors[flavor_id] = (flavor.vcpus, flavor.ram)
+        return size
+
+    def usage(self, project_id):
+        """``{resource: (used, reserved, limit)}`` as the guard sees it, or None if unknown."""
+        project = self._project(project_id)
+        if project is None:
+            return None
+        with self._lock:
+            return {r: (project.used[r], project.reserved[r], project.limits[r]) for r in RESOURCES}
+
+    def refresh(self, project_id):
+        """Re-read ``project_id``'s limits and usage from Nova and Neutron."""
+        with self._lock:
+            project = self._projects.get(project_id)
+            changes = dict(project.changes) if project else None
+        try:
+            limits, used = self._fetch(project_id)
+        except Exception:
+            if project is None:
+                raise
+            log.exception("Quota refresh failed", extra={"project_id": project_id})
+            with self._lock:
+                project.refreshing = False
+            return
+        with self._lock:
+            project = self._projects.get(project_id)
+            if project is None:
+                self._projects[project_id] = _Project(limits, used)
+                return
+            # Creates and deletes that landed while we were fetching may be
+            # missing from what Nova returned; keep them until the next refresh
+            project.used = {r: max(0, used[r] + project.changes[r] - changes.get(r, 0)) for r in RESOURCES}
+            project.limits = limits
+            project.loaded_at = time.monotonic()
+            project.refreshing = False
+
+    def _project(self, project_id):
+        project = self._projects.get(project_id)
+        if project is None:
+            # First launch in this project: nothing to go on until the quota is read
+            try:
+                self.refresh(project_id)
+            except Exception:
+                log.exception("Quota unavailable, admitting without a check", extra={"project_id": project_id})
+                return None
+            return self._projects[project_id]
+        if time.monotonic() - project.loaded_at > self.ttl:
+            with self._lock:
+                start, project.refreshing = not project.refreshing, True
+            if start:
+                # Launches keep using the current view while it is re-read
+                threading.Thread(target=self.refresh, args=(project_id,), name="quota-refresh", daemon=True).start()
+        return project
+
+    def _fetch(self, project_id):
+        compute = self.conn.compute.get_limits(project_id=project_id).absolute
+        floating = self.conn.network.get_quota(project_id, details=True).floating_ips or {}
+        limits = {
+            "instances": compute.instances,
+            "cores": compute.total_cores,
+            "ram": compute.total_ram,
+            "floating_ips": floating.get("limit", -1),
+        }
+        used = {
+            "instances": compute.instances_used,
+            "cores": compute.total_cores_used,
+            "ram": compute.total_ram_used,
+            "floating_ips": floating.get("used", 0),
+        }
+        return ({r: -1 if v is None else v for r, v in limits.items()},
+                {r: v or 0 for r, v in used.items()})
+
+    def _change(self, project_id, deltas):
+        with self._lock:
+            project = self._projects.get(project_id)
+            if project is None:
+                return  # not loaded yet; the first read will include it
+            for resource, delta in deltas.items():
+                project.used[resource] = max(0, project.used[resource] + delta)
+                project.changes[resource] += delta
+
+    def _settle(self, reservation, used):
+        with self._lock:
+            if reservation.settled:
+                return
+            reservation.settled = True
+            project = self._projects.get(reservation.project_id)
+            if project is None:
+                return  # admitted without a check
+            for resource, amount in reservation.amounts.items():
+                project.reserved[resource] -= amount
+                if used:
+                    project.used[resource] += amount
+                    project.changes[resource] += amount
@@ -0,0 +1,278 @@
+# reaper.py
+#
+# Which instances the reaper stops: ACTIVE ones created more than
+# REAPER_MAX_AGE (60) seconds ago. app.py and asgi_app.py both decide here.
+#
+#   active = [i for i in instances if i.status == 'ACTIVE']
+#   for i in expired([i.created_at for i in active], time.time()):
+#       stop(active[i])
+#
+# A tick looks at every server, so the check is one batch: Nova's creation
+# times ("2024-05-01T12:00:00Z") are validated and converted to epoch seconds
+# as NumPy arrays and compared against one `now`. Parsing each timestamp with
+# dateutil took about 4 s per tick for 100k servers; this takes about 40 ms
+# (benchmarks/bench_reaper.py).
+#
+# app.py hands the expired instances to a Stopper, which stops them
+# concurrently and remembers which stops are in flight:
+#
+#   stopper = Stopper(lambda server_id: conn.compute.stop_server(server_id))
+#   stopper.settled(ids_still_active)     # forget stops that have finished
+#   stopper.submit(expired_instances)     # skips those already being stopped
+#
+# asgi_app.py does the same with an AsyncStopper over openstack_async, on
+# the event loop instead of a thread pool.
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+from keystoneauth1 import exceptions as ks_exceptions
+from openstack import exceptions
+
+import metrics
+
+log = logging.getLogger("reaper")
+
+MAX_AGE = float(os.getenv("REAPER_MAX_AGE", 60))
+
+# Byte positions in "YYYY-MM-DDTHH:MM:SS" and what may follow it (end, Z, fraction)
+_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+_DASHES = [4, 7]
+_COLONS = [13, 16]
+_ENDINGS = [0, ord("Z"), ord(".")]
+_PLACES = {2: np.array([10, 1]), 4: np.array([1000, 100, 10, 1])}
+
+
+def epoch_seconds(timestamps):
+    """Nova timestamps as an int64 array of epoch seconds; a missing or malformed timestamp is -1.
+
+    Nova writes UTC as ``YYYY-MM-DDTHH:MM:SSZ``. The first 19 characters must
+    be exactly that shape, with a real date and time, and may be followed only
+    by ``Z`` or fractional seconds (which are dropped). Anything else is -1,
+    so one bad value cannot fail the whole tick.
+    """
+    # One row of bytes per timestamp; shorter strings are padded with NULs
+    raw = np.array([(timestamp or "").encode("ascii", "replace")[:20] if isinstance(timestamp, str) else b""
+                    for timestamp in timestamps], dtype="S20")
+    chars = raw.view(np.uint8).reshape(len(raw), 20)
+    valid = ((chars[:, _DASHES] == ord("-")).all(axis=1) & (chars[:, 10] == ord("T"))
+             & (chars[:, _COLONS] == ord(":")).all(axis=1) & np.isin(chars[:, 19], _ENDINGS))
+    digits = chars[:, _DIGITS].astype(np.int64) - ord("0")
+    valid &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+    year, month, day, hour, minute, second = (
+        (digits[:, i:j] * _PLACES[j - i]).sum(axis=1) for i, j in ((0, 4), (4, 6), (6, 8), (8, 10), (10, 12), (12, 14))
+    )
+    valid &= (month >= 1) & (month <= 12) & (hour < 24) & (minute < 60) & (second < 60)
+    month_start = ((year - 1970) * 12 + np.where(valid, month - 1, 0)).astype("datetime64[M]")
+    first_day = month_start.astype("datetime64[D]").astype(np.int64)
+    days_in_month = (month_start + 1).astype("datetime64[D]").astype(np.int64) - first_day
+    valid &= (day >= 1) & (day <= days_in_month)
+    seconds = (first_day + day - 1) * 86400 + hour * 3600 + minute * 60 + second
+    seconds[~valid] = -1
+    return seconds
+
+
+def expired(created_at, now, max_age=None):
+    """Indices of the ``created_at`` timestamps more than ``max_age`` seconds before ``now``."""
+    created = epoch_seconds(created_at)
+    cutoff = now - (MAX_AGE if max_age is None else max_age)
+    return np.flatnonzero((created >= 0) & (created < cutoff))
+
+
+class Stopper:
+    """Stop instances on a bounded pool of threads, each one on its own.
+
+    At most ``concurrency`` (REAPER_CONCURRENCY, 10: the connections the
+    SDK keeps open to one service) stops run at once. A
+    stop that fails with a 5xx, a 429 or a dropped connection is retried
+    after ``backoff`` (REAPER_BACKOFF, 1) seconds, then twice that, and so on,
+    up to ``retries`` (REAPER_RETRIES, 3) times. The wait holds no pool thread:
+    retries are kept in a heap and handed back to the pool by one scheduler
+    thread when they are due. Nova's 409 means the instance
+    is already changing state and 404 that it is gone; neither is an error.
+    Any other failure is logged and counted, and the next tick tries again.
+
+    An instance stays in flight from :meth:`submit` until :meth:`settled`
+    no longer sees it ACTIVE, or for at most ``timeout``
+    (REAPER_STOP_TIMEOUT, 300) seconds. Ticks in between do not stop it
+    again.
+    """
+
+    def __init__(self, stop, concurrency=None, retries=None, backoff=None, timeout=None):
+        self.stop = stop  # stop(server_id)
+        self.concurrency = int(concurrency if concurrency is not None else os.getenv("REAPER_CONCURRENCY", 10))
+        self.retries = int(retries if retries is not None else os.getenv("REAPER_RETRIES", 3))
+        self.backoff = float(backoff if backoff is not None else os.getenv("REAPER_BACKOFF", 1))
+        self.timeout = float(timeout if timeout is not None else os.getenv("REAPER_STOP_TIMEOUT", 300))
+        self._lock = threading.Lock()
+        self._in_flight = {}  # server id -> time.monotonic() of submit
+        self._pool = None
+        self._retries = []  # heap of (due, seq, instance, attempt)
+        self._seq = itertools.count()
+        self._due = threading.Condition(self._lock)
+        self._scheduler = None
+
+    def submit(self, instances):
+        """Start stopping ``instances`` (objects with ``id`` and ``name``); returns how many were not in flight."""
+        with self._lock:
+            if self._pool is None:
+                # Created on first use: threads do not survive a fork
+                self._pool = ThreadPoolExecutor(self.concurrency, thread_name_prefix="reaper-stop")
+            fresh = self._claim(instances)
+            for instance in fresh:
+                self._pool.submit(self._stop, instance)
+        return len(fresh)
+
+    def _claim(self, instances):
+        # Called with _lock held
+        now = time.monotonic()
+        fresh = []
+        for instance in instances:
+            submitted = self._in_flight.get(instance.id)
+            if submitted is None or now - submitted > self.timeout:
+                self._in_flight[instance.id] = now
+                fresh.append(instance)
+        return fresh
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    def settled(self, active_ids):
+        """Forget the stops of instances that are no longer in ``active_ids``: they have stopped or are gone."""
+        with self._lock:
+            for server_id in [server_id for server_id in self._in_flight if server_id not in active_ids]:
+                del self._in_flight[server_id]
+
+    def _stop(self, instance, attempt=0):
+        try:
+            self.stop(instance.id)
+        except Exception as e:
+            delay = self._failed(instance, e, attempt)
+            if delay is not None:
+                self._retry_later(delay, instance, attempt + 1)
+            return
+        self._stopped(instance)
+
+    def _stopped(self, instance):
+        metrics.REAPER_STOPPED.inc()
+        log.info('Stopped instance after exceeding time limit',
+                 extra={'instance_id': instance.id, 'instance': instance.name})
+
+    def _failed(self, instance, error, attempt):
+        """Settle a failed stop; returns how long to wait before retrying it, or None."""
+        extra = {'instance_id': instance.id, 'instance': instance.name}
+        status = _status(error)
+        if isinstance(error, exceptions.ConflictException) or status == 409:
+            log.info('Instance is already changing state', extra=extra)
+            return None
+        if isinstance(error, exceptions.NotFoundException) or status == 404:
+            self._forget(instance.id)
+            return None
+        if attempt < self.retries and _retriable(error):
+            delay = self.backoff * 2 ** attempt
+            metrics.REAPER_RETRIES.inc()
+            # Jitter, so retries do not arrive together
+            return delay + random.uniform(0, delay / 2)
+        metrics.REAPER_ERRORS.inc()
+        log.error('Error stopping instance: %s', error, extra=extra)
+        self._forget(instance.id)
+        return None
+
+    def _retry_later(self, delay, instance, attempt):
+        with self._due:
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), instance, attempt))
+            if self._scheduler is None:
+                self._scheduler = threading.Thread(target=self._schedule, name="reaper-retry", daemon=True)
+                self._scheduler.start()
+            self._due.notify()
+
+    def _schedule(self):
+        with self._due:
+            while True:
+                if not self._retries:
+                    self._due.wait()
+                    continue
+                wait = self._retries[0][0] - time.monotonic()
+                if wait > 0:
+                    self._due.wait(wait)
+                    continue
+                _, _, instance, attempt = heapq.heappop(self._retries)
+                if instance.id in self._in_flight:  # not settled in the meantime
+                    self._pool.submit(self._stop, instance, attempt)
+
+    def _forget(self, server_id):
+        with self._lock:
+            self._in_flight.pop(server_id, None)
+
+
+class AsyncStopper(Stopper):
+    """:class:`Stopper` on the event loop, for ``stop`` coroutines such as ``AsyncOpenStack.stop_server``.
+
+    The same in-flight tracking, 409/404 handling and retries. Each stop is
+    a task; at most ``concurrency`` call Nova at once, and one waiting to be
+    retried holds no slot. Call :meth:`submit` from the loop.
+    """
+
+    def __init__(self, stop, concurrency=None, retries=None, backoff=None, timeout=None):
+        super().__init__(stop, concurrency, retries, backoff, timeout)
+        self._slots = None
+        self._tasks = set()
+
+    def submit(self, instances):
+        if self._slots is None:
+            # Created on first use, inside the running loop
+            self._slots = asyncio.Semaphore(self.concurrency)
+        with self._lock:
+            fresh = self._claim(instances)
+        for instance in fresh:
+            task = asyncio.ensure_future(self._stop(instance))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return len(fresh)
+
+    def cancel(self):
+        """Abandon the stops still running or waiting to be retried."""
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def _stop(self, instance, attempt=0):
+        while True:
+            try:
+                async with self._slots:
+                    await self.stop(instance.id)
+            except Exception as e:
+                delay = self._failed(instance, e, attempt)
+                if delay is None:
+                    return
+                await asyncio.sleep(delay)
+                with self._lock:
+                    if instance.id not in self._in_flight:
+                        return  # settled in the meantime
+                attempt += 1
+                continue
+            self._stopped(instance)
+            return
+
+
+def _status(error):
+    # The SDK's exceptions carry status_code, openstack_async's status
+    status = getattr(error, "status_code", None)
+    return status if status is not None else getattr(error, "status", None)
+
+
+def _retriable(error):
+    if isinstance(error, (ks_exceptions.RetriableConnectionFailure, httpx.TransportError)):
+        return True
+    status = _status(error)
+    if status is None:
+        return isinstance(error, exceptions.HttpException)
+    return status >= 500 or status == 429
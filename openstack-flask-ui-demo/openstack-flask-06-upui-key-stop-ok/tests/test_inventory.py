@@ -0,0 +1,202 @@
+# tests/test_inventory.py
+from datetime import datetime, timezone
+
+import mock_openstack
+import pytest
+
+import inventory
+from inventory import Inventory
+
+
+def make(conn, tmp_path, **kwargs):
+    return Inventory(conn, interval=1, max_age=60, lock_path=str(tmp_path / "lock"),
+                     snapshot_path=str(tmp_path / "snapshot" / "file"), **kwargs)
+
+
+def server_calls(cloud):
+    return sum(count for key, count in cloud.stats.items() if key.startswith("compute GET servers 200"))
+
+
+def create_server(conn, simulator, name):
+    network = simulator.state.private["id"]
+    return conn.compute.create_server(name=name, image_id=next(iter(simulator.state.images)),
+                                      flavor_id="1", networks=[{"uuid": network}])
+
+
+@pytest.fixture
+def fleet(simulator, monkeypatch):
+    monkeypatch.setattr(mock_openstack, "MAX_LIMIT", 10)  # several pages from a small fleet
+    simulator.state.seed_servers(25)
+    return simulator
+
+
+def test_delta_sync_lists_only_what_changed(conn, fleet, tmp_path):
+    inv = make(conn, tmp_path)
+    inv.sync()
+    assert len(inv.servers()) == 25
+    full = server_calls(fleet)
+    assert full == 3  # 10 servers a page
+
+    gone = inv.servers()[0]
+    conn.compute.delete_server(gone.id)
+    created = create_server(conn, fleet, "new-one")
+    inv.sync()
+
+    assert server_calls(fleet) == full + 1  # one changes-since page
+    ids = {row.id for row in inv.servers()}
+    assert created.id in ids
+    assert gone.id not in ids
+    assert inv.server(gone.id) is None
+    assert len(ids) == 25
+
+
+def test_reader_loads_the_snapshot_then_only_appended_changes(conn, fleet, tmp_path):
+    writer, reader = make(conn, tmp_path), make(conn, tmp_path)
+    writer._publish(writer._sync())
+    reader._load()
+    assert {row.id for row in reader.servers()} == {row.id for row in writer.servers()}
+    offset = reader._offset
+
+    created = create_server(conn, fleet, "appended")
+    writer._publish(writer._sync())
+    calls = server_calls(fleet)
+    reader._load()
+
+    assert reader._offset > offset  # read on from where it was
+    assert reader.server(created.id).name == "appended"
+    assert server_calls(fleet) == calls  # from the file, not from Nova
+
+
+def test_takeover_continues_from_the_snapshot(conn, fleet, tmp_path):
+    first, second = make(conn, tmp_path), make(conn, tmp_path)
+    first._publish(first._sync())
+    calls = server_calls(fleet)
+
+    # The second worker takes the lease: it loads, syncs only the changes and writes a new file
+    created = create_server(conn, fleet, "after-takeover")
+    second._load()
+    second._publish(second._sync())
+    assert server_calls(fleet) == calls + 1
+    assert second._token != first._token
+
+    first._load()
+    assert first._token == second._token
+    assert first.server(created.id).name == "after-takeover"
+
+
+def test_partial_append_is_read_once_complete(conn, fleet, tmp_path):
+    writer, reader = make(conn, tmp_path), make(conn, tmp_path)
+    writer._publish(writer._sync())
+    reader._load()
+    offset = reader._offset
+
+    create_server(conn, fleet, "partial")
+    changes = writer._sync()
+    path = writer.snapshot_path
+    record = {"synced": writer._synced, "since": dict(writer._since), "keypairs_at": writer._keypairs_at,
+              "changes": changes}
+    with open(path, "ab") as f:
+        inventory._write_part(f, record)
+    with open(path, "rb") as f:
+        whole = f.read()
+    with open(path, "wb") as f:
+        f.write(whole[:-10])  # the writer has not finished the part yet
+
+    reader._load()
+    assert reader._offset == offset
+    assert "partial" not in {row.name for row in reader.servers()}
+
+    with open(path, "wb") as f:
+        f.write(whole)
+    reader._checked = None
+    reader._load()
+    assert reader._offset == len(whole)
+    assert "partial" in {row.name for row in reader.servers()}
+
+
+def test_corrupt_append_makes_the_reader_sync_itself(conn, fleet, tmp_path):
+    writer, reader = make(conn, tmp_path), make(conn, tmp_path)
+    writer._publish(writer._sync())
+    reader._load()
+
+    with open(writer.snapshot_path, "ab") as f:
+        f.write((16).to_bytes(8, "big") + b"not a pickle....")
+    reader._load()
+    assert reader._unreadable is not None
+
+    # Stale and not reading the file: a read syncs by itself
+    created = create_server(conn, fleet, "synced-alone")
+    reader.synced_at -= reader.max_age + 1
+    assert reader.server(created.id).name == "synced-alone"
+    assert "synced-alone" in {row.name for row in reader.servers()}
+
+    # A new file from the syncing worker is read again
+    writer._sync_all(writer._synced)
+    writer._publish(None)
+    reader._load()
+    assert reader._token == writer._token
+
+
+def test_truncated_snapshot_is_not_loaded(conn, fleet, tmp_path):
+    writer, reader = make(conn, tmp_path), make(conn, tmp_path)
+    writer._publish(writer._sync())
+    with open(writer.snapshot_path, "rb") as f:
+        token = f.readline()
+    with open(writer.snapshot_path, "wb") as f:
+        f.write(token + b"\0\0")
+
+    reader._load()
+    assert reader._token is None
+    assert reader._unreadable is not None
+    assert len(reader.servers()) == 25  # synced by itself, never half loaded
+
+
+def test_failed_append_writes_a_new_file(conn, fleet, tmp_path, monkeypatch):
+    writer = make(conn, tmp_path)
+    writer._publish(writer._sync())
+    token = writer._token
+
+    def fail(f, value):
+        f.write(b"\0\0\0")
+        raise OSError("disk full")
+
+    create_server(conn, fleet, "after-failure")
+    changes = writer._sync()
+    monkeypatch.setattr(inventory, "_write_part", fail)
+    with pytest.raises(OSError):
+        writer._publish(changes)
+    monkeypatch.undo()
+
+    writer._publish(writer._sync())
+    assert writer._token != token
+    reader = make(conn, tmp_path)
+    reader._load()
+    assert "after-failure" in {row.name for row in reader.servers()}
+
+
+def test_watermark_falls_back_to_the_clock_for_an_empty_table(conn, tmp_path):
+    inv = make(conn, tmp_path)
+    wall = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc).timestamp()
+
+    inv._advance("servers", [], wall)
+    assert inv._since["servers"] == "2024-05-01T11:55:00Z"  # less SKEW
+
+    class Row:
+        updated_at = "2024-05-01T12:30:00Z"
+
+    inv._advance("servers", [Row()], wall)
+    assert inv._since["servers"] == "2024-05-01T12:29:58Z"  # less OVERLAP
+
+    inv._advance("servers", [], wall)
+    assert inv._since["servers"] == "2024-05-01T12:29:58Z"  # nothing new: unchanged
+
+
+def test_current_reads_nova_and_forgets_deleted_servers(conn, fleet, tmp_path):
+    inv = make(conn, tmp_path)
+    inv.sync()
+    row = inv.servers()[0]
+    fleet.state.servers.remove(row.id)
+
+    assert inv.server(row.id) is row  # the snapshot has not seen the delete
+    assert inv.current(row.id) is None
+    assert inv.server(row.id) is None
@@ -0,0 +1,123 @@
+# tests/test_quota.py
+import threading
+
+import pytest
+
+from quota import QuotaExceeded, QuotaGuard
+
+TINY, MEDIUM = "1", "3"  # the simulator's m1.tiny (1 vCPU, 512 MB) and m1.medium (2 vCPUs, 4 GB)
+
+
+@pytest.fixture
+def guard(conn, simulator):
+    simulator.state.default_quota.update(instances=3, cores=4, floatingip=1)
+    return QuotaGuard(conn, ttl=3600)
+
+
+@pytest.fixture
+def project(conn):
+    return conn.current_project_id
+
+
+def create(conn, simulator, flavor_id=TINY):
+    return conn.compute.create_server(name="vm", image_id=next(iter(simulator.state.images)), flavor_id=flavor_id,
+                                      networks=[{"uuid": simulator.state.private["id"]}])
+
+
+def test_launches_in_flight_count_against_the_quota(guard, project):
+    first = guard.reserve(project, MEDIUM)
+    second = guard.reserve(project, TINY)
+
+    with pytest.raises(QuotaExceeded) as e:
+        guard.reserve(project, MEDIUM)  # 2 + 1 cores reserved, 2 more do not fit in 4
+    assert (e.value.resource, e.value.requested, e.value.in_use, e.value.limit) == ("cores", 2, 3, 4)
+
+    first.release()
+    guard.reserve(project, MEDIUM)
+    second.release()
+    assert guard.usage(project)["cores"] == (0, 2, 4)
+
+
+def test_a_failed_launch_gives_the_capacity_back(guard, project):
+    with pytest.raises(RuntimeError):
+        with guard.reserve(project, MEDIUM):
+            raise RuntimeError("create_server failed")
+
+    assert guard.usage(project)["cores"] == (0, 0, 4)
+
+
+def test_commit_counts_as_used_and_release_after_delete_gives_it_back(guard, conn, simulator, project):
+    with guard.reserve(project, MEDIUM) as reservation:
+        server = create(conn, simulator, MEDIUM)
+        reservation.commit()
+    assert guard.usage(project)["cores"] == (2, 0, 4)
+    assert guard.usage(project)["instances"] == (1, 0, 3)
+
+    server = conn.compute.get_server(server.id)
+    conn.compute.delete_server(server)
+    guard.release(project, server.flavor)
+    assert guard.usage(project)["cores"] == (0, 0, 4)
+
+
+def test_refresh_picks_up_servers_made_elsewhere(guard, conn, simulator, project):
+    guard.usage(project)  # loaded while the project is empty
+    create(conn, simulator, MEDIUM)  # not through the guard
+
+    guard.refresh(project)
+
+    assert guard.usage(project)["cores"] == (2, 0, 4)
+    guard.reserve(project, MEDIUM)
+    with pytest.raises(QuotaExceeded):
+        guard.reserve(project, MEDIUM)
+
+
+def test_a_stale_view_is_refreshed_in_the_background(guard, conn, simulator, project):
+    guard.usage(project)
+    create(conn, simulator, MEDIUM)
+    guard.ttl = 0
+    refreshed = threading.Event()
+    refresh = guard.refresh
+
+    def tracked(project_id):
+        refresh(project_id)
+        refreshed.set()
+
+    guard.refresh = tracked
+    assert guard.usage(project)["cores"] == (0, 0, 4)  # served from the old view meanwhile
+    assert refreshed.wait(10)
+    assert guard.usage(project)["cores"][0] == 2
+
+
+def test_own_changes_during_a_refresh_are_kept(guard, conn, simulator, project, monkeypatch):
+    guard.usage(project)
+    fetch = guard._fetch
+
+    def slow_fetch(project_id):
+        result = fetch(project_id)  # Nova's view, without the launch below
+        with guard.reserve(project_id, MEDIUM) as reservation:
+            reservation.commit()
+        return result
+
+    monkeypatch.setattr(guard, "_fetch", slow_fetch)
+    guard.refresh(project)
+
+    assert guard.usage(project)["cores"] == (2, 0, 4)
+
+
+def test_unreadable_quota_admits_the_launch(conn, simulator, project, monkeypatch):
+    guard = QuotaGuard(conn)
+
+    def down(project_id):
+        raise ConnectionError("nova is down")
+
+    monkeypatch.setattr(guard, "_fetch", down)
+    with guard.reserve(project, MEDIUM) as reservation:
+        reservation.commit()
+    assert guard.usage(project) is None
+
+
+def test_floating_ips_are_counted_with_the_launch(guard, project):
+    guard.reserve(project, TINY, floating_ips=1)
+    with pytest.raises(QuotaExceeded) as e:
+        guard.reserve(project, TINY, floating_ips=1)
+    assert e.value.resource == "floating_ips"
@@ -0,0 +1,75 @@
+# tests/test_reaper.py
+import calendar
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from reaper import epoch_seconds, expired
+
+
+def utc(timestamp):
+    return calendar.timegm(datetime.strptime(timestamp[:19], "%Y-%m-%dT%H:%M:%S").timetuple())
+
+
+@pytest.mark.parametrize("timestamp", [
+    "2024-05-01T12:00:00Z",
+    "2024-05-01T12:00:00",
+    "2024-05-01T12:00:00.123456Z",
+    "1970-01-01T00:00:00Z",
+    "2024-02-29T23:59:59Z",
+    "2099-12-31T23:59:59Z",
+])
+def test_valid_timestamps(timestamp):
+    assert epoch_seconds([timestamp]).tolist() == [utc(timestamp)]
+
+
+def test_matches_the_standard_library_on_random_dates():
+    start = datetime(1990, 1, 1, tzinfo=timezone.utc)
+    rng = random.Random(0)
+    stamps = [start + timedelta(seconds=rng.randrange(60 * 365 * 86400)) for _ in range(2000)]
+    assert epoch_seconds([s.strftime("%Y-%m-%dT%H:%M:%SZ") for s in stamps]).tolist() == \
+        [int(s.timestamp()) for s in stamps]
+
+
+@pytest.mark.parametrize("timestamp", [
+    None,
+    "",
+    1714564800,
+    "2024-05-01",
+    "2024-05-01T12:00",
+    "2024-05-01 12:00:00Z",       # space instead of T
+    "2024/05/01T12:00:00Z",
+    "2024-05-01T12-00-00Z",
+    "2024-05-01T12:00:00+02:00",  # not UTC
+    "2024-05-01T12:00:00x",
+    "2024-13-01T12:00:00Z",
+    "2024-00-10T12:00:00Z",
+    "2024-04-31T12:00:00Z",
+    "2023-02-29T12:00:00Z",       # not a leap year
+    "2024-05-00T12:00:00Z",
+    "2024-05-01T24:00:00Z",
+    "2024-05-01T12:60:00Z",
+    "2024-05-01T12:00:60Z",
+    "2O24-05-01T12:00:00Z",       # letter O
+    "２０２４-05-01T12:00:00Z",   # full-width digits
+    "-024-05-01T12:00:00Z",
+])
+def test_malformed_timestamps_are_minus_one(timestamp):
+    assert epoch_seconds([timestamp]).tolist() == [-1]
+
+
+def test_one_bad_value_does_not_spoil_the_batch():
+    result = epoch_seconds(["2024-05-01T12:00:00Z", "garbage", None, "2024-05-01T12:00:01Z"])
+    assert result.tolist() == [utc("2024-05-01T12:00:00"), -1, -1, utc("2024-05-01T12:00:01")]
+
+
+def test_empty_batch():
+    assert epoch_seconds([]).tolist() == []
+
+
+def test_expired_skips_malformed_and_young_instances():
+    now = utc("2024-05-01T12:10:00")
+    created = ["2024-05-01T12:00:00Z", "garbage", "2024-05-01T12:09:30Z", None, "2024-05-01T12:08:59Z"]
+
+    assert expired(created, now, max_age=60).tolist() == [0, 4]
@@ -0,0 +1,204 @@
+# tests/test_stopper.py
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from keystoneauth1 import exceptions as ks_exceptions
+from openstack import exceptions
+
+from reaper import AsyncStopper, Stopper
+
+
+def server(n):
+    return SimpleNamespace(id=f"id-{n}", name=f"vm-{n}")
+
+
+def eventually(check, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class Nova:
+    """``stop`` that fails with each of ``errors`` in turn, then succeeds."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def stop(self, server_id):
+        with self.lock:
+            self.calls.append(server_id)
+            error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+
+    async def stop_async(self, server_id):
+        self.stop(server_id)
+
+
+def http(status):
+    return exceptions.HttpException(http_status=status)
+
+
+def test_instances_in_flight_are_not_stopped_twice():
+    nova = Nova()
+    stopper = Stopper(nova.stop, backoff=0.01)
+
+    assert stopper.submit([server(1), server(2)]) == 2
+    assert stopper.submit([server(1), server(3)]) == 1
+    assert eventually(lambda: len(nova.calls) == 3)
+    assert sorted(nova.calls) == ["id-1", "id-2", "id-3"]
+
+    stopper.settled({"id-1"})  # 2 and 3 are no longer ACTIVE
+    assert stopper.in_flight() == 1
+    assert stopper.submit([server(2)]) == 1
+
+
+def test_a_stop_that_takes_too_long_is_tried_again():
+    stopper = Stopper(Nova().stop, timeout=-1)
+    assert stopper.submit([server(1)]) == 1
+    assert stopper.submit([server(1)]) == 1
+
+
+@pytest.mark.parametrize("error", [http(503), http(429), ks_exceptions.ConnectFailure("reset")])
+def test_transient_failures_are_retried(error):
+    nova = Nova(error, error)
+    stopper = Stopper(nova.stop, retries=3, backoff=0.01)
+
+    stopper.submit([server(1)])
+
+    assert eventually(lambda: len(nova.calls) == 3)
+    time.sleep(0.1)
+    assert len(nova.calls) == 3  # the third one worked
+    assert stopper.in_flight() == 1  # until a tick sees it stopped
+
+
+def test_retries_give_up_and_the_next_tick_tries_again():
+    nova = Nova(*[http(500)] * 10)
+    stopper = Stopper(nova.stop, retries=2, backoff=0.01)
+
+    stopper.submit([server(1)])
+
+    assert eventually(lambda: stopper.in_flight() == 0)
+    assert len(nova.calls) == 3
+    assert stopper.submit([server(1)]) == 1
+
+
+@pytest.mark.parametrize("error, in_flight", [
+    (exceptions.ConflictException(http_status=409), 1),  # already changing state: wait for it
+    (http(409), 1),
+    (exceptions.NotFoundException(http_status=404), 0),  # gone
+    (http(403), 0),  # not retriable: logged, and the next tick tries again
+    (ValueError("bug"), 0),
+])
+def test_failures_that_are_not_retried(error, in_flight):
+    nova = Nova(error)
+    stopper = Stopper(nova.stop, retries=3, backoff=0.01)
+
+    stopper.submit([server(1)])
+
+    assert eventually(lambda: len(nova.calls) == 1)
+    time.sleep(0.1)
+    assert len(nova.calls) == 1
+    assert stopper.in_flight() == in_flight
+
+
+def test_a_retry_is_dropped_once_the_instance_has_settled():
+    nova = Nova(http(503))
+    stopper = Stopper(nova.stop, backoff=0.2)
+
+    stopper.submit([server(1)])
+    assert eventually(lambda: len(nova.calls) == 1)
+    stopper.settled(set())  # stopped by someone else meanwhile
+
+    time.sleep(0.5)
+    assert len(nova.calls) == 1
+
+
+def test_concurrency_is_bounded():
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def stop(server_id):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    stopper = Stopper(stop, concurrency=3)
+    stopper.submit([server(n) for n in range(12)])
+
+    assert eventually(lambda: stopper._pool._work_queue.empty() and running[0] == 0)
+    assert peak[0] == 3
+
+
+def test_async_stopper_retries_and_dedupes():
+    nova = Nova(httpx.ConnectError("reset"), http(502))
+
+    async def main():
+        stopper = AsyncStopper(nova.stop_async, backoff=0.01)
+        assert stopper.submit([server(1)]) == 1
+        assert stopper.submit([server(1)]) == 0
+        await asyncio.gather(*stopper._tasks)
+        return stopper
+
+    stopper = asyncio.run(main())
+    assert nova.calls == ["id-1"] * 3
+    assert stopper.in_flight() == 1
+
+
+@pytest.mark.parametrize("status, in_flight", [(409, 1), (404, 0), (400, 0)])
+def test_async_stopper_status_handling(status, in_flight):
+    class StatusError(Exception):
+        pass
+
+    error = StatusError()
+    error.status = status  # openstack_async's exceptions carry status
+    nova = Nova(error)
+
+    async def main():
+        stopper = AsyncStopper(nova.stop_async, backoff=0.01)
+        stopper.submit([server(1)])
+        await asyncio.gather(*stopper._tasks)
+        return stopper
+
+    assert asyncio.run(main()).in_flight() == in_flight
+    assert len(nova.calls) == 1
+
+
+def test_async_stopper_bounds_concurrency_and_cancels():
+    running, peak = [0], [0]
+    release = None
+
+    async def stop(server_id):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        try:
+            await release.wait()
+        finally:
+            running[0] -= 1
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        stopper = AsyncStopper(stop, concurrency=2)
+        stopper.submit([server(n) for n in range(5)])
+        await asyncio.sleep(0.05)
+        tasks = list(stopper._tasks)
+        stopper.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return stopper
+
+    stopper = asyncio.run(main())
+    assert peak[0] == 2
+    assert running[0] == 0
+    assert not stopper._tasks
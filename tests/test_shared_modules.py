@@ -0,0 +1,32 @@
+# tests/test_shared_modules.py
+#
+# The gmsso v1.2 and keycloak apps are deployed separately, so they carry
+# their own copies of these modules. The copies must not drift apart.
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = ("openstack-flask-gmsso-redis-v1.2", "openstack-flask-redis-keycloak")
+SHARED = (
+    "cache.py",
+    "introspection.py",
+    "leader.py",
+    "log_setup.py",
+    "oauth_tokens.py",
+    "rate_limit.py",
+    "revocation.py",
+    "sso_tokens.py",
+)
+
+
+def _read(app, name):
+    with open(os.path.join(ROOT, app, name), "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name", SHARED)
+def test_copies_are_identical(name):
+    first, *others = APPS
+    for app in others:
+        assert _read(app, name) == _read(first, name), f"{app}/{name} differs from {first}/{name}"